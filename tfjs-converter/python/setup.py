@@ -60,7 +60,10 @@ setuptools.setup(
         'tensorflowjs.write_weights',
         'tensorflowjs.converters',
         'tensorflowjs.converters.common',
+        'tensorflowjs.converters.conversion_cache',
+        'tensorflowjs.converters.conversion_profiler',
         'tensorflowjs.converters.converter',
+        'tensorflowjs.converters.graph_rewrite',
         'tensorflowjs.converters.keras_h5_conversion',
         'tensorflowjs.converters.keras_tfjs_loader',
         'tensorflowjs.converters.tf_saved_model_conversion_v2',
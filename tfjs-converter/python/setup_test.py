@@ -0,0 +1,70 @@
+# Copyright 2019 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+"""Test that setup.py packages all the modules of the converters."""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import ast
+import os
+import re
+import unittest
+
+DIR_NAME = os.path.dirname(os.path.abspath(__file__))
+CONVERTERS_DIR = os.path.join(DIR_NAME, 'tensorflowjs', 'converters')
+
+
+def _get_py_modules():
+  """Gets the `py_modules` passed to `setuptools.setup()` in setup.py."""
+  with open(os.path.join(DIR_NAME, 'setup.py'), 'rt') as f:
+    tree = ast.parse(f.read())
+  for node in ast.walk(tree):
+    if isinstance(node, ast.keyword) and node.arg == 'py_modules':
+      return set(ast.literal_eval(node.value))
+  raise ValueError('setup.py does not pass py_modules to setup().')
+
+
+def _get_build_modules():
+  """Gets the modules of the non-test Python rules in the converters BUILD."""
+  with open(os.path.join(CONVERTERS_DIR, 'BUILD'), 'rt') as f:
+    build = f.read()
+  modules = set()
+  for rule, body in re.findall(r'^(\w+)\((.*?)^\)', build, re.M | re.S):
+    if rule not in ('py_library', 'py_binary') or 'testonly = True' in body:
+      continue
+    for src in re.findall(r'"(\w+)\.py"', body):
+      modules.add('tensorflowjs.converters.' + src)
+  return modules
+
+
+class SetupTest(unittest.TestCase):
+
+  def testPyModulesIncludeAllConvertersInBuild(self):
+    build_modules = _get_build_modules()
+    self.assertIn('tensorflowjs.converters.converter', build_modules)
+    self.assertEqual(set(), build_modules - _get_py_modules())
+
+  def testPyModulesIncludeAllNonTestConverterSources(self):
+    sources = set(
+        'tensorflowjs.converters.' + os.path.splitext(name)[0]
+        for name in os.listdir(CONVERTERS_DIR)
+        if name.endswith('.py') and not name.endswith('_test.py') and
+        name not in ('__init__.py', 'generate_test_model.py'))
+    self.assertEqual(set(), sources - _get_py_modules())
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -17,8 +17,38 @@ from __future__ import absolute_import
 from __future__ import division
 from __future__ import print_function
 
-# pylint: disable=unused-imports,line-too-long
-from tensorflowjs.converters.keras_h5_conversion import save_keras_model
-from tensorflowjs.converters.keras_tfjs_loader import deserialize_keras_model
-from tensorflowjs.converters.keras_tfjs_loader import load_keras_model
-from tensorflowjs.converters.tf_saved_model_conversion_v2 import convert_tf_saved_model
+import importlib
+import sys
+
+# The public functions below are re-exported lazily: their modules import
+# TensorFlow, Keras or h5py, which is slow and not needed by e.g. the
+# converter's `--version` flag or tfjs-to-tfjs conversion.
+_LAZY_EXPORTS = {
+    'save_keras_model': 'tensorflowjs.converters.keras_h5_conversion',
+    'deserialize_keras_model': 'tensorflowjs.converters.keras_tfjs_loader',
+    'load_keras_model': 'tensorflowjs.converters.keras_tfjs_loader',
+    'convert_tf_saved_model':
+        'tensorflowjs.converters.tf_saved_model_conversion_v2',
+}
+
+
+def __getattr__(name):
+  if name not in _LAZY_EXPORTS:
+    raise AttributeError(
+        'module %r has no attribute %r' % (__name__, name))
+  value = getattr(importlib.import_module(_LAZY_EXPORTS[name]), name)
+  globals()[name] = value
+  return value
+
+
+def __dir__():
+  return sorted(list(globals()) + list(_LAZY_EXPORTS))
+
+
+if sys.version_info < (3, 7):
+  # Module-level __getattr__ (PEP 562) is not supported, import eagerly.
+  # pylint: disable=unused-imports,line-too-long
+  from tensorflowjs.converters.keras_h5_conversion import save_keras_model
+  from tensorflowjs.converters.keras_tfjs_loader import deserialize_keras_model
+  from tensorflowjs.converters.keras_tfjs_loader import load_keras_model
+  from tensorflowjs.converters.tf_saved_model_conversion_v2 import convert_tf_saved_model
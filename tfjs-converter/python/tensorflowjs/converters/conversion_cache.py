@@ -0,0 +1,309 @@
+# Copyright 2019 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+"""An on-disk cache of conversion results.
+
+Converting the same model with the same options (e.g., in CI runs across
+branches) gives the same artifacts, so they can be copied from a previous run
+instead. Cache entries are keyed by the SHA-256 hash of the bytes of the input
+model, the converter version and the conversion options, and are evicted in
+least recently used order once the cache grows beyond its maximum size.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+
+from tensorflowjs.converters import common
+
+# Bump to invalidate all cache entries, e.g. if the key or layout changes.
+_CACHE_FORMAT_VERSION = 1
+
+# The name of the file or directory an entry holds the output in.
+_OUTPUT_NAME = 'output'
+
+_READ_CHUNK_SIZE = 1024 * 1024
+
+DEFAULT_MAX_SIZE_BYTES = 1024 * 1024 * 1024 * 5
+
+
+class ConversionCache(object):
+  """An on-disk, size-bounded cache of conversion outputs.
+
+  Example:
+    cache = ConversionCache('/tmp/tfjs_cache')
+    cache.run(saved_model_dir, output_dir, {'quantization_bytes': 2},
+              lambda: tf_saved_model_conversion_v2.convert_tf_saved_model(
+                  saved_model_dir, output_dir,
+                  quantization_dtype=np.uint16))
+  """
+
+  def __init__(self, cache_dir, max_size_bytes=DEFAULT_MAX_SIZE_BYTES,
+               use_hardlinks=False):
+    """Constructor of ConversionCache.
+
+    Args:
+      cache_dir: The directory to keep the cache entries in. It is created if
+        it does not exist.
+      max_size_bytes: The maximum total size of the cached outputs, in bytes.
+        The least recently used entries are evicted beyond it.
+      use_hardlinks: Whether cache hits hard-link the cached files into the
+        output instead of copying them, where the file system allows it. This
+        is faster and saves disk space, but the cached files are then
+        modified by anything that later writes to the output files in place.
+    """
+    if not isinstance(max_size_bytes, int) or max_size_bytes < 0:
+      raise ValueError(
+          'max_size_bytes must be a non-negative integer, but got %s' %
+          max_size_bytes)
+    self._cache_dir = cache_dir
+    self._max_size_bytes = max_size_bytes
+    self._use_hardlinks = use_hardlinks
+    if not os.path.isdir(cache_dir):
+      os.makedirs(cache_dir)
+
+  def get_key(self, input_path, options):
+    """Gets the cache key of a conversion.
+
+    Args:
+      input_path: The path to the input model: a file or a directory (e.g., a
+        SavedModel). For a model JSON file, the weight files listed in its
+        weights manifest are part of the input as well.
+      options: A JSON-serializable dict of the options of the conversion
+        (e.g., the input and output formats and the quantization).
+
+    Returns:
+      The key as a hex string, or `None` if `input_path` is not a local file
+      or directory (e.g., a TF-Hub module URL).
+    """
+    if not os.path.exists(input_path):
+      return None
+    sha256 = hashlib.sha256()
+    sha256.update(json.dumps({
+        'cacheFormatVersion': _CACHE_FORMAT_VERSION,
+        'convertedBy': common.get_converted_by(),
+        'options': options,
+    }, sort_keys=True).encode('utf-8'))
+    for relative_path, path in _get_input_files(input_path):
+      sha256.update(relative_path.encode('utf-8') + b'\0')
+      if not os.path.isfile(path):
+        # Left for the conversion to report.
+        sha256.update(b'missing\0')
+        continue
+      sha256.update(str(os.path.getsize(path)).encode('utf-8') + b'\0')
+      with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(_READ_CHUNK_SIZE), b''):
+          sha256.update(chunk)
+    return sha256.hexdigest()
+
+  def fetch(self, key, output_path):
+    """Copies (or hard-links) the cached output of a conversion, if any.
+
+    Args:
+      key: The cache key of the conversion (see `get_key`).
+      output_path: The path to write the output to, as the conversion would.
+
+    Returns:
+      Whether the cache had an entry for `key`.
+    """
+    entry_dir = os.path.join(self._cache_dir, key)
+    cached_output = os.path.join(entry_dir, _OUTPUT_NAME)
+    if not os.path.exists(cached_output):
+      return False
+    # Mark the entry as recently used.
+    os.utime(entry_dir, None)
+    if os.path.isdir(cached_output):
+      for relative_path, path in _list_files(cached_output):
+        self._link_or_copy(path, os.path.join(output_path, relative_path))
+    else:
+      self._link_or_copy(cached_output, output_path)
+    return True
+
+  def store(self, key, output_path, previous_files=None):
+    """Stores the output of a conversion in the cache.
+
+    Args:
+      key: The cache key of the conversion (see `get_key`).
+      output_path: The file or directory the conversion wrote its output to.
+      previous_files: An optional snapshot of `output_path` taken before the
+        conversion (see `snapshot`). Files it lists with the same size and
+        modification time were not written by the conversion and are not
+        stored.
+    """
+    if not os.path.exists(output_path):
+      return
+    entry_dir = os.path.join(self._cache_dir, key)
+    if os.path.exists(entry_dir):
+      return
+    previous_files = previous_files or dict()
+    # Build the entry in a temporary directory and move it in place at once, so
+    # that concurrent conversions never see an incomplete entry.
+    temp_dir = tempfile.mkdtemp(dir=self._cache_dir, prefix='.tmp-')
+    try:
+      cached_output = os.path.join(temp_dir, _OUTPUT_NAME)
+      num_files = 0
+      if os.path.isdir(output_path):
+        for relative_path, path in _list_files(output_path):
+          if previous_files.get(relative_path) == _get_file_stamp(path):
+            continue
+          target = os.path.join(cached_output, relative_path)
+          if not os.path.isdir(os.path.dirname(target)):
+            os.makedirs(os.path.dirname(target))
+          shutil.copy2(path, target)
+          num_files += 1
+      else:
+        shutil.copy2(output_path, cached_output)
+        num_files += 1
+      if not num_files:
+        # The conversion wrote nothing, e.g. it failed without raising.
+        return
+      try:
+        os.rename(temp_dir, entry_dir)
+      except OSError:
+        # Another process stored the same entry in the meantime.
+        pass
+    finally:
+      if os.path.exists(temp_dir):
+        shutil.rmtree(temp_dir, ignore_errors=True)
+    self.evict()
+
+  def evict(self):
+    """Removes the least recently used entries beyond the maximum size."""
+    entries = []
+    total_size = 0
+    for name in os.listdir(self._cache_dir):
+      entry_dir = os.path.join(self._cache_dir, name)
+      if name.startswith('.') or not os.path.isdir(entry_dir):
+        continue
+      size = sum(os.path.getsize(path) for _, path in _list_files(entry_dir))
+      entries.append((os.path.getmtime(entry_dir), size, entry_dir))
+      total_size += size
+    for _, size, entry_dir in sorted(entries):
+      if total_size <= self._max_size_bytes:
+        break
+      shutil.rmtree(entry_dir, ignore_errors=True)
+      total_size -= size
+
+  def run(self, input_path, output_path, options, convert_fn):
+    """Runs a conversion through the cache.
+
+    Args:
+      input_path: The path to the input model (see `get_key`).
+      output_path: The file or directory the conversion writes its output to.
+      options: A JSON-serializable dict of the options of the conversion.
+      convert_fn: A function without arguments that runs the conversion, on a
+        cache miss.
+
+    Returns:
+      Whether the output was taken from the cache.
+    """
+    key = self.get_key(input_path, options)
+    if key is None:
+      convert_fn()
+      return False
+    if self.fetch(key, output_path):
+      return True
+    previous_files = snapshot(output_path)
+    convert_fn()
+    self.store(key, output_path, previous_files)
+    return False
+
+  def _link_or_copy(self, source, target):
+    if not os.path.isdir(os.path.dirname(os.path.abspath(target))):
+      os.makedirs(os.path.dirname(os.path.abspath(target)))
+    if os.path.exists(target):
+      os.remove(target)
+    if self._use_hardlinks and hasattr(os, 'link'):
+      try:
+        os.link(source, target)
+        return
+      except OSError:
+        # E.g., the cache and the output are on different file systems.
+        pass
+    shutil.copy2(source, target)
+
+
+def snapshot(output_path):
+  """Gets the size and modification time of the files under `output_path`.
+
+  Args:
+    output_path: A file or directory path, which need not exist.
+
+  Returns:
+    A dict mapping the paths of the files in `output_path`, relative to it, to
+    (size, modification time) tuples. Empty if `output_path` is not a
+    directory.
+  """
+  if not os.path.isdir(output_path):
+    return dict()
+  return dict((relative_path, _get_file_stamp(path))
+              for relative_path, path in _list_files(output_path))
+
+
+def _get_file_stamp(path):
+  stat = os.stat(path)
+  return stat.st_size, stat.st_mtime
+
+
+def _list_files(root_dir):
+  """Lists the files under a directory, in a deterministic order.
+
+  Args:
+    root_dir: The directory to list.
+
+  Returns:
+    A sorted list of (relative path, path) tuples, with '/' as the separator of
+    the relative paths.
+  """
+  files = []
+  for dir_path, dir_names, file_names in os.walk(root_dir):
+    dir_names.sort()
+    for file_name in sorted(file_names):
+      path = os.path.join(dir_path, file_name)
+      relative_path = os.path.relpath(path, root_dir).replace(os.sep, '/')
+      files.append((relative_path, path))
+  return files
+
+
+def _get_input_files(input_path):
+  """Lists the files of an input model, in a deterministic order.
+
+  Args:
+    input_path: A file or a directory. For a model JSON file, the weight files
+      listed in its weights manifest are listed as well.
+
+  Returns:
+    A list of (relative path, path) tuples.
+  """
+  if os.path.isdir(input_path):
+    return _list_files(input_path)
+  files = [(os.path.basename(input_path), input_path)]
+  if input_path.endswith('.json'):
+    try:
+      with open(input_path, 'rt') as f:
+        model_json = json.load(f)
+      weights_manifest = model_json.get(common.ARTIFACT_WEIGHTS_MANIFEST_KEY)
+    except (ValueError, AttributeError):
+      weights_manifest = None
+    base_dir = os.path.dirname(input_path)
+    for group in weights_manifest or []:
+      for path in group.get('paths', []):
+        files.append((path, os.path.join(base_dir, path)))
+  return files
@@ -0,0 +1,177 @@
+# Copyright 2019 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+"""Unit tests for the conversion cache."""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from tensorflowjs.converters import conversion_cache
+
+
+class ConversionCacheTest(unittest.TestCase):
+
+  def setUp(self):
+    self._tmp_dir = tempfile.mkdtemp()
+    self._cache_dir = os.path.join(self._tmp_dir, 'cache')
+    self._model_dir = os.path.join(self._tmp_dir, 'saved_model')
+    os.makedirs(os.path.join(self._model_dir, 'variables'))
+    self._write(os.path.join(self._model_dir, 'saved_model.pb'), b'graph')
+    self._write(os.path.join(self._model_dir, 'variables', 'variables.data'),
+                b'weights')
+    self._num_conversions = 0
+    super(ConversionCacheTest, self).setUp()
+
+  def tearDown(self):
+    if os.path.isdir(self._tmp_dir):
+      shutil.rmtree(self._tmp_dir)
+    super(ConversionCacheTest, self).tearDown()
+
+  def _write(self, path, content):
+    with open(path, 'wb') as f:
+      f.write(content)
+
+  def _read(self, path):
+    with open(path, 'rb') as f:
+      return f.read()
+
+  def _convert(self, output_dir, content=b'shard'):
+    def convert_fn():
+      self._num_conversions += 1
+      if not os.path.isdir(output_dir):
+        os.makedirs(output_dir)
+      self._write(os.path.join(output_dir, 'model.json'), b'{}')
+      self._write(os.path.join(output_dir, 'group1-shard1of1.bin'), content)
+    return convert_fn
+
+  def testRunReusesOutputOfIdenticalConversion(self):
+    cache = conversion_cache.ConversionCache(self._cache_dir)
+    output1 = os.path.join(self._tmp_dir, 'output1')
+    output2 = os.path.join(self._tmp_dir, 'output2')
+
+    self.assertFalse(cache.run(self._model_dir, output1, {'q': 2},
+                               self._convert(output1)))
+    self.assertTrue(cache.run(self._model_dir, output2, {'q': 2},
+                              self._convert(output2)))
+
+    self.assertEqual(1, self._num_conversions)
+    self.assertEqual(
+        b'shard', self._read(os.path.join(output2, 'group1-shard1of1.bin')))
+    self.assertEqual(b'{}', self._read(os.path.join(output2, 'model.json')))
+
+  def testKeyDependsOnInputBytesAndOptions(self):
+    cache = conversion_cache.ConversionCache(self._cache_dir)
+    key = cache.get_key(self._model_dir, {'q': 2})
+
+    self.assertEqual(key, cache.get_key(self._model_dir, {'q': 2}))
+    self.assertNotEqual(key, cache.get_key(self._model_dir, {'q': 1}))
+    self._write(os.path.join(self._model_dir, 'variables', 'variables.data'),
+                b'weighty')
+    self.assertNotEqual(key, cache.get_key(self._model_dir, {'q': 2}))
+    self.assertIsNone(
+        cache.get_key('https://tfhub.dev/google/module/1', {'q': 2}))
+
+  def testKeyOfModelJsonDependsOnWeightFiles(self):
+    model_json_path = os.path.join(self._tmp_dir, 'model.json')
+    with open(model_json_path, 'wt') as f:
+      json.dump({'weightsManifest': [{'paths': ['weights.bin']}]}, f)
+    self._write(os.path.join(self._tmp_dir, 'weights.bin'), b'1234')
+    cache = conversion_cache.ConversionCache(self._cache_dir)
+    key = cache.get_key(model_json_path, {})
+
+    self._write(os.path.join(self._tmp_dir, 'weights.bin'), b'5678')
+
+    self.assertNotEqual(key, cache.get_key(model_json_path, {}))
+
+  def testStoreSkipsFilesThatExistedBeforeConversion(self):
+    cache = conversion_cache.ConversionCache(self._cache_dir)
+    output1 = os.path.join(self._tmp_dir, 'output1')
+    os.makedirs(output1)
+    self._write(os.path.join(output1, 'README'), b'unrelated')
+    output2 = os.path.join(self._tmp_dir, 'output2')
+
+    cache.run(self._model_dir, output1, {}, self._convert(output1))
+    cache.run(self._model_dir, output2, {}, self._convert(output2))
+
+    self.assertEqual(['group1-shard1of1.bin', 'model.json'],
+                     sorted(os.listdir(output2)))
+
+  def testEvictsLeastRecentlyUsedEntries(self):
+    # Every entry holds 2 + 4 bytes, so only two entries fit.
+    cache = conversion_cache.ConversionCache(
+        self._cache_dir, max_size_bytes=12)
+    outputs = [os.path.join(self._tmp_dir, 'output%d' % i) for i in range(4)]
+    cache.run(self._model_dir, outputs[0], {'i': 0},
+              self._convert(outputs[0], b'0000'))
+    cache.run(self._model_dir, outputs[1], {'i': 1},
+              self._convert(outputs[1], b'1111'))
+    entry_dir = os.path.join(
+        self._cache_dir, cache.get_key(self._model_dir, {'i': 0}))
+    os.utime(entry_dir, (0, 0))
+    entry_dir = os.path.join(
+        self._cache_dir, cache.get_key(self._model_dir, {'i': 1}))
+    os.utime(entry_dir, (1, 1))
+    # Using the first entry makes the second one the least recently used.
+    self.assertTrue(cache.run(self._model_dir, outputs[2], {'i': 0},
+                              self._convert(outputs[2])))
+
+    cache.run(self._model_dir, outputs[3], {'i': 3},
+              self._convert(outputs[3], b'3333'))
+
+    self.assertEqual(3, self._num_conversions)
+    self.assertFalse(cache.fetch(cache.get_key(self._model_dir, {'i': 1}),
+                                 outputs[1]))
+    self.assertTrue(cache.fetch(cache.get_key(self._model_dir, {'i': 0}),
+                                outputs[0]))
+    self.assertTrue(cache.fetch(cache.get_key(self._model_dir, {'i': 3}),
+                                outputs[3]))
+
+  def testFetchWithHardlinks(self):
+    cache = conversion_cache.ConversionCache(
+        self._cache_dir, use_hardlinks=True)
+    output1 = os.path.join(self._tmp_dir, 'output1')
+    output2 = os.path.join(self._tmp_dir, 'output2')
+    cache.run(self._model_dir, output1, {}, self._convert(output1))
+
+    self.assertTrue(cache.run(self._model_dir, output2, {},
+                              self._convert(output2)))
+
+    self.assertEqual(
+        b'shard', self._read(os.path.join(output2, 'group1-shard1of1.bin')))
+    if hasattr(os, 'link'):
+      self.assertEqual(
+          2, os.stat(os.path.join(output2, 'group1-shard1of1.bin')).st_nlink)
+
+  def testCachesSingleFileOutput(self):
+    cache = conversion_cache.ConversionCache(self._cache_dir)
+    output1 = os.path.join(self._tmp_dir, 'model1.h5')
+    output2 = os.path.join(self._tmp_dir, 'model2.h5')
+
+    cache.run(self._model_dir, output1, {},
+              lambda: self._write(output1, b'h5'))
+    self.assertTrue(cache.run(self._model_dir, output2, {},
+                              lambda: self._write(output2, b'other')))
+
+    self.assertEqual(b'h5', self._read(output2))
+
+
+if __name__ == '__main__':
+  unittest.main()
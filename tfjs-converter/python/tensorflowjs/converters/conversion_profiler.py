@@ -0,0 +1,161 @@
+# Copyright 2019 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+"""Per-stage timing and memory profiling of conversions.
+
+A conversion function that takes a `profiler` argument runs each of its stages
+(e.g., loading, freezing and optimizing the graph) in `profiler.stage(name)`,
+which records the wall time, CPU time and peak resident set size of the
+process for the stage, plus any counts the stage reports (e.g., the number of
+nodes of the graph or the number of bytes written).
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import contextlib
+import json
+import sys
+import time
+
+try:
+  import resource
+except ImportError:
+  # Not available on Windows.
+  resource = None
+
+try:
+  _process_time = time.process_time
+except AttributeError:
+  # Python 2.
+  _process_time = time.clock
+
+
+def get_peak_rss_bytes():
+  """Gets the peak resident set size of the process so far, in bytes.
+
+  Returns:
+    The peak RSS in bytes, or `None` if the platform does not report it.
+  """
+  if resource is None:
+    return None
+  max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+  # ru_maxrss is in bytes on macOS and in kilobytes elsewhere.
+  return max_rss if sys.platform == 'darwin' else max_rss * 1024
+
+
+class ConversionProfiler(object):
+  """Records the cost of the stages of a conversion.
+
+  Example:
+    profiler = ConversionProfiler()
+    tf_saved_model_conversion_v2.convert_tf_saved_model(
+        saved_model_dir, output_dir, profiler=profiler)
+    profiler.write('/tmp/profile.json')
+  """
+
+  def __init__(self, callback=None):
+    """Constructor of ConversionProfiler.
+
+    Args:
+      callback: An optional function, called with the record of each stage
+        (see `stages`) as soon as the stage ends, e.g. to log progress.
+    """
+    self._callback = callback
+    self._stages = []
+
+  @property
+  def stages(self):
+    """The records of the stages that ended so far, in order.
+
+    Each record is a dict with the keys:
+      - 'name': the name of the stage.
+      - 'wallTimeSeconds' and 'cpuTimeSeconds': the time spent in the stage.
+      - 'peakRssBytes': the peak RSS of the process at the end of the stage,
+        or `None` if the platform does not report it.
+      - 'peakRssIncreaseBytes': how much the stage raised the peak RSS, or
+        `None`.
+      - any counts reported by the stage, e.g. 'numNodes' or 'numBytes'.
+    """
+    return list(self._stages)
+
+  @contextlib.contextmanager
+  def stage(self, name):
+    """Profiles a stage of the conversion.
+
+    Args:
+      name: The name of the stage.
+
+    Yields:
+      A dict that the stage can add counts to, e.g. `{'numNodes': 42}`. They
+      are merged into the record of the stage.
+    """
+    counts = dict()
+    peak_rss_start = get_peak_rss_bytes()
+    wall_time_start = time.time()
+    cpu_time_start = _process_time()
+    yield counts
+    cpu_time = _process_time() - cpu_time_start
+    wall_time = time.time() - wall_time_start
+    peak_rss = get_peak_rss_bytes()
+    record = {
+        'name': name,
+        'wallTimeSeconds': wall_time,
+        'cpuTimeSeconds': cpu_time,
+        'peakRssBytes': peak_rss,
+        'peakRssIncreaseBytes': (
+            None if peak_rss is None else peak_rss - peak_rss_start),
+    }
+    record.update(counts)
+    self._stages.append(record)
+    if self._callback is not None:
+      self._callback(record)
+
+  def to_json(self):
+    """Gets the profile as a JSON-serializable dict."""
+    return {
+        'totalWallTimeSeconds': sum(
+            stage['wallTimeSeconds'] for stage in self._stages),
+        'totalCpuTimeSeconds': sum(
+            stage['cpuTimeSeconds'] for stage in self._stages),
+        'peakRssBytes': get_peak_rss_bytes(),
+        'stages': self.stages,
+    }
+
+  def write(self, path):
+    """Writes the profile to a JSON file."""
+    with open(path, 'wt') as f:
+      json.dump(self.to_json(), f, indent=2)
+
+
+@contextlib.contextmanager
+def _no_op_stage():
+  yield dict()
+
+
+def stage(profiler, name):
+  """Profiles a stage with `profiler`, if it is not `None`.
+
+  Args:
+    profiler: A `ConversionProfiler`, or `None` to not profile.
+    name: The name of the stage.
+
+  Returns:
+    A context manager that yields a dict of counts (see
+    `ConversionProfiler.stage`).
+  """
+  if profiler is None:
+    return _no_op_stage()
+  return profiler.stage(name)
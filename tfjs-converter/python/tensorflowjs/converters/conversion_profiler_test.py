@@ -0,0 +1,93 @@
+# Copyright 2019 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+"""Unit tests for the conversion profiler."""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from tensorflowjs.converters import conversion_profiler
+
+
+class ConversionProfilerTest(unittest.TestCase):
+
+  def setUp(self):
+    self._tmp_dir = tempfile.mkdtemp()
+    super(ConversionProfilerTest, self).setUp()
+
+  def tearDown(self):
+    if os.path.isdir(self._tmp_dir):
+      shutil.rmtree(self._tmp_dir)
+    super(ConversionProfilerTest, self).tearDown()
+
+  def testStageRecordsTimesMemoryAndCounts(self):
+    records = []
+    profiler = conversion_profiler.ConversionProfiler(callback=records.append)
+
+    with profiler.stage('load') as counts:
+      counts['numNodes'] = 3
+    with profiler.stage('allocate') as counts:
+      data = bytearray(32 * 1024 * 1024)
+      counts['numBytes'] = len(data)
+
+    stages = profiler.stages
+    self.assertEqual(stages, records)
+    self.assertEqual(['load', 'allocate'], [stage['name'] for stage in stages])
+    self.assertEqual(3, stages[0]['numNodes'])
+    self.assertEqual(32 * 1024 * 1024, stages[1]['numBytes'])
+    for stage in stages:
+      self.assertGreaterEqual(stage['wallTimeSeconds'], 0)
+      self.assertGreaterEqual(stage['cpuTimeSeconds'], 0)
+    if conversion_profiler.get_peak_rss_bytes() is not None:
+      self.assertGreaterEqual(stages[1]['peakRssBytes'], len(data))
+      self.assertGreaterEqual(stages[1]['peakRssIncreaseBytes'], 0)
+
+  def testFailedStageIsNotRecorded(self):
+    profiler = conversion_profiler.ConversionProfiler()
+
+    with self.assertRaises(ValueError):
+      with profiler.stage('freeze'):
+        raise ValueError('Cannot freeze')
+
+    self.assertEqual([], profiler.stages)
+
+  def testWrite(self):
+    profiler = conversion_profiler.ConversionProfiler()
+    with profiler.stage('optimize') as counts:
+      counts['numNodes'] = 7
+    path = os.path.join(self._tmp_dir, 'profile.json')
+
+    profiler.write(path)
+
+    with open(path, 'rt') as f:
+      profile = json.load(f)
+    self.assertEqual(profiler.stages, profile['stages'])
+    self.assertEqual(profile['stages'][0]['wallTimeSeconds'],
+                     profile['totalWallTimeSeconds'])
+    self.assertIn('peakRssBytes', profile)
+
+  def testStageWithoutProfiler(self):
+    with conversion_profiler.stage(None, 'load') as counts:
+      counts['numNodes'] = 1
+
+
+if __name__ == '__main__':
+  unittest.main()
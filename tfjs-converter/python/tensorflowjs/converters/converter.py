@@ -20,27 +20,34 @@ from __future__ import print_function
 
 import argparse
 import json
+import multiprocessing
 import os
 import shutil
 import sys
 import tempfile
+import time
+import traceback
 
-import h5py
 import numpy as np
-import tensorflow as tf
-from tensorflow import keras
 
 from tensorflowjs import quantization
+from tensorflowjs import read_weights
 from tensorflowjs import version
-from tensorflowjs.converters import keras_h5_conversion as conversion
-from tensorflowjs.converters import keras_tfjs_loader
-from tensorflowjs.converters import tf_saved_model_conversion_v2
+from tensorflowjs import write_weights
+from tensorflowjs.converters import common
+from tensorflowjs.converters import conversion_cache
+from tensorflowjs.converters import conversion_profiler
+
+# NOTE: TensorFlow, Keras, h5py and TF-Hub take seconds to import, so they
+# (and the conversion modules that depend on them) are imported only in the
+# functions that need them. This keeps e.g. `--version` and `--help` fast.
 
 
 def dispatch_keras_h5_to_tfjs_layers_model_conversion(
     h5_path, output_dir=None, quantization_dtype=None,
     split_weights_by_layer=False,
-    weight_shard_size_bytes=1024 * 1024 * 4):
+    weight_shard_size_bytes=1024 * 1024 * 4,
+    topological_weight_order=False):
   """Converts a Keras HDF5 saved-model file to TensorFlow.js format.
 
   Auto-detects saved_model versus weights-only and generates the correct
@@ -62,6 +69,10 @@ def dispatch_keras_h5_to_tfjs_layers_model_conversion(
       (Default: `False`).
     weight_shard_size_bytes: Shard size (in bytes) of the weight files.
       The size of each weight file will be <= this value.
+    topological_weight_order: Whether to order the weights by the execution
+      order of their layers (Default: `False`). Not applicable to weights-only
+      HDF5 files, whose weights are already in the order of the layers of the
+      model.
 
   Returns:
     (model_json, groups)
@@ -70,6 +81,9 @@ def dispatch_keras_h5_to_tfjs_layers_model_conversion(
         will be `None`.
       groups: an array of weight_groups as defined in tfjs weights_writer.
   """
+  import h5py
+  from tensorflowjs.converters import keras_h5_conversion as conversion
+
   if not os.path.exists(h5_path):
     raise ValueError('Nonexistent path to HDF5 file: %s' % h5_path)
   if os.path.isdir(h5_path):
@@ -77,14 +91,17 @@ def dispatch_keras_h5_to_tfjs_layers_model_conversion(
         'Expected path to point to an HDF5 file, but it points to a '
         'directory: %s' % h5_path)
 
-  h5_file = h5py.File(h5_path)
+  # The weight values are memory-mapped from the HDF5 file where possible, so
+  # they are streamed from disk into the weight shards.
+  h5_file = h5py.File(h5_path, 'r')
   if 'layer_names' in h5_file.attrs:
     model_json = None
     groups = conversion.h5_weights_to_tfjs_format(
-        h5_file, split_by_layer=split_weights_by_layer)
+        h5_file, split_by_layer=split_weights_by_layer, use_mmap=True)
   else:
     model_json, groups = conversion.h5_merged_saved_model_to_tfjs_format(
-        h5_file, split_by_layer=split_weights_by_layer)
+        h5_file, split_by_layer=split_weights_by_layer,
+        topological_order=topological_weight_order, use_mmap=True)
 
   if output_dir:
     if os.path.isfile(output_dir):
@@ -103,7 +120,13 @@ def dispatch_keras_h5_to_tfjs_graph_model_conversion(
     h5_path, output_dir=None,
     quantization_dtype=None,
     skip_op_check=False,
-    strip_debug_ops=False):
+    strip_debug_ops=False,
+    topological_weight_order=False,
+    profiler=None,
+    grappler_optimizers=None,
+    target_device='webgl',
+    optimizer_report_path=None,
+    fold_batch_norms=True):
   """
   Convert a keras HDF5-format model to tfjs GraphModel artifacts.
 
@@ -116,7 +139,20 @@ def dispatch_keras_h5_to_tfjs_graph_model_conversion(
       (Default: `None`).
     skip_op_check: Bool whether to skip the op check.
     strip_debug_ops: Bool whether to allow unsupported debug ops.
+    topological_weight_order: Bool whether to order the weights by the
+      execution order of the nodes that use them.
+    profiler: An optional `conversion_profiler.ConversionProfiler` to record
+      the cost of the stages of the conversion in.
+    grappler_optimizers: An optional list of the Grappler passes to run, in
+      order.
+    target_device: The device profile Grappler optimizes for.
+    optimizer_report_path: An optional path of a JSON file to write the node
+      count and estimated cost of the graph after each Grappler pass to.
+    fold_batch_norms: Bool whether to fold the batch normalizations that
+      Grappler leaves into the weights.
   """
+  from tensorflow import keras
+  from tensorflowjs.converters import tf_saved_model_conversion_v2
 
   if not os.path.exists(h5_path):
     raise ValueError('Nonexistent path to HDF5 file: %s' % h5_path)
@@ -126,9 +162,10 @@ def dispatch_keras_h5_to_tfjs_graph_model_conversion(
         'directory: %s' % h5_path)
 
   temp_savedmodel_dir = tempfile.mktemp(suffix='.savedmodel')
-  model = keras.models.load_model(h5_path)
-  keras.experimental.export_saved_model(
-      model, temp_savedmodel_dir, serving_only=True)
+  with conversion_profiler.stage(profiler, 'export_saved_model'):
+    model = keras.models.load_model(h5_path)
+    keras.experimental.export_saved_model(
+        model, temp_savedmodel_dir, serving_only=True)
 
   # NOTE(cais): This cannot use `tf.compat.v1` because
   #   `convert_tf_saved_model()` works only in v2.
@@ -138,7 +175,13 @@ def dispatch_keras_h5_to_tfjs_graph_model_conversion(
       saved_model_tags='serve',
       quantization_dtype=quantization_dtype,
       skip_op_check=skip_op_check,
-      strip_debug_ops=strip_debug_ops)
+      strip_debug_ops=strip_debug_ops,
+      topological_order=topological_weight_order,
+      profiler=profiler,
+      grappler_optimizers=grappler_optimizers,
+      target_device=target_device,
+      optimizer_report_path=optimizer_report_path,
+      fold_batch_norms=fold_batch_norms)
 
   # Clean up the temporary SavedModel directory.
   shutil.rmtree(temp_savedmodel_dir)
@@ -146,7 +189,7 @@ def dispatch_keras_h5_to_tfjs_graph_model_conversion(
 
 def dispatch_keras_saved_model_to_tensorflowjs_conversion(
     keras_saved_model_path, output_dir, quantization_dtype=None,
-    split_weights_by_layer=False):
+    split_weights_by_layer=False, topological_weight_order=False):
   """Converts keras model saved in the SavedModel format to tfjs format.
 
   Note that the SavedModel format exists in keras, but not in
@@ -166,7 +209,12 @@ def dispatch_keras_saved_model_to_tensorflowjs_conversion(
     split_weights_by_layer: Whether to split the weights into separate weight
       groups (corresponding to separate binary weight files) layer by layer
       (Default: `False`).
+    topological_weight_order: Whether to order the weights by the execution
+      order of their layers (Default: `False`).
   """
+  import tensorflow as tf
+  from tensorflow import keras
+
   with tf.Graph().as_default(), tf.compat.v1.Session():
     model = keras.experimental.load_from_saved_model(keras_saved_model_path)
 
@@ -179,7 +227,8 @@ def dispatch_keras_saved_model_to_tensorflowjs_conversion(
         temp_h5_path,
         output_dir,
         quantization_dtype=quantization_dtype,
-        split_weights_by_layer=split_weights_by_layer)
+        split_weights_by_layer=split_weights_by_layer,
+        topological_weight_order=topological_weight_order)
 
     # Delete temporary .h5 file.
     os.remove(temp_h5_path)
@@ -197,6 +246,9 @@ def dispatch_tensorflowjs_to_keras_h5_conversion(config_json_path, h5_path):
     ValueError, if `config_json_path` is not a path to a valid JSON
       file, or if h5_path points to an existing directory.
   """
+  import tensorflow as tf
+  from tensorflowjs.converters import keras_tfjs_loader
+
   if os.path.isdir(config_json_path):
     raise ValueError(
         'For input_type=tfjs_layers_model & output_format=keras, '
@@ -236,6 +288,10 @@ def dispatch_tensorflowjs_to_keras_saved_model_conversion(
     ValueError, if `config_json_path` is not a path to a valid JSON
       file, or if h5_path points to an existing directory.
   """
+  import tensorflow as tf
+  from tensorflow import keras
+  from tensorflowjs.converters import keras_tfjs_loader
+
   if os.path.isdir(config_json_path):
     raise ValueError(
         'For input_type=tfjs_layers_model & output_format=keras_saved_model, '
@@ -263,7 +319,11 @@ def dispatch_tensorflowjs_to_tensorflowjs_conversion(
     output_dir_path,
     quantization_dtype=None,
     weight_shard_size_bytes=1024 * 1024 * 4):
-  """Converts a Keras Model from tensorflowjs format to H5.
+  """Re-shards and/or re-quantizes a TensorFlow.js Layers Model.
+
+  The weights are read with `read_weights` and written back with
+  `write_weights`; the model topology is copied verbatim. Neither Keras nor
+  TensorFlow is needed for this conversion.
 
   Args:
     config_json_path: Path to the JSON file that includes the model's
@@ -286,34 +346,41 @@ def dispatch_tensorflowjs_to_tensorflowjs_conversion(
         'For input_type=tfjs_layers_model, '
         'the input path should be a model.json '
         'file, but received a directory.')
-  # TODO(cais): Assert output_dir_path doesn't exist or is the path to
-  # a directory (not a file).
 
   # Verify that config_json_path points to a JSON file.
   with open(config_json_path, 'rt') as f:
     try:
-      json.load(f)
+      model_json = json.load(f)
     except (ValueError, IOError):
       raise ValueError(
           'For input_type=tfjs_layers_model, '
           'the input path is expected to contain valid JSON content, '
           'but cannot read valid JSON content from %s.' % config_json_path)
 
-  temp_h5_path = tempfile.mktemp(suffix='.h5')
-  with tf.Graph().as_default(), tf.compat.v1.Session():
-    model = keras_tfjs_loader.load_keras_model(config_json_path)
-    model.save(temp_h5_path)
-    dispatch_tensorflowjs_to_keras_h5_conversion(config_json_path, temp_h5_path)
-
-  with tf.Graph().as_default(), tf.compat.v1.Session():
-    dispatch_keras_h5_to_tfjs_layers_model_conversion(
-        temp_h5_path, output_dir_path,
-        quantization_dtype=quantization_dtype,
-        weight_shard_size_bytes=weight_shard_size_bytes)
-    # TODO(cais): Support weight quantization.
+  if os.path.isfile(output_dir_path):
+    raise ValueError(
+        'Output path "%s" already exists as a file' % output_dir_path)
+  elif not os.path.isdir(output_dir_path):
+    os.makedirs(output_dir_path)
+
+  input_dir_path = os.path.dirname(os.path.realpath(config_json_path))
+  # The input shards must not be memory-mapped if they are about to be
+  # overwritten in place.
+  in_place = input_dir_path == os.path.realpath(output_dir_path)
+  weight_groups = read_weights.read_weights(
+      model_json[common.ARTIFACT_WEIGHTS_MANIFEST_KEY], input_dir_path,
+      use_mmap=not in_place)
+  weights_manifest = write_weights.write_weights(
+      weight_groups, output_dir_path, write_manifest=False,
+      quantization_dtype=quantization_dtype,
+      shard_size_bytes=weight_shard_size_bytes)
 
-  # Clean up the temporary H5 file.
-  os.remove(temp_h5_path)
+  model_json[common.CONVERTED_BY_KEY] = common.get_converted_by()
+  model_json[common.ARTIFACT_WEIGHTS_MANIFEST_KEY] = weights_manifest
+  model_json_path = os.path.join(
+      output_dir_path, common.ARTIFACT_MODEL_JSON_FILE_NAME)
+  with open(model_json_path, 'wt') as f:
+    json.dump(model_json, f)
 
 
 def dispatch_tfjs_layers_model_to_tfjs_graph_conversion(
@@ -321,7 +388,13 @@ def dispatch_tfjs_layers_model_to_tfjs_graph_conversion(
     output_dir_path,
     quantization_dtype=None,
     skip_op_check=False,
-    strip_debug_ops=False):
+    strip_debug_ops=False,
+    topological_weight_order=False,
+    profiler=None,
+    grappler_optimizers=None,
+    target_device='webgl',
+    optimizer_report_path=None,
+    fold_batch_norms=True):
   """Converts a TensorFlow.js Layers Model to TensorFlow.js Graph Model.
 
   This conversion often benefits speed of inference, due to the graph
@@ -336,6 +409,17 @@ def dispatch_tfjs_layers_model_to_tfjs_graph_conversion(
       (Default: `None`).
     skip_op_check: Bool whether to skip the op check.
     strip_debug_ops: Bool whether to allow unsupported debug ops.
+    topological_weight_order: Bool whether to order the weights by the
+      execution order of the nodes that use them.
+    profiler: An optional `conversion_profiler.ConversionProfiler` to record
+      the cost of the stages of the conversion in.
+    grappler_optimizers: An optional list of the Grappler passes to run, in
+      order.
+    target_device: The device profile Grappler optimizes for.
+    optimizer_report_path: An optional path of a JSON file to write the node
+      count and estimated cost of the graph after each Grappler pass to.
+    fold_batch_norms: Bool whether to fold the batch normalizations that
+      Grappler leaves into the weights.
 
   Raises:
     ValueError, if `config_json_path` is not a path to a valid JSON
@@ -343,6 +427,8 @@ def dispatch_tfjs_layers_model_to_tfjs_graph_conversion(
     ValueError, if `output_dir_path` exists and is a file (instead of
       a directory).
   """
+  from tensorflowjs.converters import keras_tfjs_loader
+
   if os.path.isdir(config_json_path):
     raise ValueError(
         'For input_type=tfjs_layers_model, '
@@ -363,13 +449,20 @@ def dispatch_tfjs_layers_model_to_tfjs_graph_conversion(
 
   temp_h5_path = tempfile.mktemp(suffix='.h5')
 
-  model = keras_tfjs_loader.load_keras_model(config_json_path)
-  model.save(temp_h5_path)
+  with conversion_profiler.stage(profiler, 'load_layers_model'):
+    model = keras_tfjs_loader.load_keras_model(config_json_path)
+    model.save(temp_h5_path)
   dispatch_keras_h5_to_tfjs_graph_model_conversion(
       temp_h5_path, output_dir_path,
       quantization_dtype=quantization_dtype,
       skip_op_check=skip_op_check,
-      strip_debug_ops=strip_debug_ops)
+      strip_debug_ops=strip_debug_ops,
+      topological_weight_order=topological_weight_order,
+      profiler=profiler,
+      grappler_optimizers=grappler_optimizers,
+      target_device=target_device,
+      optimizer_report_path=optimizer_report_path,
+      fold_batch_norms=fold_batch_norms)
 
   # Clean up temporary HDF5 file.
   os.remove(temp_h5_path)
@@ -435,6 +528,32 @@ def _parse_quantization_bytes(quantization_bytes):
     raise ValueError('Unsupported quantization bytes: %s' % quantization_bytes)
 
 
+def _get_package_version(*package_names):
+  """Gets the installed version of a package without importing it.
+
+  Args:
+    *package_names: Alternative distribution names of the package, e.g.,
+      'tensorflow' and 'tensorflow-gpu'. The first one installed is used.
+
+  Returns:
+    The version string, or 'not installed'.
+  """
+  try:
+    from importlib import metadata
+    get_version = metadata.version
+    not_found_error = metadata.PackageNotFoundError
+  except ImportError:  # Python < 3.8.
+    import pkg_resources
+    get_version = lambda name: pkg_resources.get_distribution(name).version
+    not_found_error = pkg_resources.DistributionNotFound
+  for package_name in package_names:
+    try:
+      return get_version(package_name)
+    except not_found_error:
+      pass
+  return 'not installed'
+
+
 def get_arg_parser():
   """Create the argument parser for the converter binary."""
   parser = argparse.ArgumentParser('TensorFlow.js model converters.')
@@ -497,12 +616,113 @@ def get_arg_parser():
       help='How many bytes to optionally quantize/compress the weights to. 1- '
       'and 2-byte quantizaton is supported. The default (unquantized) size is '
       '4 bytes.')
+  parser.add_argument(
+      '--quantize_float16',
+      action='store_true',
+      help='Store float weights as 2-byte IEEE half-precision floats instead '
+      'of 4-byte floats. Unlike --quantization_bytes=2, this keeps the '
+      'dynamic range of the weights. Cannot be combined with '
+      '--quantization_bytes. Note: loading the converted model needs a '
+      'TensorFlow.js runtime that can decode float16 weights; the '
+      'tfjs-core 1.2.x runtime only decodes uint8 and uint16 weights.')
   parser.add_argument(
       '--split_weights_by_layer',
       action='store_true',
       help='Applicable to keras input_format only: Whether the weights from '
       'different layers are to be stored in separate weight groups, '
       'corresponding to separate binary weight files. Default: False.')
+  parser.add_argument(
+      '--topological_weight_order',
+      action='store_true',
+      help='Order the weights (and the weight groups of '
+      '--split_weights_by_layer) by the execution order of the layers or '
+      'nodes that use them, so that the first shards hold the weights needed '
+      'first. Not applicable to input_format tf_hub or to tfjs_layers_model '
+      'to tfjs_layers_model conversion. Default: False.')
+  parser.add_argument(
+      '--batch_manifest',
+      type=str,
+      default=None,
+      help='Path to a JSON (or, if PyYAML is installed, YAML) file listing '
+      'conversion jobs, to run them all in one invocation instead of '
+      'converting input_path. Each job is a dictionary whose keys are the '
+      'names of the flags of this command without the leading dashes, '
+      'including "input_path" and "output_path", e.g. '
+      '[{"input_path": "model.h5", "output_path": "web_model", '
+      '"input_format": "keras", "quantization_bytes": 2}].')
+  parser.add_argument(
+      '--batch_workers',
+      type=int,
+      default=1,
+      help='Applicable to --batch_manifest only: the number of worker '
+      'processes the jobs are run in. Each worker imports TensorFlow once and '
+      'runs many jobs. Default: 1, i.e., the jobs are run one at a time in '
+      'this process.')
+  parser.add_argument(
+      '--batch_report',
+      type=str,
+      default=None,
+      help='Applicable to --batch_manifest only: path of a JSON file to write '
+      'the status, duration and error (if any) of every job to.')
+  parser.add_argument(
+      '--cache_dir',
+      type=str,
+      default=None,
+      help='Directory of a conversion cache. If set, the output of a '
+      'conversion is copied from the cache if the same input model (by the '
+      'hash of its bytes) was converted with the same flags and converter '
+      'version before, and stored in the cache otherwise.')
+  parser.add_argument(
+      '--cache_size_bytes',
+      type=int,
+      default=conversion_cache.DEFAULT_MAX_SIZE_BYTES,
+      help='Applicable to --cache_dir only: the maximum size of the cached '
+      'outputs, in bytes. The least recently used ones are evicted beyond it. '
+      'Default: 5 GiB.')
+  parser.add_argument(
+      '--profile_json',
+      type=str,
+      default=None,
+      help='Applicable to output_format tfjs_graph_model only (except for '
+      'input_format tf_hub): path of a JSON file to write the wall time, CPU '
+      'time, peak resident memory, node count and size of every stage of the '
+      'conversion to (e.g., load, freeze, validate, optimize, '
+      'fold_batch_norms, extract_weights and write_artifacts). Not written if '
+      'the output is copied from --cache_dir.')
+  parser.add_argument(
+      '--grappler_optimizers',
+      type=str,
+      default=None,
+      help='Applicable to output_format tfjs_graph_model only (except for '
+      'input_format tf_hub): comma-separated list of the Grappler passes to '
+      'optimize the graph with, in order, e.g. '
+      '"pruning,constfold,arithmetic,dependency". Default: '
+      '"pruning,constfold,arithmetic,dependency,pruning,remap,constfold,'
+      'arithmetic,dependency".')
+  parser.add_argument(
+      '--target_device',
+      type=str,
+      choices=['webgl', 'cpu'],
+      default='webgl',
+      help='Applicable to output_format tfjs_graph_model only (except for '
+      'input_format tf_hub): the device profile Grappler optimizes the graph '
+      'for. "webgl" for a GPU and "cpu" for the CPU and WASM backends. '
+      'Default: webgl.')
+  parser.add_argument(
+      '--optimizer_report',
+      type=str,
+      default=None,
+      help='Applicable to output_format tfjs_graph_model only (except for '
+      'input_format tf_hub): path of a JSON file to write the node count and '
+      'estimated cost (on --target_device) of the graph before and after '
+      'each Grappler pass to.')
+  parser.add_argument(
+      '--skip_batch_norm_folding',
+      action='store_true',
+      help='Applicable to output_format tfjs_graph_model only (except for '
+      'input_format tf_hub): do not fold the batch normalizations left after '
+      'the Grappler passes into the weights of the preceding convolutions and '
+      'matrix multiplications.')
   parser.add_argument(
       '--version',
       '-v',
@@ -543,10 +763,66 @@ def main(argv):
   if args.show_version:
     print('\ntensorflowjs %s\n' % version.version)
     print('Dependency versions:')
-    print('  keras %s' % keras.__version__)
-    print('  tensorflow %s' % tf.__version__)
+    # This is the standalone keras package, not necessarily the tf.keras
+    # bundled with tensorflow; getting the latter needs importing tensorflow.
+    print('  keras (standalone package) %s' % _get_package_version('keras'))
+    print('  tensorflow %s' % _get_package_version(
+        'tensorflow', 'tensorflow-cpu', 'tensorflow-gpu'))
+    return
+
+  if args.batch_manifest:
+    if args.input_path or args.output_path:
+      raise ValueError(
+          'The input_path and output_path arguments cannot be used with '
+          '--batch_manifest. Set them in the jobs of the manifest instead.')
+    jobs = _load_batch_manifest(args.batch_manifest)
+    if args.cache_dir:
+      for job in jobs:
+        if isinstance(job, dict):
+          job.setdefault('cache_dir', args.cache_dir)
+          job.setdefault('cache_size_bytes', args.cache_size_bytes)
+    results = convert_batch(jobs, max_workers=args.batch_workers)
+    _print_batch_summary(results)
+    if args.batch_report:
+      with open(args.batch_report, 'wt') as f:
+        json.dump(results, f, indent=2)
+    num_failed = sum(result['status'] != 'ok' for result in results)
+    if num_failed:
+      raise RuntimeError(
+          '%d of %d conversion jobs failed.' % (num_failed, len(results)))
     return
 
+  _convert(args)
+
+
+# Flags that do not affect the output of a conversion.
+_NON_CONVERSION_FLAGS = frozenset([
+    'input_path', 'output_path', 'show_version', 'batch_manifest',
+    'batch_workers', 'batch_report', 'cache_dir', 'cache_size_bytes',
+    'profile_json', 'optimizer_report'])
+
+
+def _convert(args):
+  """Runs the conversion described by the parsed command-line arguments.
+
+  If `args.cache_dir` is set, the output is taken from the conversion cache in
+  it if the same input was converted with the same options before.
+  """
+  if not (args.cache_dir and args.input_path and args.output_path):
+    _dispatch_conversion(args)
+    return
+  cache = conversion_cache.ConversionCache(
+      args.cache_dir, max_size_bytes=args.cache_size_bytes)
+  options = dict((key, value) for key, value in vars(args).items()
+                 if key not in _NON_CONVERSION_FLAGS)
+  if cache.run(args.input_path, args.output_path, options,
+               lambda: _dispatch_conversion(args)):
+    print('Copied the cached output of an identical conversion to %s.' %
+          args.output_path)
+
+
+def _dispatch_conversion(args):
+  """Validates the arguments and runs the matching conversion function."""
   if not args.input_path:
     raise ValueError(
         'Missing input_path argument. For usage, use the --help flag.')
@@ -570,9 +846,14 @@ def main(argv):
   input_format, output_format = _standardize_input_output_formats(
       args.input_format, args.output_format)
 
-  quantization_dtype = (
-      quantization.QUANTIZATION_BYTES_TO_DTYPES[args.quantization_bytes]
-      if args.quantization_bytes else None)
+  if args.quantize_float16 and args.quantization_bytes:
+    raise ValueError(
+        'The --quantize_float16 and --quantization_bytes flags are mutually '
+        'exclusive.')
+  if args.quantize_float16:
+    quantization_dtype = np.float16
+  else:
+    quantization_dtype = _parse_quantization_bytes(args.quantization_bytes)
 
   if (args.signature_name and input_format not in
       ('tf_saved_model', 'tf_hub')):
@@ -581,36 +862,82 @@ def main(argv):
         '"tf_hub" input format, but the current input format is '
         '"%s".' % input_format)
 
+  if args.topological_weight_order and (
+      input_format == 'tf_hub' or
+      (input_format == 'tfjs_layers_model' and
+       output_format == 'tfjs_layers_model')):
+    raise ValueError(
+        'The --topological_weight_order flag is not applicable to the '
+        'input_format - output_format pair: %s - %s' %
+        (input_format, output_format))
+
+  graph_model_flags = [
+      flag for flag, is_set in [
+          ('--profile_json', args.profile_json),
+          ('--grappler_optimizers', args.grappler_optimizers),
+          ('--target_device', args.target_device != 'webgl'),
+          ('--optimizer_report', args.optimizer_report),
+          ('--skip_batch_norm_folding', args.skip_batch_norm_folding)]
+      if is_set]
+  if graph_model_flags and (
+      output_format != 'tfjs_graph_model' or input_format == 'tf_hub'):
+    raise ValueError(
+        'The %s flag is not applicable to the '
+        'input_format - output_format pair: %s - %s' %
+        (graph_model_flags[0], input_format, output_format))
+  profiler = None
+  if args.profile_json:
+    profiler = conversion_profiler.ConversionProfiler()
+  grappler_optimizers = None
+  if args.grappler_optimizers:
+    grappler_optimizers = args.grappler_optimizers.split(',')
+
   # TODO(cais, piyu): More conversion logics can be added as additional
   #   branches below.
   if input_format == 'keras' and output_format == 'tfjs_layers_model':
     dispatch_keras_h5_to_tfjs_layers_model_conversion(
         args.input_path, output_dir=args.output_path,
         quantization_dtype=quantization_dtype,
-        split_weights_by_layer=args.split_weights_by_layer)
+        split_weights_by_layer=args.split_weights_by_layer,
+        topological_weight_order=args.topological_weight_order)
   elif input_format == 'keras' and output_format == 'tfjs_graph_model':
     dispatch_keras_h5_to_tfjs_graph_model_conversion(
         args.input_path, output_dir=args.output_path,
         quantization_dtype=quantization_dtype,
         skip_op_check=args.skip_op_check,
-        strip_debug_ops=args.strip_debug_ops)
+        strip_debug_ops=args.strip_debug_ops,
+        topological_weight_order=args.topological_weight_order,
+        profiler=profiler,
+        grappler_optimizers=grappler_optimizers,
+        target_device=args.target_device,
+        optimizer_report_path=args.optimizer_report,
+        fold_batch_norms=not args.skip_batch_norm_folding)
   elif (input_format == 'keras_saved_model' and
         output_format == 'tfjs_layers_model'):
     dispatch_keras_saved_model_to_tensorflowjs_conversion(
         args.input_path, args.output_path,
         quantization_dtype=quantization_dtype,
-        split_weights_by_layer=args.split_weights_by_layer)
+        split_weights_by_layer=args.split_weights_by_layer,
+        topological_weight_order=args.topological_weight_order)
   elif (input_format == 'tf_saved_model' and
         output_format == 'tfjs_graph_model'):
+    from tensorflowjs.converters import tf_saved_model_conversion_v2
     tf_saved_model_conversion_v2.convert_tf_saved_model(
         args.input_path, args.output_path,
         signature_def=args.signature_name,
         saved_model_tags=args.saved_model_tags,
         quantization_dtype=quantization_dtype,
         skip_op_check=args.skip_op_check,
-        strip_debug_ops=args.strip_debug_ops)
+        strip_debug_ops=args.strip_debug_ops,
+        topological_order=args.topological_weight_order,
+        profiler=profiler,
+        grappler_optimizers=grappler_optimizers,
+        target_device=args.target_device,
+        optimizer_report_path=args.optimizer_report,
+        fold_batch_norms=not args.skip_batch_norm_folding)
   elif (input_format == 'tf_hub' and
         output_format == 'tfjs_graph_model'):
+    from tensorflowjs.converters import tf_saved_model_conversion_v2
     tf_saved_model_conversion_v2.convert_tf_hub_module(
         args.input_path, args.output_path, args.signature_name,
         args.saved_model_tags, skip_op_check=args.skip_op_check,
@@ -627,20 +954,174 @@ def main(argv):
         output_format == 'tfjs_layers_model'):
     dispatch_tensorflowjs_to_tensorflowjs_conversion(
         args.input_path, args.output_path,
-        quantization_dtype=_parse_quantization_bytes(args.quantization_bytes),
+        quantization_dtype=quantization_dtype,
         weight_shard_size_bytes=weight_shard_size_bytes)
   elif (input_format == 'tfjs_layers_model' and
         output_format == 'tfjs_graph_model'):
     dispatch_tfjs_layers_model_to_tfjs_graph_conversion(
         args.input_path, args.output_path,
-        quantization_dtype=_parse_quantization_bytes(args.quantization_bytes),
+        quantization_dtype=quantization_dtype,
         skip_op_check=args.skip_op_check,
-        strip_debug_ops=args.strip_debug_ops)
+        strip_debug_ops=args.strip_debug_ops,
+        topological_weight_order=args.topological_weight_order,
+        profiler=profiler,
+        grappler_optimizers=grappler_optimizers,
+        target_device=args.target_device,
+        optimizer_report_path=args.optimizer_report,
+        fold_batch_norms=not args.skip_batch_norm_folding)
   else:
     raise ValueError(
         'Unsupported input_format - output_format pair: %s - %s' %
         (input_format, output_format))
 
+  if profiler is not None:
+    profiler.write(args.profile_json)
+
+
+def _load_batch_manifest(manifest_path):
+  """Loads the list of conversion jobs of a batch manifest file."""
+  with open(manifest_path, 'rt') as f:
+    if os.path.splitext(manifest_path)[1].lower() in ('.yaml', '.yml'):
+      try:
+        import yaml
+      except ImportError:
+        raise ImportError(
+            'The PyYAML package is required for YAML batch manifests. '
+            'Install it with `pip install pyyaml`, or use a JSON manifest.')
+      jobs = yaml.safe_load(f)
+    else:
+      jobs = json.load(f)
+  if not isinstance(jobs, list):
+    raise ValueError(
+        'Expected the batch manifest %s to hold a list of jobs, but got %s' %
+        (manifest_path, type(jobs).__name__))
+  return jobs
+
+
+def _get_job_args(job):
+  """Gets the parsed command-line arguments of a batch conversion job.
+
+  The values of `job` go through the parser of the converter, so they are
+  converted and checked the same way as the values of the flags are.
+
+  Args:
+    job: A dict mapping names of flags of the converter (without the leading
+      dashes) to their values.
+
+  Returns:
+    An `argparse.Namespace` with the defaults of the converter flags, updated
+    with the values of `job`.
+
+  Raises:
+    ValueError: If `job` is not a dict, sets an unknown or batch-only flag or
+      an invalid value, or lacks an input or output path.
+  """
+  if not isinstance(job, dict):
+    raise ValueError('Expected a batch job to be a dict, but got %r' % job)
+  parser = get_arg_parser()
+  defaults = parser.parse_args([])
+  argv = []
+  bool_values = dict()
+  for key, value in sorted(job.items()):
+    if (not hasattr(defaults, key) or key.startswith('batch_') or
+        key == 'show_version'):
+      raise ValueError('Unsupported key %r in batch job %r' % (key, job))
+    if value is None or key in ('input_path', 'output_path'):
+      continue
+    if isinstance(value, bool) and isinstance(getattr(defaults, key), bool):
+      # Boolean flags (e.g., --quantize_float16) take no value on the command
+      # line, and the bool type of --strip_debug_ops parses any string as True.
+      bool_values[key] = value
+    else:
+      argv.append('--%s=%s' % (key, value))
+  # The input and output paths are positional, and may start with a dash.
+  argv += ['--'] + [str(job[key]) for key in ('input_path', 'output_path')
+                    if job.get(key) is not None]
+
+  def raise_value_error(message):
+    raise ValueError('Invalid batch job %r: %s' % (job, message))
+  parser.error = raise_value_error
+  args = parser.parse_args(argv)
+  for key, value in bool_values.items():
+    setattr(args, key, value)
+  if not args.input_path or not args.output_path:
+    raise ValueError(
+        'Batch job %r must set both input_path and output_path.' % job)
+  return args
+
+
+def _run_batch_job(job):
+  """Runs one batch conversion job, catching and reporting its errors."""
+  result = {
+      'input_path': job.get('input_path') if isinstance(job, dict) else None,
+      'output_path': job.get('output_path') if isinstance(job, dict) else None,
+  }
+  start_time = time.time()
+  try:
+    _convert(_get_job_args(job))
+    result['status'] = 'ok'
+  except Exception as e:  # pylint: disable=broad-except
+    result['status'] = 'failed'
+    result['error'] = '%s: %s' % (type(e).__name__, e)
+    result['traceback'] = traceback.format_exc()
+  result['seconds'] = round(time.time() - start_time, 3)
+  return result
+
+
+def convert_batch(jobs, max_workers=1):
+  """Runs many conversion jobs in one process or a pool of processes.
+
+  This saves importing TensorFlow and the other dependencies once per model.
+  An error in a job is reported in its result and does not stop the other
+  jobs.
+
+  Args:
+    jobs: A list of dicts, each mapping names of the flags of the converter
+      (without the leading dashes, e.g., 'input_path', 'output_path',
+      'input_format' or 'quantization_bytes') to their values.
+    max_workers: The number of worker processes to run the jobs in. Each
+      worker runs many jobs. If 1, the jobs are run one at a time in this
+      process. Default: 1.
+
+  Returns:
+    A list with a result dict for every job, in the order of `jobs`, with the
+    'input_path' and 'output_path' of the job, its 'status' ('ok' or
+    'failed'), its duration in 'seconds' and, if it failed, the 'error' and
+    its 'traceback'.
+  """
+  if not isinstance(max_workers, int) or max_workers < 1:
+    raise ValueError(
+        'max_workers must be a positive integer, but got %s' % max_workers)
+  if max_workers == 1 or len(jobs) <= 1:
+    return [_run_batch_job(job) for job in jobs]
+
+  # Forking a process that has already imported TensorFlow is not safe, so the
+  # workers are spawned instead where possible (Python 3).
+  if hasattr(multiprocessing, 'get_context'):
+    context = multiprocessing.get_context('spawn')
+  else:
+    context = multiprocessing
+  pool = context.Pool(min(max_workers, len(jobs)))
+  try:
+    return pool.map(_run_batch_job, jobs, chunksize=1)
+  finally:
+    pool.close()
+    pool.join()
+
+
+def _print_batch_summary(results):
+  num_ok = sum(result['status'] == 'ok' for result in results)
+  print('\nConverted %d of %d models in %.1f s of job time:' %
+        (num_ok, len(results), sum(result['seconds'] for result in results)))
+  for result in results:
+    line = '  [%s] %s -> %s (%.1f s)' % (
+        result['status'], result['input_path'], result['output_path'],
+        result['seconds'])
+    if result['status'] != 'ok':
+      line += ': ' + result['error']
+    print(line)
+
 
 if __name__ == '__main__':
+  import tensorflow as tf
   tf.app.run(main=main, argv=[' '.join(sys.argv[1:])])
@@ -22,10 +22,13 @@ import glob
 import json
 import os
 import shutil
+import subprocess
+import sys
 import tempfile
 import unittest
 
 import numpy as np
+import six
 import tensorflow as tf
 from tensorflow import keras
 
@@ -668,6 +671,107 @@ class ConvertTfKerasSavedModelTest(tf.test.TestCase):
       # uint16 quantization.
       self.assertEqual(weight_file_size, total_weight_bytes / 4)
 
+  def testConvertTfjsLayersModelWithFloat16Quantization(self):
+    with tf.Graph().as_default(), tf.compat.v1.Session():
+      model = self._createSimpleSequentialModel()
+      weights = model.get_weights()
+      total_weight_bytes = sum(np.size(w) for w in weights) * 4
+
+      # Save the keras model to a .h5 file.
+      h5_path = os.path.join(self._tmp_dir, 'model.h5')
+      model.save(h5_path)
+
+      # Convert the keras SavedModel to tfjs format.
+      tfjs_output_dir = os.path.join(self._tmp_dir, 'tfjs')
+      converter.dispatch_keras_h5_to_tfjs_layers_model_conversion(
+          h5_path, tfjs_output_dir)
+
+    # Convert the tfjs model to another tfjs model, with float16 weights.
+    sharded_model_path = os.path.join(self._tmp_dir, 'sharded_model')
+    converter.main(['--input_format tfjs_layers_model '
+                    '--output_format tfjs_layers_model --quantize_float16 '
+                    '%s %s' % (os.path.join(tfjs_output_dir, 'model.json'),
+                               sharded_model_path)])
+
+    weight_files = sorted(
+        glob.glob(os.path.join(sharded_model_path, 'group*.bin')))
+    self.assertEqual(len(weight_files), 1)
+    self.assertEqual(os.path.getsize(weight_files[0]), total_weight_bytes / 2)
+
+    with tf.Graph().as_default(), tf.compat.v1.Session():
+      model_prime = keras_tfjs_loader.load_keras_model(
+          os.path.join(sharded_model_path, 'model.json'))
+      for weight, new_weight in zip(weights, model_prime.get_weights()):
+        self.assertAllClose(weight, new_weight, rtol=1e-3, atol=1e-3)
+
+  def testQuantizeFloat16AndQuantizationBytesAreMutuallyExclusive(self):
+    with self.assertRaisesRegexp(  # pylint: disable=deprecated-method
+        ValueError, r'mutually exclusive'):
+      converter.main(['--input_format tfjs_layers_model '
+                      '--output_format tfjs_layers_model --quantize_float16 '
+                      '--quantization_bytes 2 model.json output'])
+
+  def testTopologicalWeightOrderIsNotApplicableToTfHub(self):
+    with self.assertRaisesRegexp(  # pylint: disable=deprecated-method
+        ValueError, r'--topological_weight_order .* not applicable'):
+      converter.main(['--input_format tf_hub --topological_weight_order '
+                      'module output'])
+
+  def testProfileJsonIsNotApplicableToLayersModelOutput(self):
+    with self.assertRaisesRegexp(  # pylint: disable=deprecated-method
+        ValueError, r'--profile_json .* not applicable'):
+      converter.main(['--input_format keras --profile_json profile.json '
+                      'model.h5 output'])
+
+  def testGrapplerOptimizersAreNotApplicableToTfHub(self):
+    with self.assertRaisesRegexp(  # pylint: disable=deprecated-method
+        ValueError, r'--grappler_optimizers .* not applicable'):
+      converter.main(['--input_format tf_hub --grappler_optimizers pruning '
+                      'module output'])
+
+  def testSkipBatchNormFoldingIsNotApplicableToLayersModelOutput(self):
+    with self.assertRaisesRegexp(  # pylint: disable=deprecated-method
+        ValueError, r'--skip_batch_norm_folding .* not applicable'):
+      converter.main(['--input_format keras --skip_batch_norm_folding '
+                      'model.h5 output'])
+
+  def testTfjsLayers2TfjsLayersPreservesTopologyAndWeights(self):
+    with tf.Graph().as_default(), tf.compat.v1.Session():
+      model = self._createSimpleSequentialModel()
+      weights = model.get_weights()
+
+      # Save the keras model to a .h5 file.
+      h5_path = os.path.join(self._tmp_dir, 'model.h5')
+      model.save(h5_path)
+
+      # Convert the keras SavedModel to tfjs format.
+      tfjs_output_dir = os.path.join(self._tmp_dir, 'tfjs')
+      converter.dispatch_keras_h5_to_tfjs_layers_model_conversion(
+          h5_path, tfjs_output_dir)
+
+    sharded_model_path = os.path.join(self._tmp_dir, 'sharded_model')
+    converter.dispatch_tensorflowjs_to_tensorflowjs_conversion(
+        os.path.join(tfjs_output_dir, 'model.json'), sharded_model_path,
+        weight_shard_size_bytes=64)
+
+    with open(os.path.join(tfjs_output_dir, 'model.json'), 'rt') as f:
+      original_json = json.load(f)
+    with open(os.path.join(sharded_model_path, 'model.json'), 'rt') as f:
+      converted_json = json.load(f)
+    self.assertEqual(original_json['modelTopology'],
+                     converted_json['modelTopology'])
+    self.assertEqual(original_json['format'], converted_json['format'])
+    self.assertEqual(original_json['generatedBy'],
+                     converted_json['generatedBy'])
+
+    with tf.Graph().as_default(), tf.compat.v1.Session():
+      model_prime = keras_tfjs_loader.load_keras_model(
+          os.path.join(sharded_model_path, 'model.json'))
+      new_weights = model_prime.get_weights()
+      self.assertEqual(len(weights), len(new_weights))
+      for weight, new_weight in zip(weights, new_weights):
+        self.assertAllEqual(weight, new_weight)
+
   def testConvertTfjsLayersModelToKerasSavedModel(self):
     with tf.Graph().as_default(), tf.compat.v1.Session():
       model = self._createSimpleSequentialModel()
@@ -693,5 +797,162 @@ class ConvertTfKerasSavedModelTest(tf.test.TestCase):
     self.assertIn(os.path.join(keras_saved_model_dir, 'assets'), files)
 
 
+
+class BatchConversionTest(unittest.TestCase):
+
+  def setUp(self):
+    self._tmp_dir = tempfile.mkdtemp()
+    super(BatchConversionTest, self).setUp()
+
+  def tearDown(self):
+    if os.path.isdir(self._tmp_dir):
+      shutil.rmtree(self._tmp_dir)
+    super(BatchConversionTest, self).tearDown()
+
+  def _saveKerasModel(self, name):
+    model = keras.Sequential([keras.layers.Dense(2, input_shape=[3])])
+    h5_path = os.path.join(self._tmp_dir, name + '.h5')
+    model.save(h5_path)
+    return h5_path
+
+  def testBatchManifestConvertsJobsAndReportsFailures(self):
+    jobs = [{
+        'input_path': self._saveKerasModel('model1'),
+        'output_path': os.path.join(self._tmp_dir, 'web_model1'),
+        'input_format': 'keras'
+    }, {
+        'input_path': os.path.join(self._tmp_dir, 'missing.h5'),
+        'output_path': os.path.join(self._tmp_dir, 'web_model2'),
+        'input_format': 'keras'
+    }, {
+        'input_path': self._saveKerasModel('model3'),
+        'output_path': os.path.join(self._tmp_dir, 'web_model3'),
+        'input_format': 'keras',
+        'quantization_bytes': 2,
+        'split_weights_by_layer': True
+    }]
+    manifest_path = os.path.join(self._tmp_dir, 'jobs.json')
+    with open(manifest_path, 'wt') as f:
+      json.dump(jobs, f)
+    report_path = os.path.join(self._tmp_dir, 'report.json')
+
+    with self.assertRaisesRegexp(  # pylint: disable=deprecated-method
+        RuntimeError, r'1 of 3 conversion jobs failed'):
+      converter.main(['--batch_manifest %s --batch_report %s' %
+                      (manifest_path, report_path)])
+
+    with open(report_path, 'rt') as f:
+      report = json.load(f)
+    self.assertEqual(['ok', 'failed', 'ok'],
+                     [result['status'] for result in report])
+    self.assertIn('Nonexistent path to HDF5 file', report[1]['error'])
+    with open(os.path.join(jobs[2]['output_path'], 'model.json'), 'rt') as f:
+      weights_manifest = json.load(f)['weightsManifest']
+    self.assertEqual(
+        'uint16', weights_manifest[0]['weights'][0]['quantization']['dtype'])
+    self.assertTrue(
+        os.path.isfile(os.path.join(jobs[0]['output_path'], 'model.json')))
+
+  def testConvertBatchWithWorkerProcesses(self):
+    jobs = [{
+        'input_path': self._saveKerasModel('model%d' % i),
+        'output_path': os.path.join(self._tmp_dir, 'web_model%d' % i),
+        'input_format': 'keras'
+    } for i in range(2)]
+    jobs.append({'input_path': jobs[0]['input_path'], 'output': 'foo'})
+
+    results = converter.convert_batch(jobs, max_workers=2)
+
+    self.assertEqual(['ok', 'ok', 'failed'],
+                     [result['status'] for result in results])
+    self.assertIn('Unsupported key', results[2]['error'])
+    for job in jobs[:2]:
+      self.assertTrue(
+          os.path.isfile(os.path.join(job['output_path'], 'model.json')))
+
+  def testBatchManifestWithCacheDirReusesIdenticalConversions(self):
+    h5_path = self._saveKerasModel('model')
+    jobs = [{
+        'input_path': h5_path,
+        'output_path': os.path.join(self._tmp_dir, 'web_model%d' % i),
+        'input_format': 'keras'
+    } for i in range(2)]
+    manifest_path = os.path.join(self._tmp_dir, 'jobs.json')
+    with open(manifest_path, 'wt') as f:
+      json.dump(jobs, f)
+    cache_dir = os.path.join(self._tmp_dir, 'cache')
+
+    stdout = sys.stdout
+    sys.stdout = six.StringIO()
+    try:
+      converter.main(['--batch_manifest %s --cache_dir %s' %
+                      (manifest_path, cache_dir)])
+      output = sys.stdout.getvalue()
+    finally:
+      sys.stdout = stdout
+
+    self.assertEqual(1, len(os.listdir(cache_dir)))
+    self.assertEqual(1, output.count('Copied the cached output'))
+    with open(os.path.join(jobs[0]['output_path'], 'model.json'), 'rt') as f:
+      model_json = json.load(f)
+    with open(os.path.join(jobs[1]['output_path'], 'model.json'), 'rt') as f:
+      self.assertEqual(model_json, json.load(f))
+
+  def testConvertBatchChecksTheValuesOfJobs(self):
+    jobs = [{
+        'input_path': self._saveKerasModel('model1'),
+        'output_path': os.path.join(self._tmp_dir, 'web_model1'),
+        'input_format': 'keras',
+        'quantization_bytes': '2'
+    }, {
+        'input_path': self._saveKerasModel('model2'),
+        'output_path': os.path.join(self._tmp_dir, 'web_model2'),
+        'input_format': 'bogus'
+    }, {
+        'input_path': self._saveKerasModel('model3'),
+        'output_path': os.path.join(self._tmp_dir, 'web_model3'),
+        'input_format': 'keras',
+        'quantization_bytes': 3
+    }]
+
+    results = converter.convert_batch(jobs)
+
+    self.assertEqual(['ok', 'failed', 'failed'],
+                     [result['status'] for result in results])
+    self.assertIn("invalid choice: 'bogus'", results[1]['error'])
+    self.assertIn('invalid choice: 3', results[2]['error'])
+    self.assertFalse(os.path.exists(jobs[1]['output_path']))
+
+  def testBatchManifestCannotBeCombinedWithInputPath(self):
+    with self.assertRaisesRegexp(  # pylint: disable=deprecated-method
+        ValueError, r'cannot be used with --batch_manifest'):
+      converter.main(['--batch_manifest jobs.json model.h5 output'])
+
+
+class ConverterImportTest(unittest.TestCase):
+
+  def testImportAndVersionDoNotLoadHeavyDependencies(self):
+    package_dir = os.path.dirname(os.path.dirname(os.path.dirname(
+        os.path.abspath(__file__))))
+    output = subprocess.check_output([
+        sys.executable, '-c',
+        'import sys\n'
+        'from tensorflowjs.converters import converter\n'
+        'converter.main(["--version"])\n'
+        'print(sorted(m for m in ("tensorflow", "tensorflow_hub", "h5py")\n'
+        '             if m in sys.modules))\n'], cwd=package_dir)
+    self.assertIn(b'tensorflowjs %s' % version.version.encode(), output)
+    self.assertTrue(output.strip().endswith(b'[]'))
+
+  def testGraphModelConversionModuleDoesNotLoadTensorflowHub(self):
+    package_dir = os.path.dirname(os.path.dirname(os.path.dirname(
+        os.path.abspath(__file__))))
+    output = subprocess.check_output([
+        sys.executable, '-c',
+        'import sys\n'
+        'from tensorflowjs.converters import tf_saved_model_conversion_v2\n'
+        'print("tensorflow_hub" in sys.modules)\n'], cwd=package_dir)
+    self.assertTrue(output.strip().endswith(b'False'))
+
 if __name__ == '__main__':
   tf.test.main()
@@ -0,0 +1,414 @@
+# Copyright 2019 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+"""Rewrites of frozen graphs that Grappler does not do.
+
+Grappler folds the scale of a batch normalization into the filter of a
+preceding Conv2D, but not into DepthwiseConv2dNative or MatMul weights. It
+leaves the scale and offset of a batch normalization after a BiasAdd in place,
+and its remapper fuses batch normalizations with a Relu into
+_FusedBatchNormEx, which TensorFlow.js does not support. `fold_batch_norms`
+folds all of these into the weights of the preceding node, which saves kernel
+dispatches in the browser.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import numpy as np
+import tensorflow as tf
+
+# Ops that are linear in their weights, which are their second input.
+_LINEAR_OPS = frozenset(['Conv2D', 'DepthwiseConv2dNative', 'MatMul'])
+_BIAS_OPS = frozenset(['BiasAdd', 'Add', 'AddV2'])
+_BATCH_NORM_OPS = frozenset([
+    'FusedBatchNorm', 'FusedBatchNormV2', 'FusedBatchNormV3',
+    '_FusedBatchNormEx'])
+_FOLDABLE_OPS = _BIAS_OPS | _BATCH_NORM_OPS | frozenset(['Mul'])
+
+
+def _get_node_name(input_name):
+  return input_name.lstrip('^').split(':')[0]
+
+
+def _is_nhwc(node):
+  return node.attr['data_format'].s in (b'', b'NHWC')
+
+
+class _GraphIndex(object):
+  """Node lookup and consumers of the nodes of a GraphDef."""
+
+  def __init__(self, graph_def, output_node_names):
+    self.graph_def = graph_def
+    self.nodes = dict((node.name, node) for node in graph_def.node)
+    # The consumers of each node, once per input that refers to it.
+    self.consumers = dict((node.name, []) for node in graph_def.node)
+    for node in graph_def.node:
+      self._add_consumer(node, node.input)
+    self.output_node_names = frozenset(output_node_names)
+
+  def _add_consumer(self, node, input_names):
+    for input_name in input_names:
+      name = _get_node_name(input_name)
+      if name in self.consumers:
+        self.consumers[name].append(node)
+
+  def _remove_consumer(self, node, input_names):
+    for input_name in input_names:
+      name = _get_node_name(input_name)
+      if name in self.consumers:
+        self.consumers[name].remove(node)
+
+  def get_const(self, input_name):
+    """Gets the float32 Const node of an input, or `None`."""
+    node = self.nodes.get(_get_node_name(input_name))
+    if (input_name.startswith('^') or node is None or node.op != 'Const' or
+        node.attr['dtype'].type != tf.float32.as_datatype_enum):
+      return None
+    return node
+
+  def get_single_consumer_input(self, node, index):
+    """Gets an input node of `node` if `node` is its only consumer."""
+    input_name = node.input[index]
+    input_node = self.nodes.get(_get_node_name(input_name))
+    if (input_node is None or input_name.startswith('^') or
+        (':' in input_name and not input_name.endswith(':0')) or
+        len(self.consumers[input_node.name]) != 1):
+      return None
+    return input_node
+
+  def uses_only_first_output(self, node):
+    """Whether the consumers of `node` use its first output only."""
+    return all(
+        _get_node_name(input_name) != node.name or
+        input_name in (node.name, node.name + ':0')
+        for consumer in self.consumers[node.name]
+        for input_name in consumer.input)
+
+  def add_node(self, name, op, inputs):
+    """Adds a float32 node to the graph."""
+    node = self.graph_def.node.add()
+    node.name = name
+    self.set_op(node, op, inputs)
+    self.nodes[name] = node
+    self.consumers[name] = []
+    return node
+
+  def add_const(self, name, value):
+    node = self.add_node(name, 'Const', [])
+    node.attr['dtype'].type = tf.float32.as_datatype_enum
+    _set_value(node, value)
+    return node
+
+  def set_op(self, node, op, inputs):
+    """Replaces the op and inputs of a node with a float32 op."""
+    self._remove_consumer(node, node.input)
+    node.op = op
+    del node.input[:]
+    node.input.extend(inputs)
+    node.attr.clear()
+    if op != 'Const':
+      node.attr['T'].type = tf.float32.as_datatype_enum
+    if op == 'BiasAdd':
+      node.attr['data_format'].s = b'NHWC'
+    self._add_consumer(node, inputs)
+
+  def remove(self, node, replacement):
+    """Removes a node, making its consumers use `replacement` instead."""
+    self._remove_consumer(node, node.input)
+    for consumer in self.consumers[node.name]:
+      for i, input_name in enumerate(consumer.input):
+        if _get_node_name(input_name) == node.name:
+          consumer.input[i] = (
+              '^' + replacement.name if input_name.startswith('^') else
+              replacement.name)
+      self.consumers[replacement.name].append(consumer)
+    del self.consumers[node.name]
+    del self.nodes[node.name]
+
+
+def _get_num_output_channels(node, weights):
+  """Gets the number of output channels of a linear node, or `None`."""
+  if node.op == 'MatMul':
+    return weights.shape[0 if node.attr['transpose_b'].b else 1]
+  if not _is_nhwc(node):
+    return None
+  if node.op == 'Conv2D':
+    return weights.shape[3]
+  # DepthwiseConv2dNative filters are [height, width, in, multiplier].
+  return weights.shape[2] * weights.shape[3]
+
+
+def _is_channel_vector(value, linear_node, num_channels):
+  """Whether `value` broadcasts along the output channels of a linear node.
+
+  It must not broadcast the output to a higher rank or along other dimensions.
+  """
+  max_rank = 2 if linear_node.op == 'MatMul' else 4
+  return (value.ndim <= max_rank and
+          value.size in (1, num_channels) and
+          all(dim == 1 for dim in value.shape[:-1]))
+
+
+def _scale_weights(node, weights, scale):
+  """Multiplies the output channels of linear weights by `scale`."""
+  scale = scale.reshape(-1)
+  if node.op == 'MatMul' and node.attr['transpose_b'].b:
+    return weights * scale[:, np.newaxis]
+  if node.op == 'DepthwiseConv2dNative' and scale.size > 1:
+    return weights * scale.reshape(weights.shape[2], weights.shape[3])
+  return weights * scale
+
+
+def _get_value(const_node):
+  return tf.make_ndarray(const_node.attr['value'].tensor)
+
+
+def _set_value(const_node, value):
+  const_node.attr['value'].tensor.CopyFrom(
+      tf.make_tensor_proto(np.asarray(value, dtype=np.float32)))
+
+
+class _FoldTarget(object):
+  """A linear node, and an optional bias add after it, to fold values into."""
+
+  def __init__(self, index, linear_node, bias_node):
+    self.linear_node = linear_node
+    self.bias_node = bias_node
+    self.weights_const = index.get_const(linear_node.input[1])
+    self.bias_const = None
+    if bias_node is not None:
+      self.bias_const = index.get_const(bias_node.input[1])
+
+  def is_valid(self, index):
+    """Whether the weights and bias can be changed in place."""
+    consts = [self.weights_const]
+    if self.bias_node is not None:
+      consts.append(self.bias_const)
+      if self.bias_node.op == 'BiasAdd' and not _is_nhwc(self.bias_node):
+        return False
+    if any(const is None or len(index.consumers[const.name]) != 1 or
+           const.name in index.output_node_names for const in consts):
+      return False
+    self.weights = _get_value(self.weights_const)
+    self.num_channels = _get_num_output_channels(
+        self.linear_node, self.weights)
+    if self.num_channels is None:
+      return False
+    if self.bias_node is not None:
+      self.bias = _get_value(self.bias_const)
+      return self.is_channel_vector(self.bias)
+    return True
+
+  def is_channel_vector(self, value):
+    return _is_channel_vector(value, self.linear_node, self.num_channels)
+
+  def fold(self, scale=None, shift=None):
+    """Makes the output of the bias node (or linear node) `x * scale + shift`.
+
+    Returns:
+      The shift that is left to add if there is no bias node, or `None`.
+    """
+    if scale is not None:
+      _set_value(self.weights_const,
+                 _scale_weights(self.linear_node, self.weights, scale))
+    if self.bias_node is None:
+      return shift
+    bias = self.bias
+    if scale is not None:
+      bias = bias * scale.reshape(-1)
+    if shift is not None:
+      bias = bias + shift.reshape(-1)
+    _set_value(self.bias_const, bias)
+    return None
+
+  @property
+  def output_node(self):
+    return self.bias_node or self.linear_node
+
+
+def _find_fold_target(index, node, input_indices=(0, 1)):
+  """Finds the linear node that the output of `node` depends on linearly.
+
+  Args:
+    index: The `_GraphIndex` of the graph.
+    node: The node to fold into the linear node.
+    input_indices: The indices of the inputs of `node` to look at.
+
+  Returns:
+    A tuple of the index of the input of `node` that depends on the linear
+    node and a valid `_FoldTarget`, or `None` if `node` does not directly
+    follow a linear node (and an optional bias add).
+  """
+  for input_index in input_indices:
+    producer = index.get_single_consumer_input(node, input_index)
+    if producer is None:
+      continue
+    bias_node = None
+    if producer.op in _BIAS_OPS and len(producer.input) == 2:
+      bias_node = producer
+      producer = index.get_single_consumer_input(bias_node, 0)
+      if producer is None:
+        continue
+    if producer.op in _LINEAR_OPS:
+      target = _FoldTarget(index, producer, bias_node)
+      if target.is_valid(index):
+        return input_index, target
+  return None
+
+
+def _is_removable(index, node):
+  return (node.name not in index.output_node_names and
+          not any(name.startswith('^') for name in node.input))
+
+
+def _fold_mul_or_add(index, node):
+  """Folds a Mul or bias add of a constant into the preceding weights.
+
+  Returns:
+    Whether `node` was folded and removed.
+  """
+  if len(node.input) != 2 or not _is_removable(index, node):
+    return False
+  found = _find_fold_target(
+      index, node, input_indices=(0,) if node.op == 'BiasAdd' else (0, 1))
+  if found is None:
+    return False
+  input_index, target = found
+  if node.op == 'BiasAdd' and not _is_nhwc(node):
+    return False
+  if node.op != 'Mul' and target.bias_node is None:
+    # A bias add right after the linear node has nothing to be folded into.
+    return False
+  const = index.get_const(node.input[1 - input_index])
+  if const is None:
+    return False
+  value = _get_value(const)
+  if not target.is_channel_vector(value):
+    return False
+  if node.op == 'Mul':
+    target.fold(scale=value)
+  else:
+    target.fold(shift=value)
+  index.remove(node, target.output_node)
+  return True
+
+
+def _fold_batch_norm(index, node):
+  """Folds an inference-mode batch normalization into the preceding weights.
+
+  The batch normalization node becomes a BiasAdd if there is no bias add to
+  fold its offset into, or a Relu if it is a _FusedBatchNormEx with a Relu
+  activation. Otherwise it is removed.
+
+  Returns:
+    Whether `node` was folded.
+  """
+  if (node.attr['is_training'].b or not _is_nhwc(node) or
+      len(node.input) != 5 or
+      any(name.startswith('^') for name in node.input) or
+      not index.uses_only_first_output(node)):
+    return False
+  activation = None
+  if node.op == '_FusedBatchNormEx':
+    if node.attr['num_side_inputs'].i:
+      return False
+    activation = node.attr['activation_mode'].s.decode('utf-8')
+    if activation == 'Identity':
+      activation = None
+    elif activation != 'Relu':
+      return False
+  if activation is None and node.name in index.output_node_names:
+    return False
+  consts = [index.get_const(name) for name in node.input[1:]]
+  if any(const is None for const in consts):
+    return False
+  found = _find_fold_target(index, node, input_indices=(0,))
+  if found is None:
+    return False
+  _, target = found
+  scale, offset, mean, variance = [_get_value(const) for const in consts]
+  if not all(value.ndim == 1 and value.size == target.num_channels
+             for value in (scale, offset, mean, variance)):
+    return False
+  new_names = [node.name + '/bias', node.name + '/BiasAdd']
+  if any(name in index.nodes for name in new_names):
+    return False
+
+  scale = scale / np.sqrt(variance + node.attr['epsilon'].f)
+  shift = target.fold(scale=scale, shift=offset - mean * scale)
+  output = target.output_node
+  if shift is not None:
+    bias_const = index.add_const(new_names[0], shift)
+    if activation is None:
+      index.set_op(node, 'BiasAdd', [output.name, bias_const.name])
+      return True
+    output = index.add_node(
+        new_names[1], 'BiasAdd', [output.name, bias_const.name])
+  if activation is None:
+    index.remove(node, output)
+  else:
+    index.set_op(node, activation, [output.name])
+  return True
+
+
+def fold_batch_norms(graph_def, output_node_names):
+  """Folds batch normalizations into the weights of the preceding node.
+
+  Folds these patterns, where Linear is Conv2D, DepthwiseConv2dNative or
+  MatMul, and W, b, s and c are float32 Const nodes used only there, that hold
+  one value per output channel or a single value:
+    - Linear(x, W) * s => Linear(x, W * s)
+    - BiasAdd(Linear(x, W), b) * s => BiasAdd(Linear(x, W * s), b * s)
+    - BiasAdd(Linear(x, W), b) + c => BiasAdd(Linear(x, W), b + c)
+    - FusedBatchNorm(Linear(x, W)) => BiasAdd(Linear(x, W * s), c), where s
+      and c are the scale and shift of the batch normalization in inference
+      mode. A Relu activation of _FusedBatchNormEx is kept as a Relu.
+  Add and AddV2 are folded like BiasAdd. Conv2D and DepthwiseConv2dNative
+  nodes must use the NHWC data format.
+
+  Args:
+    graph_def: The frozen, optimized tf.GraphDef to rewrite in place.
+    output_node_names: The names of the output nodes, which are kept.
+
+  Returns:
+    The number of nodes removed from `graph_def`, including the Const nodes
+    that are no longer used.
+  """
+  num_nodes = len(graph_def.node)
+  index = _GraphIndex(graph_def, output_node_names)
+  unused_consts = set(
+      name for name, consumers in index.consumers.items() if not consumers)
+  # Folding a node can make the node after it foldable, which may come before
+  # it in the GraphDef.
+  changed = True
+  while changed:
+    changed = False
+    for node in list(graph_def.node):
+      if node.name not in index.nodes or node.op not in _FOLDABLE_OPS:
+        continue
+      if node.op in _BATCH_NORM_OPS:
+        changed |= _fold_batch_norm(index, node)
+      else:
+        changed |= _fold_mul_or_add(index, node)
+
+  for i in reversed(range(len(graph_def.node))):
+    node = graph_def.node[i]
+    if (node.name not in index.nodes or
+        node.op == 'Const' and not index.consumers[node.name] and
+        node.name not in unused_consts and
+        node.name not in index.output_node_names):
+      del graph_def.node[i]
+  return num_nodes - len(graph_def.node)
@@ -0,0 +1,151 @@
+# Copyright 2019 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+"""Unit tests for the graph rewrites."""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import unittest
+
+import numpy as np
+import tensorflow as tf
+
+from tensorflowjs.converters import graph_rewrite
+
+
+class FoldBatchNormsTest(unittest.TestCase):
+
+  def setUp(self):
+    self._random = np.random.RandomState(42)
+    super(FoldBatchNormsTest, self).setUp()
+
+  def _rand(self, *shape):
+    return self._random.uniform(0.5, 1.5, size=shape).astype(np.float32)
+
+  def _run(self, graph_def, output_name, x):
+    with tf.Graph().as_default() as graph:
+      tf.import_graph_def(graph_def, name='')
+      with tf.compat.v1.Session(graph=graph) as sess:
+        return sess.run(output_name + ':0', {'x:0': x})
+
+  def _assertFoldsTo(self, graph_def, output_name, x, num_removed, ops):
+    expected = self._run(graph_def, output_name, x)
+
+    self.assertEqual(
+        num_removed, graph_rewrite.fold_batch_norms(graph_def, [output_name]))
+
+    self.assertEqual(sorted(ops),
+                     sorted(node.op for node in graph_def.node
+                            if node.op not in ('Const', 'Placeholder')))
+    np.testing.assert_allclose(
+        expected, self._run(graph_def, output_name, x), rtol=1e-5)
+
+  def testFoldMulIntoDepthwiseConv(self):
+    with tf.Graph().as_default() as graph:
+      x = tf.compat.v1.placeholder(tf.float32, [1, 5, 5, 2], name='x')
+      y = tf.nn.depthwise_conv2d(
+          x, tf.constant(self._rand(3, 3, 2, 3)), [1, 1, 1, 1], 'SAME')
+      tf.nn.relu6(y * tf.constant(self._rand(6)), name='output')
+
+    # The Mul and its scale are removed.
+    self._assertFoldsTo(graph.as_graph_def(), 'output', self._rand(1, 5, 5, 2),
+                        2, ['DepthwiseConv2dNative', 'Relu6'])
+
+  def testFoldMulAndAddAfterBiasAdd(self):
+    with tf.Graph().as_default() as graph:
+      x = tf.compat.v1.placeholder(tf.float32, [2, 4], name='x')
+      y = tf.nn.bias_add(
+          tf.matmul(x, tf.constant(self._rand(3, 4)), transpose_b=True),
+          tf.constant(self._rand(3)))
+      y = tf.add(tf.constant(self._rand(3)) * y, tf.constant(self._rand(3)))
+      tf.nn.relu(y, name='output')
+
+    self._assertFoldsTo(graph.as_graph_def(), 'output', self._rand(2, 4),
+                        4, ['MatMul', 'BiasAdd', 'Relu'])
+
+  def testFoldFusedBatchNormIntoConv(self):
+    with tf.Graph().as_default() as graph:
+      x = tf.compat.v1.placeholder(tf.float32, [1, 5, 5, 2], name='x')
+      y = tf.nn.conv2d(
+          x, tf.constant(self._rand(3, 3, 2, 4)), [1, 1, 1, 1], 'SAME')
+      y, _, _ = tf.compat.v1.nn.fused_batch_norm(
+          y, self._rand(4), self._rand(4), mean=self._rand(4),
+          variance=self._rand(4), is_training=False)
+      tf.identity(y, name='output')
+
+    # The four batch norm constants become one bias.
+    self._assertFoldsTo(graph.as_graph_def(), 'output', self._rand(1, 5, 5, 2),
+                        3, ['Conv2D', 'BiasAdd', 'Identity'])
+
+  def testFoldFusedBatchNormExWithRelu(self):
+    with tf.Graph().as_default() as graph:
+      x = tf.compat.v1.placeholder(tf.float32, [1, 5, 5, 2], name='x')
+      y = tf.nn.conv2d(
+          x, tf.constant(self._rand(3, 3, 2, 4)), [1, 1, 1, 1], 'SAME')
+      y, _, _ = tf.compat.v1.nn.fused_batch_norm(
+          y, self._rand(4), self._rand(4), mean=self._rand(4),
+          variance=self._rand(4), is_training=False, name='bn')
+      tf.nn.relu(y, name='relu')
+    x = self._rand(1, 5, 5, 2)
+    expected = self._run(graph.as_graph_def(), 'relu', x)
+    # Fuse the Relu into the batch norm, as the Grappler remapper does.
+    graph_def = tf.compat.v1.GraphDef()
+    for node in graph.as_graph_def().node:
+      if node.name != 'relu':
+        graph_def.node.add().CopyFrom(node)
+    bn = [node for node in graph_def.node if node.name == 'bn'][0]
+    bn.op = '_FusedBatchNormEx'
+    bn.attr['activation_mode'].s = b'Relu'
+    bn.attr['num_side_inputs'].i = 0
+
+    # The four batch norm constants become a bias and a BiasAdd node.
+    self.assertEqual(2, graph_rewrite.fold_batch_norms(graph_def, ['bn']))
+
+    self.assertEqual(
+        ['BiasAdd', 'Conv2D', 'Relu'],
+        sorted(node.op for node in graph_def.node
+               if node.op not in ('Const', 'Placeholder')))
+    np.testing.assert_allclose(expected, self._run(graph_def, 'bn', x),
+                               rtol=1e-5)
+
+  def testKeepOutputsAndSharedWeights(self):
+    with tf.Graph().as_default() as graph:
+      x = tf.compat.v1.placeholder(tf.float32, [2, 3], name='x')
+      weights = tf.constant(self._rand(3, 3))
+      tf.multiply(tf.matmul(x, weights), tf.constant(self._rand(3)),
+                  name='output1')
+      tf.multiply(tf.matmul(x, weights), tf.constant(self._rand(3)),
+                  name='output2')
+      tf.multiply(tf.matmul(x, tf.constant(self._rand(3, 3))),
+                  tf.constant(self._rand(3)), name='output3')
+    graph_def = graph.as_graph_def()
+
+    self.assertEqual(0, graph_rewrite.fold_batch_norms(
+        graph_def, ['output1', 'output2', 'output3']))
+
+  def testKeepMulThatBroadcastsAcrossSpatialDimensions(self):
+    with tf.Graph().as_default() as graph:
+      x = tf.compat.v1.placeholder(tf.float32, [1, 2, 2, 1], name='x')
+      y = tf.nn.conv2d(
+          x, tf.constant(self._rand(1, 1, 1, 2)), [1, 1, 1, 1], 'SAME')
+      tf.identity(y * tf.constant(self._rand(1, 2, 1, 2)), name='output')
+    graph_def = graph.as_graph_def()
+
+    self.assertEqual(0, graph_rewrite.fold_batch_norms(graph_def, ['output']))
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -22,7 +22,10 @@ from __future__ import absolute_import
 from __future__ import division
 from __future__ import print_function
 
+import heapq
+import importlib
 import json
+import mmap
 import os
 import tempfile
 
@@ -54,11 +57,61 @@ def as_text(bytes_or_text, encoding='utf-8'):
                     bytes_or_text)
 
 
-def _convert_h5_group(group):
+def _mmap_h5file(h5file):
+  """Memory-maps an HDF5 file read-only.
+
+  Args:
+    h5file: An instance of h5py.File.
+
+  Returns:
+    An `mmap.mmap` of the file, or `None` if the file is not a plain file on
+    disk (e.g., an in-memory HDF5 file) or is empty.
+  """
+  if h5file.driver not in ('sec2', 'stdio') or not os.path.isfile(
+      h5file.filename):
+    return None
+  if h5file.mode != 'r':
+    # Make sure the datasets are on disk before mapping them.
+    h5file.flush()
+  with open(h5file.filename, 'rb') as f:
+    if not os.fstat(f.fileno()).st_size:
+      return None
+    return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+def _read_h5_dataset(dataset, file_buffer=None):
+  """Read the values of an HDF5 dataset.
+
+  Datasets stored contiguously and without filters (which is how Keras saves
+  weights) are returned as read-only views of `file_buffer`, if it is set, so
+  their bytes are only read from disk when used (e.g., while being written to
+  weight shards). Other datasets are read with a single read into a new
+  array.
+
+  Args:
+    dataset: An h5py.Dataset.
+    file_buffer: An optional memory map of the whole HDF5 file.
+
+  Returns:
+    A numpy array.
+  """
+  if (file_buffer is not None and dataset.chunks is None and
+      dataset.dtype.kind in 'biuf' and dataset.dtype.isnative):
+    offset = dataset.id.get_offset()
+    if offset is not None:
+      return np.frombuffer(
+          file_buffer, dtype=dataset.dtype, count=dataset.size,
+          offset=offset).reshape(dataset.shape)
+  return np.asarray(dataset[()])
+
+
+def _convert_h5_group(group, file_buffer=None):
   """Construct a weights group entry.
 
   Args:
     group: The HDF5 group data, possibly nested.
+    file_buffer: An optional memory map of the whole HDF5 file, to read the
+      weight values from (see `_read_h5_dataset`).
 
   Returns:
     An array of weight groups (see `write_weights` in TensorFlow.js).
@@ -72,7 +125,8 @@ def _convert_h5_group(group):
 
     names = [as_text(name) for name in names]
     weight_values = [
-        np.array(group[weight_name]) for weight_name in names]
+        _read_h5_dataset(group[weight_name], file_buffer)
+        for weight_name in names]
     group_out += [{
         'name': normalize_weight_name(weight_name),
         'data': weight_value
@@ -82,7 +136,7 @@ def _convert_h5_group(group):
     # 'foo/bar/Dense').
     for key in group.keys():
       # Call this method recursively.
-      group_out += _convert_h5_group(group[key])
+      group_out += _convert_h5_group(group[key], file_buffer)
 
   return group_out
 
@@ -158,7 +212,76 @@ def translate_class_names(input_object):
         translate_class_names(item)
 
 
-def h5_merged_saved_model_to_tfjs_format(h5file, split_by_layer=False):
+def _get_inbound_layer_names(layer_config):
+  """Get the names of the layers whose outputs a layer is called on."""
+  names = set()
+  for node in layer_config.get('inbound_nodes') or []:
+    for inbound in node:
+      if (isinstance(inbound, (list, tuple)) and inbound and
+          isinstance(inbound[0], six.string_types)):
+        names.add(inbound[0])
+  return names
+
+
+def get_layer_names_in_execution_order(model_config):
+  """Get the names of the layers of a Keras model in execution order.
+
+  The layers are sorted topologically by their inbound nodes. Layers that do
+  not depend on each other keep their order in the model config.
+
+  Args:
+    model_config: The Keras model config, as a JSON dictionary (e.g., the
+      'model_config' of a merged HDF5 file).
+
+  Returns:
+    A list of layer names, such that every layer comes after the layers it is
+    called on.
+  """
+  config = model_config.get('config')
+  layers = config.get('layers') if isinstance(config, dict) else config
+  if not isinstance(layers, list):
+    return []
+
+  # Sequential models store the layer name in the layer config only.
+  names = [layer.get('name') or layer['config']['name'] for layer in layers]
+  indices = {name: i for i, name in enumerate(names)}
+  consumers = [[] for _ in layers]
+  num_inbound = [0] * len(layers)
+  for i, layer in enumerate(layers):
+    for inbound_name in _get_inbound_layer_names(layer):
+      if inbound_name in indices and inbound_name != names[i]:
+        consumers[indices[inbound_name]].append(i)
+        num_inbound[i] += 1
+
+  ready = [i for i, count in enumerate(num_inbound) if not count]
+  heapq.heapify(ready)
+  ordered_names = []
+  while ready:
+    i = heapq.heappop(ready)
+    ordered_names.append(names[i])
+    for consumer in consumers[i]:
+      num_inbound[consumer] -= 1
+      if not num_inbound[consumer]:
+        heapq.heappush(ready, consumer)
+  # Layers caught in a cycle (not expected in a valid config) keep their
+  # order in the config.
+  if len(ordered_names) < len(names):
+    emitted = set(ordered_names)
+    ordered_names += [name for name in names if name not in emitted]
+  return ordered_names
+
+
+def _sort_layer_names(layer_names, ordered_names):
+  """Sort `layer_names` by `ordered_names`, with the others at the end."""
+  position = {name: i for i, name in enumerate(ordered_names)}
+  return sorted(
+      layer_names,
+      key=lambda name: position.get(name, len(ordered_names)))
+
+
+def h5_merged_saved_model_to_tfjs_format(h5file, split_by_layer=False,
+                                         topological_order=False,
+                                         use_mmap=False):
   """Load topology & weight values from HDF5 file and convert.
 
   The HDF5 file is one generated by Keras' save_model method or model.save()
@@ -172,6 +295,18 @@ def h5_merged_saved_model_to_tfjs_format(h5file, split_by_layer=False):
     h5file: An instance of h5py.File, or the path to an h5py file.
     split_by_layer: (Optional) whether the weights of different layers are
       to be stored in separate weight groups (Default: `False`).
+    topological_order: (Optional) whether the weights (and weight groups, if
+      `split_by_layer` is `True`) are to be ordered by the execution order of
+      their layers in the model config, instead of the order of the layers in
+      the HDF5 file, which is alphabetical. Shards then hold the weights of
+      the first layers first, so runtimes can start on them while later
+      shards are still being fetched (Default: `False`).
+    use_mmap: (Optional) whether to memory-map the HDF5 file instead of
+      reading the weight values into memory. If `True`, the values of weights
+      stored contiguously and uncompressed (as saved by Keras) are read-only
+      numpy arrays backed by the mapped pages, so they are only read from
+      disk as they are used, e.g., streamed into weight shards by
+      `write_weights`. Other weights are read into memory (Default: `False`).
 
   Returns:
     (model_json, groups)
@@ -196,9 +331,14 @@ def h5_merged_saved_model_to_tfjs_format(h5file, split_by_layer=False):
 
   model_weights = h5file['model_weights']
   layer_names = [as_text(n) for n in model_weights]
+  if topological_order:
+    layer_names = _sort_layer_names(
+        layer_names,
+        get_layer_names_in_execution_order(model_json['model_config']))
+  file_buffer = _mmap_h5file(h5file) if use_mmap else None
   for layer_name in layer_names:
     layer = model_weights[layer_name]
-    group = _convert_h5_group(layer)
+    group = _convert_h5_group(layer, file_buffer)
     if group:
       if split_by_layer:
         groups.append(group)
@@ -207,7 +347,7 @@ def h5_merged_saved_model_to_tfjs_format(h5file, split_by_layer=False):
   return model_json, groups
 
 
-def h5_weights_to_tfjs_format(h5file, split_by_layer=False):
+def h5_weights_to_tfjs_format(h5file, split_by_layer=False, use_mmap=False):
   """Load weight values from a Keras HDF5 file and to a binary format.
 
   The HDF5 file is one generated by Keras' Model.save_weights() method.
@@ -221,6 +361,12 @@ def h5_weights_to_tfjs_format(h5file, split_by_layer=False):
     h5file: An instance of h5py.File, or the path to an h5py file.
     split_by_layer: (Optional) whether the weights of different layers are
       to be stored in separate weight groups (Default: `False`).
+    use_mmap: (Optional) whether to memory-map the HDF5 file instead of
+      reading the weight values into memory. If `True`, the values of weights
+      stored contiguously and uncompressed (as saved by Keras) are read-only
+      numpy arrays backed by the mapped pages, so they are only read from
+      disk as they are used, e.g., streamed into weight shards by
+      `write_weights`. Other weights are read into memory (Default: `False`).
 
   Returns:
     An array of group_weights as defined in tfjs write_weights.
@@ -236,9 +382,10 @@ def h5_weights_to_tfjs_format(h5file, split_by_layer=False):
   # pylint: disable=not-an-iterable
   layer_names = [as_text(n) for n in h5file.attrs['layer_names']]
   # pylint: enable=not-an-iterable
+  file_buffer = _mmap_h5file(h5file) if use_mmap else None
   for layer_name in layer_names:
     layer = h5file[layer_name]
-    group = _convert_h5_group(layer)
+    group = _convert_h5_group(layer, file_buffer)
     if group:
       if split_by_layer:
         groups.append(group)
@@ -247,6 +394,132 @@ def h5_weights_to_tfjs_format(h5file, split_by_layer=False):
   return groups
 
 
+# Modules of the Keras packages (relative to the package) that hold the
+# `model_metadata` helper Keras uses to build the attributes of HDF5 files.
+_KERAS_SAVING_UTILS_MODULES = ('.saving.legacy.saving_utils',
+                               '.saving.saving_utils')
+
+
+def _to_json_type(value):
+  """Convert the numpy values of Keras configs for `json.dumps`."""
+  if isinstance(value, np.ndarray):
+    return value.tolist()
+  elif isinstance(value, np.generic):
+    return value.item()
+  raise TypeError('Not JSON serializable: %r' % value)
+
+
+def _get_training_config(model):
+  """Get the training config that Keras saves in HDF5 files with a model.
+
+  Args:
+    model: An instance of `keras.Model`.
+
+  Returns:
+    The training config as a JSON dictionary, or `None` if the model is not
+    compiled.
+
+  Raises:
+    NotImplementedError: If the model is compiled, but the Keras package of
+      the model has no helper to build its training config, or the helper
+      fails.
+  """
+  if not getattr(model, 'optimizer', None):
+    return None
+  package = type(model).__module__.split('.engine.')[0]
+  for module_name in _KERAS_SAVING_UTILS_MODULES:
+    try:
+      saving_utils = importlib.import_module(package + module_name)
+    except ImportError:
+      continue
+    if not hasattr(saving_utils, 'model_metadata'):
+      continue
+    # `model_metadata` is private to Keras, so its signature and result may
+    # change between versions.
+    try:
+      metadata = saving_utils.model_metadata(model)
+      if 'training_config' not in metadata:
+        return None
+      return json.loads(
+          json.dumps(metadata['training_config'], default=_to_json_type))
+    except (AttributeError, KeyError, TypeError, ValueError) as e:
+      raise NotImplementedError(
+          'Cannot get the training config of a %s model: %s' % (package, e))
+  raise NotImplementedError(
+      'Cannot get the training config of a %s model.' % package)
+
+
+def keras_model_to_tfjs_format(model, split_by_layer=False):
+  """Get the topology & weight values of an in-memory Keras model.
+
+  This is the in-memory counterpart of `h5_merged_saved_model_to_tfjs_format`:
+  the topology comes from `model.to_json()` and the weight values from the
+  layers of the model, so the model does not need to be saved to an HDF5 file
+  first. The weights are in the order of the layers of the model.
+
+  Args:
+    model: An instance of `keras.Model`.
+    split_by_layer: (Optional) whether the weights of different layers are
+      to be stored in separate weight groups (Default: `False`).
+
+  Returns:
+    (model_json, groups)
+      model_json: a JSON dictionary holding topology and system metadata.
+      group: an array of group_weights as defined in tfjs write_weights.
+
+  Raises:
+    NotImplementedError: If the model is compiled, but its training config
+      cannot be built, or if the weights of a layer cannot be read.
+  """
+  config = json.loads(model.to_json())
+  model_json = {
+      'keras_version': config.pop('keras_version'),
+      'backend': config.pop('backend'),
+      'model_config': config,
+  }
+  translate_class_names(model_json['model_config'])
+  training_config = _get_training_config(model)
+  if training_config is not None:
+    model_json['training_config'] = training_config
+
+  groups = [] if split_by_layer else [[]]
+  # Weights created directly by the model, outside of its layers, are saved in
+  # a group of their own, as in HDF5 files.
+  layer_weight_ids = set()
+  for layer in model.layers:
+    weights = layer.weights
+    values = layer.get_weights()
+    if len(weights) != len(values):
+      raise NotImplementedError(
+          'Cannot read the weights of layer %s: %d weights but %d values' %
+          (layer.name, len(weights), len(values)))
+    layer_weight_ids.update(id(weight) for weight in weights)
+    group = [{
+        'name': normalize_weight_name(weight.name),
+        'data': value
+    } for weight, value in zip(weights, values)]
+    if group:
+      if split_by_layer:
+        groups.append(group)
+      else:
+        groups[0] += group
+
+  top_level_weights = [
+      (i, weight) for i, weight in enumerate(model.weights)
+      if id(weight) not in layer_weight_ids]
+  if top_level_weights:
+    values = model.get_weights()
+    group = [{
+        'name': normalize_weight_name(weight.name),
+        'data': values[i]
+    } for i, weight in top_level_weights]
+    if split_by_layer:
+      groups.append(group)
+    else:
+      groups[0] += group
+  return model_json, groups
+
+
 def _get_generated_by(topology):
   if topology is None:
     return None
@@ -270,7 +543,7 @@ def write_artifacts(topology,
     weights: an array of weight groups (as defined in tfjs write_weights).
     output_dir: the directory to hold all the contents.
     quantization_dtype: An optional numpy dtype to quantize weights to for
-      compression. Only np.uint8 and np.uint16 are supported.
+      compression. Only np.uint8, np.uint16 and np.float16 are supported.
     weight_shard_size_bytes: Shard size (in bytes) of the weight files.
       The size of each weight file will be <= this value.
   """
@@ -319,22 +592,28 @@ def save_keras_model(model, artifacts_dir, quantization_dtype=None):
           fields:
           - 'modelTopology': A JSON object describing the topology of the model,
             along with additional information such as training. It is obtained
-            through calling `model.save()`.
+            from `model.to_json()`, without saving the model to a file.
           - 'weightsManifest': A TensorFlow.js-format JSON manifest for the
             model's weights.
         - files containing weight values in groups, with the file name pattern
           group(\d+)-shard(\d+)of(\d+).
       If the directory does not exist, this function will attempt to create it.
     quantization_dtype: An optional numpy dtype to quantize weights to for
-        compression. Only np.uint8 and np.uint16 are supported.
+        compression. Only np.uint8, np.uint16 and np.float16 are supported.
 
   Raises:
     ValueError: If `artifacts_dir` already exists as a file (not a directory).
   """
-  temp_h5_path = tempfile.mktemp() + '.h5'
-  model.save(temp_h5_path)
-  topology_json, weight_groups = (
-      h5_merged_saved_model_to_tfjs_format(temp_h5_path))
+  temp_h5_path = None
+  try:
+    topology_json, weight_groups = keras_model_to_tfjs_format(model)
+  except NotImplementedError:
+    # E.g., a compiled model of a Keras version whose training config cannot
+    # be built in memory: fall back to reading back an HDF5 file.
+    temp_h5_path = tempfile.mktemp() + '.h5'
+    model.save(temp_h5_path)
+    topology_json, weight_groups = (
+        h5_merged_saved_model_to_tfjs_format(temp_h5_path))
   if os.path.isfile(artifacts_dir):
     raise ValueError('Path "%s" already exists as a file.' % artifacts_dir)
   if not os.path.isdir(artifacts_dir):
@@ -342,4 +621,5 @@ def save_keras_model(model, artifacts_dir, quantization_dtype=None):
   write_artifacts(
       topology_json, weight_groups, artifacts_dir,
       quantization_dtype=quantization_dtype)
-  os.remove(temp_h5_path)
+  if temp_h5_path:
+    os.remove(temp_h5_path)
@@ -18,6 +18,7 @@ from __future__ import absolute_import
 from __future__ import division
 from __future__ import print_function
 
+import importlib
 import json
 import os
 import shutil
@@ -251,6 +252,106 @@ class ConvertH5WeightsTest(unittest.TestCase):
     self.assertEqual((4, 2), kernel2['data'].shape)
     self.assertTrue(np.allclose(np.ones([4, 2]), kernel2['data']))
 
+  def testConvertMergedModelInTopologicalOrder(self):
+    input_tensor = keras.layers.Input((3,))
+    dense1 = keras.layers.Dense(4, name='ZFirstDense')(input_tensor)
+    dense2 = keras.layers.Dense(4, name='MSecondDense')(dense1)
+    output = keras.layers.Dense(2, name='AThirdDense')(dense2)
+    model = keras.models.Model(inputs=[input_tensor], outputs=[output])
+    h5_path = os.path.join(self._tmp_dir, 'MyModelMerged.h5')
+    model.save(h5_path)
+
+    _, groups = conversion.h5_merged_saved_model_to_tfjs_format(
+        h5py.File(h5_path), topological_order=True)
+    self.assertEqual(
+        ['ZFirstDense/kernel', 'ZFirstDense/bias',
+         'MSecondDense/kernel', 'MSecondDense/bias',
+         'AThirdDense/kernel', 'AThirdDense/bias'],
+        [weight['name'] for weight in groups[0]])
+
+    _, groups = conversion.h5_merged_saved_model_to_tfjs_format(
+        h5py.File(h5_path), split_by_layer=True, topological_order=True)
+    self.assertEqual(
+        ['ZFirstDense', 'MSecondDense', 'AThirdDense'],
+        [group[0]['name'].split('/')[0] for group in groups])
+
+  def testGetLayerNamesInExecutionOrder(self):
+    model_config = {
+        'class_name': 'Model',
+        'config': {
+            'layers': [{
+                'name': 'add',
+                'inbound_nodes': [[['dense_b', 0, 0, {}],
+                                   ['dense_a', 0, 0, {}]]]
+            }, {
+                'name': 'dense_b',
+                'inbound_nodes': [[['input', 0, 0, {}]]]
+            }, {
+                'name': 'input',
+                'inbound_nodes': []
+            }, {
+                'name': 'dense_a',
+                'inbound_nodes': [[['input', 0, 0, {}]]]
+            }]
+        }
+    }
+    self.assertEqual(
+        ['input', 'dense_b', 'dense_a', 'add'],
+        conversion.get_layer_names_in_execution_order(model_config))
+
+    sequential_config = {
+        'class_name': 'Sequential',
+        'config': [{'config': {'name': 'dense_2'}},
+                   {'config': {'name': 'dense_1'}}]
+    }
+    self.assertEqual(
+        ['dense_2', 'dense_1'],
+        conversion.get_layer_names_in_execution_order(sequential_config))
+
+  def testConvertMergedModelWithMmap(self):
+    model = keras.Sequential([
+        keras.layers.Dense(3, input_shape=[2], name='Dense1'),
+        keras.layers.Dense(1, use_bias=False, name='Dense2')])
+    h5_path = os.path.join(self._tmp_dir, 'MyModelMerged.h5')
+    model.save(h5_path)
+
+    _, groups = conversion.h5_merged_saved_model_to_tfjs_format(
+        h5py.File(h5_path, 'r'))
+    _, mmap_groups = conversion.h5_merged_saved_model_to_tfjs_format(
+        h5py.File(h5_path, 'r'), use_mmap=True)
+
+    self.assertEqual([entry['name'] for entry in groups[0]],
+                     [entry['name'] for entry in mmap_groups[0]])
+    for entry, mmap_entry in zip(groups[0], mmap_groups[0]):
+      self.assertEqual(entry['data'].dtype, mmap_entry['data'].dtype)
+      np.testing.assert_array_equal(entry['data'], mmap_entry['data'])
+      # Keras saves weights uncompressed, so they are all mapped.
+      self.assertFalse(mmap_entry['data'].flags.writeable)
+
+  def testConvertWeightsWithMmapReadsCompressedDatasets(self):
+    h5_path = os.path.join(self._tmp_dir, 'weights.h5')
+    kernel = np.arange(12, dtype=np.float32).reshape([3, 4])
+    bias = np.arange(4, dtype=np.float32)
+    with h5py.File(h5_path, 'w') as h5file:
+      h5file.attrs['keras_version'] = np.string_(keras.__version__)
+      h5file.attrs['backend'] = np.string_('tensorflow')
+      h5file.attrs['layer_names'] = [np.string_('dense')]
+      layer = h5file.create_group('dense')
+      layer.attrs['weight_names'] = [np.string_('dense/kernel:0'),
+                                     np.string_('dense/bias:0')]
+      layer.create_dataset('dense/kernel:0', data=kernel, compression='gzip')
+      layer.create_dataset('dense/bias:0', data=bias)
+
+    groups = conversion.h5_weights_to_tfjs_format(
+        h5py.File(h5_path, 'r'), use_mmap=True)
+
+    self.assertEqual(['dense/kernel', 'dense/bias'],
+                     [entry['name'] for entry in groups[0]])
+    np.testing.assert_array_equal(kernel, groups[0][0]['data'])
+    self.assertTrue(groups[0][0]['data'].flags.writeable)
+    np.testing.assert_array_equal(bias, groups[0][1]['data'])
+    self.assertFalse(groups[0][1]['data'].flags.writeable)
+
   def testConvertWeightsFromSequentialModelNoSplitByLayer(self):
     sequential_model = keras.models.Sequential([
         keras.layers.Dense(
@@ -425,6 +526,77 @@ class ConvertH5WeightsTest(unittest.TestCase):
     self.assertEqual(1, len(weights_manifest))
     self.assertIn('paths', weights_manifest[0])
 
+  def testKerasModelToTfjsFormatMatchesHdf5Conversion(self):
+    inner_model = keras.Sequential([
+        keras.layers.Dense(4, input_shape=[3], activation='relu'),
+        keras.layers.BatchNormalization()])
+    t_input = keras.Input([3])
+    t_output = keras.layers.Dense(2)(inner_model(t_input))
+    model = keras.Model(t_input, t_output)
+    model.compile(loss='mean_squared_error', optimizer='sgd')
+    h5_path = os.path.join(self._tmp_dir, 'MyModel.h5')
+    model.save(h5_path)
+
+    model_json, groups = conversion.keras_model_to_tfjs_format(model)
+    h5_model_json, h5_groups = conversion.h5_merged_saved_model_to_tfjs_format(
+        h5py.File(h5_path))
+
+    self.assertEqual(h5_model_json, model_json)
+    self.assertIn('training_config', model_json)
+    self.assertEqual(1, len(groups))
+    # The HDF5 weights are in alphabetical order of the layers.
+    h5_weights = {entry['name']: entry['data'] for entry in h5_groups[0]}
+    self.assertEqual(sorted(h5_weights),
+                     sorted(entry['name'] for entry in groups[0]))
+    for entry in groups[0]:
+      self.assertEqual(h5_weights[entry['name']].dtype, entry['data'].dtype)
+      np.testing.assert_array_equal(h5_weights[entry['name']], entry['data'])
+
+  def testKerasModelToTfjsFormatSplitByLayer(self):
+    model = keras.Sequential([
+        keras.layers.Dense(3, input_shape=[2], name='Dense1'),
+        keras.layers.Dense(1, use_bias=False, name='Dense2')])
+
+    model_json, groups = conversion.keras_model_to_tfjs_format(
+        model, split_by_layer=True)
+
+    self.assertNotIn('training_config', model_json)
+    self.assertEqual(
+        [['Dense1/kernel', 'Dense1/bias'], ['Dense2/kernel']],
+        [[entry['name'] for entry in group] for group in groups])
+
+  def testSaveModelFallsBackToHdf5IfTrainingConfigHelperFails(self):
+    model = keras.Sequential([keras.layers.Dense(3, input_shape=[2])])
+    model.compile(loss='mean_squared_error', optimizer='sgd')
+    package = type(model).__module__.split('.engine.')[0]
+    patched_modules = []
+    for module_name in conversion._KERAS_SAVING_UTILS_MODULES:
+      try:
+        saving_utils = importlib.import_module(package + module_name)
+      except ImportError:
+        continue
+      if hasattr(saving_utils, 'model_metadata'):
+        model_metadata = saving_utils.model_metadata
+        patched_modules.append((saving_utils, model_metadata))
+        # Simulate a change of the signature of the private helper. Saving
+        # the model to an HDF5 file passes both arguments, so it still works.
+        saving_utils.model_metadata = (
+            lambda model, include_optimizer, f=model_metadata:
+            f(model, include_optimizer))
+    artifacts_dir = os.path.join(self._tmp_dir, 'artifacts')
+
+    try:
+      with self.assertRaises(NotImplementedError):
+        conversion.keras_model_to_tfjs_format(model)
+      conversion.save_keras_model(model, artifacts_dir)
+    finally:
+      for saving_utils, model_metadata in patched_modules:
+        saving_utils.model_metadata = model_metadata
+
+    with open(os.path.join(artifacts_dir, 'model.json'), 'rt') as f:
+      model_json = json.load(f)
+    self.assertIn('training_config', model_json['modelTopology'])
+
   def testSavedModelSucceedsForExistingDirAndSequential(self):
     artifacts_dir = os.path.join(self._tmp_dir, 'artifacts')
     os.makedirs(artifacts_dir)
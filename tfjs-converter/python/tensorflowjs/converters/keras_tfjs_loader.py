@@ -207,7 +207,8 @@ def load_keras_model(config_json_path,
     if weights_path_prefix:
       weight_entries = read_weights.read_weights(weights_manifest,
                                                  weights_path_prefix,
-                                                 flatten=True)
+                                                 flatten=True,
+                                                 use_mmap=True)
     else:
       weight_entries = read_weights.decode_weights(weights_manifest,
                                                    weights_data_buffers,
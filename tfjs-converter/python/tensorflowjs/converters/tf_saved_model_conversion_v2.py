@@ -18,6 +18,7 @@ from __future__ import absolute_import
 from __future__ import division
 from __future__ import print_function
 
+import heapq
 import json
 import os
 
@@ -25,16 +26,20 @@ import numpy as np
 import tensorflow as tf
 from tensorflow.core.protobuf import device_properties_pb2
 from tensorflow.core.protobuf import config_pb2
+from tensorflow.core.protobuf import meta_graph_pb2
+from tensorflow.core.protobuf import rewriter_config_pb2
 from tensorflow.python.framework import convert_to_constants
 from tensorflow.python.grappler import cluster as gcluster
+from tensorflow.python.grappler import item as gitem
 from tensorflow.python.grappler import tf_optimizer
 from tensorflow.python.saved_model.load import load
 from tensorflow.python.training.saver import export_meta_graph
 from google.protobuf.json_format import MessageToDict
-import tensorflow_hub as hub
 
 from tensorflowjs import write_weights
 from tensorflowjs.converters import common
+from tensorflowjs.converters import conversion_profiler
+from tensorflowjs.converters import graph_rewrite
 
 # enable eager execution for v2 APIs
 tf.compat.v1.enable_eager_execution()
@@ -46,6 +51,29 @@ CLEARED_TENSOR_FIELDS = (
 
 _HUB_V1_MODULE_PB = "tfhub_module.pb"
 
+_OP_LIST_PATH = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), '../op_list/')
+_DEBUG_OPS = frozenset(['Assert', 'CheckNumerics', 'Print'])
+
+# Cache of the op names parsed from the op list JSON files.
+_supported_ops = None
+
+# The Grappler passes run by `optimize_graph`, in order.
+DEFAULT_GRAPPLER_OPTIMIZERS = (
+    'pruning', 'constfold', 'arithmetic', 'dependency', 'pruning', 'remap',
+    'constfold', 'arithmetic', 'dependency')
+
+# Grappler ignores unknown optimizer names, so check them up front.
+_GRAPPLER_OPTIMIZERS = frozenset([
+    'arithmetic', 'auto_parallel', 'constfold', 'debug_stripper',
+    'dependency', 'function', 'layout', 'loop', 'memory', 'pin_to_host',
+    'pruning', 'remap', 'scoped_allocator', 'shape'])
+
+# The device profiles Grappler optimizes for. 'webgl' stands for a GPU backend
+# and 'cpu' for the CPU and WASM backends, which, e.g., makes the remapper
+# apply its CPU-only fusions.
+TARGET_DEVICES = ('webgl', 'cpu')
+
 def load_graph(graph_filename):
   """Loads GraphDef. Returns Python Graph object.
 
@@ -62,15 +90,155 @@ def load_graph(graph_filename):
 
   return graph
 
-def get_cluster():
-  """Grappler optimization configuration for GPU."""
+def get_cluster(target_device='webgl'):
+  """Grappler optimization configuration for a target device.
+
+  Args:
+    target_device: The device profile to optimize for, one of
+      `TARGET_DEVICES`: 'webgl' for a GPU, 'cpu' for a single CPU core.
+
+  Returns:
+    A virtual Grappler cluster with the device.
+  """
   named_device = device_properties_pb2.NamedDevice()
-  named_device.name = '/GPU:0'
-  named_device.properties.type = 'GPU'
-  named_device.properties.environment['architecture'] = '4'
+  if target_device == 'webgl':
+    named_device.name = '/GPU:0'
+    named_device.properties.type = 'GPU'
+    named_device.properties.environment['architecture'] = '4'
+  elif target_device == 'cpu':
+    named_device.name = '/CPU:0'
+    named_device.properties.type = 'CPU'
+    named_device.properties.num_cores = 1
+    named_device.properties.frequency = 2000
+  else:
+    raise ValueError(
+        'Unsupported target device "%s". Supported devices: %s' %
+        (target_device, ', '.join(TARGET_DEVICES)))
   cluster = gcluster.Cluster(devices=[named_device])
   return cluster
 
+def get_grappler_optimizers(grappler_optimizers=None, strip_debug_ops=False):
+  """Gets the Grappler passes to optimize a graph with.
+
+  Args:
+    grappler_optimizers: An optional list of Grappler optimizer names, e.g.
+      ['pruning', 'constfold']. Defaults to `DEFAULT_GRAPPLER_OPTIMIZERS`.
+    strip_debug_ops: Bool whether to strip debug ops, which runs the
+      'debug_stripper' pass first.
+
+  Returns:
+    A list of Grappler optimizer names.
+
+  Raises:
+    ValueError: If an optimizer name is unknown.
+  """
+  if grappler_optimizers is None:
+    grappler_optimizers = DEFAULT_GRAPPLER_OPTIMIZERS
+  unknown = [name for name in grappler_optimizers
+             if name not in _GRAPPLER_OPTIMIZERS]
+  if unknown:
+    raise ValueError(
+        'Unknown Grappler optimizers: %s. Supported optimizers: %s' %
+        (', '.join(unknown), ', '.join(sorted(_GRAPPLER_OPTIMIZERS))))
+  optimizers = list(grappler_optimizers)
+  if strip_debug_ops and 'debug_stripper' not in optimizers:
+    optimizers.insert(0, 'debug_stripper')
+  return optimizers
+
+def _add_outputs_to_train_op(graph, output_node_names):
+  """Adds the outputs to the collection 'train_op' so Grappler keeps them."""
+  train_op = graph.get_collection('train_op')
+  for output in output_node_names:
+    op = graph.get_operation_by_name(output)
+    if op not in train_op:
+      graph.add_to_collection('train_op', op)
+
+def _get_rewriter_config(optimizers, single_iteration=False):
+  config = config_pb2.ConfigProto()
+  rewriter_config = config.graph_options.rewrite_options
+  rewriter_config.optimizers[:] = optimizers
+  if single_iteration:
+    rewriter_config.meta_optimizer_iterations = (
+        rewriter_config_pb2.RewriterConfig.ONE)
+  return config
+
+def _get_graph_cost(meta_graph, cluster):
+  """Gets the node count and estimated run time of a graph on a cluster."""
+  _, run_time, _ = cluster.MeasureCosts(gitem.Item(meta_graph))
+  return {
+      'numNodes': len(meta_graph.graph_def.node),
+      'estimatedCostSeconds': run_time,
+  }
+
+def evaluate_grappler_optimizers(graph, output_node_names,
+                                 grappler_optimizers=None,
+                                 target_device='webgl',
+                                 strip_debug_ops=False):
+  """Reports the effect of each Grappler pass on a frozen graph.
+
+  The passes are applied one by one, once each, and the node count and the
+  run time estimated by Grappler's analytical cost model for the target
+  device are reported before the first pass and after every pass. Grappler
+  itself runs the whole list of passes twice in `optimize_graph`, so the
+  final graph may differ slightly.
+
+  Args:
+    graph: The frozen graph to optimize.
+    output_node_names: List of output node names.
+    grappler_optimizers: An optional list of Grappler optimizer names.
+      Defaults to `DEFAULT_GRAPPLER_OPTIMIZERS`.
+    target_device: The device profile to optimize for (see `get_cluster`).
+    strip_debug_ops: Bool whether to strip debug ops.
+
+  Returns:
+    A list of dicts with the keys 'pass' (`None` for the input graph),
+    'numNodes' and 'estimatedCostSeconds'.
+  """
+  optimizers = get_grappler_optimizers(grappler_optimizers, strip_debug_ops)
+  cluster = get_cluster(target_device)
+  _add_outputs_to_train_op(graph, output_node_names)
+  input_meta_graph = export_meta_graph(
+      graph_def=graph.as_graph_def(), graph=graph)
+
+  meta_graph = input_meta_graph
+  report = []
+  for optimizer in [None] + optimizers:
+    if optimizer is not None:
+      optimized_graph = tf_optimizer.OptimizeGraph(
+          _get_rewriter_config([optimizer], single_iteration=True),
+          meta_graph, cluster=cluster)
+      meta_graph = meta_graph_pb2.MetaGraphDef()
+      meta_graph.CopyFrom(input_meta_graph)
+      meta_graph.graph_def.CopyFrom(optimized_graph)
+    stats = _get_graph_cost(meta_graph, cluster)
+    stats['pass'] = optimizer
+    report.append(stats)
+  return report
+
+def get_supported_ops():
+  """Gets the names of the TensorFlow ops supported by TensorFlow.js.
+
+  The op list JSON files are parsed on the first call only. Call
+  `clear_supported_ops_cache()` if they change during the process lifetime.
+
+  Returns:
+    A frozenset of TensorFlow op names.
+  """
+  global _supported_ops
+  if _supported_ops is None:
+    ops = []
+    for filename in sorted(os.listdir(_OP_LIST_PATH)):
+      if os.path.splitext(filename)[1] == '.json':
+        with open(os.path.join(_OP_LIST_PATH, filename)) as json_data:
+          ops += json.load(json_data)
+    _supported_ops = frozenset(x['tfOpName'] for x in ops)
+  return _supported_ops
+
+def clear_supported_ops_cache():
+  """Clears the op names cached by `get_supported_ops()`."""
+  global _supported_ops
+  _supported_ops = None
+
 def validate(nodes, skip_op_check, strip_debug_ops):
   """Validate if the node's op is compatible with TensorFlow.js.
 
@@ -81,23 +249,19 @@ def validate(nodes, skip_op_check, strip_debug_ops):
   """
   if skip_op_check:
     return set()
-  ops = []
-  op_list_path = os.path.join(
-      os.path.dirname(os.path.abspath(__file__)), '../op_list/')
-  for filename in os.listdir(op_list_path):
-    if os.path.splitext(filename)[1] == '.json':
-      with open(os.path.join(op_list_path, filename)) as json_data:
-        ops += json.load(json_data)
-
-  names = {x['tfOpName'] for x in ops}
+
+  names = get_supported_ops()
   if strip_debug_ops:
-    names = names.union({'Assert', 'CheckNumerics', 'Print'})
+    names = names.union(_DEBUG_OPS)
   not_supported = {x.op for x in [x for x in nodes if x.op not in names]}
   return not_supported
 
 def optimize_graph(graph, output_node_names, output_graph, tf_version,
                    quantization_dtype=None, skip_op_check=False,
-                   strip_debug_ops=False):
+                   strip_debug_ops=False, topological_order=False,
+                   profiler=None, grappler_optimizers=None,
+                   target_device='webgl', optimizer_report_path=None,
+                   fold_batch_norms=True):
   """Takes a Python Graph object and optimizes the graph.
 
   Args:
@@ -106,52 +270,142 @@ def optimize_graph(graph, output_node_names, output_graph, tf_version,
     output_graph: The location of the output graph.
     tf_version: Tensorflow version of the input graph.
     quantization_dtype: An optional numpy dtype to quantize weights to for
-      compression. Only np.uint8 and np.uint16 are supported.
+      compression. Only np.uint8, np.uint16 and np.float16 are supported.
     skip_op_check: Bool whether to skip the op check.
     strip_debug_ops: Bool whether to strip debug ops.
+    topological_order: Bool whether to order the weights by the execution
+      order of the nodes that use them.
+    profiler: An optional `conversion_profiler.ConversionProfiler` to record
+      the cost of the validation, optimization, weight extraction and writing
+      stages in.
+    grappler_optimizers: An optional list of the Grappler passes to run, in
+      order. Defaults to `DEFAULT_GRAPPLER_OPTIMIZERS`.
+    target_device: The device profile Grappler optimizes for, one of
+      `TARGET_DEVICES`.
+    optimizer_report_path: An optional path of a JSON file to write the node
+      count and estimated cost of the graph before and after each Grappler
+      pass to (see `evaluate_grappler_optimizers`). This runs the passes an
+      extra time.
+    fold_batch_norms: Bool whether to fold the batch normalizations that
+      Grappler leaves into the weights of the preceding convolutions and
+      matrix multiplications (see `graph_rewrite.fold_batch_norms`).
   """
+  optimizers = get_grappler_optimizers(grappler_optimizers, strip_debug_ops)
+  cluster = get_cluster(target_device)
 
   # Add a collection 'train_op' so that Grappler knows the outputs.
-  for output in output_node_names:
-    graph.add_to_collection('train_op', graph.get_operation_by_name(output))
-
-  graph_def = graph.as_graph_def()
-  unsupported = validate(graph_def.node, skip_op_check,
-                         strip_debug_ops)
+  _add_outputs_to_train_op(graph, output_node_names)
+
+  with conversion_profiler.stage(profiler, 'validate') as counts:
+    graph_def = graph.as_graph_def()
+    unsupported = validate(graph_def.node, skip_op_check,
+                           strip_debug_ops)
+    counts['numNodes'] = len(graph_def.node)
+    counts['numBytes'] = graph_def.ByteSize()
   if unsupported:
     raise ValueError('Unsupported Ops in the model before optimization\n' +
                      ', '.join(unsupported))
 
-  config = config_pb2.ConfigProto()
-  rewriter_config = config.graph_options.rewrite_options
-  rewriter_config.optimizers[:] = [
-      'pruning', 'constfold', 'arithmetic', 'dependency', 'pruning', 'remap',
-      'constfold', 'arithmetic', 'dependency'
-  ]
-  if strip_debug_ops:
-    rewriter_config.optimizers.insert(0, 'debug_stripper')
-  meta_graph = export_meta_graph(
-      graph_def=graph_def, graph=graph)
-
-  optimized_graph = tf_optimizer.OptimizeGraph(
-      config, meta_graph, cluster=get_cluster())
-
-  unsupported = validate(optimized_graph.node, skip_op_check,
-                         strip_debug_ops)
+  if optimizer_report_path:
+    report = evaluate_grappler_optimizers(
+        graph, output_node_names, grappler_optimizers=optimizers,
+        target_device=target_device)
+    with open(optimizer_report_path, 'wt') as f:
+      json.dump(report, f, indent=2)
+
+  with conversion_profiler.stage(profiler, 'optimize') as counts:
+    meta_graph = export_meta_graph(
+        graph_def=graph_def, graph=graph)
+
+    optimized_graph = tf_optimizer.OptimizeGraph(
+        _get_rewriter_config(optimizers), meta_graph, cluster=cluster)
+    counts['numNodes'] = len(optimized_graph.node)
+    counts['numBytes'] = optimized_graph.ByteSize()
+
+  # Grappler leaves some batch normalizations unfolded (e.g., after depthwise
+  # convolutions), each of which costs extra kernel dispatches in the browser.
+  if fold_batch_norms:
+    with conversion_profiler.stage(profiler, 'fold_batch_norms') as counts:
+      num_removed = graph_rewrite.fold_batch_norms(
+          optimized_graph, output_node_names)
+      counts['numNodes'] = len(optimized_graph.node)
+      counts['numNodesRemoved'] = num_removed
+    if num_removed:
+      print('Removed %d nodes by folding batch normalizations into weights.' %
+            num_removed)
+
+  with conversion_profiler.stage(profiler, 'validate_optimized') as counts:
+    unsupported = validate(optimized_graph.node, skip_op_check,
+                           strip_debug_ops)
+    counts['numNodes'] = len(optimized_graph.node)
 
   if unsupported:
     raise ValueError('Unsupported Ops in the model after optimization\n' +
                      ', '.join(unsupported))
 
   extract_weights(
-      optimized_graph, output_graph, tf_version, quantization_dtype)
+      optimized_graph, output_graph, tf_version, quantization_dtype,
+      topological_order=topological_order, profiler=profiler)
   return optimize_graph
 
 
+def _get_node_input_name(input_name):
+  """Get the node name of a node input (e.g., 'foo' for '^foo' or 'foo:1')."""
+  return input_name.lstrip('^').split(':')[0]
+
+
+def get_constants_in_execution_order(graph_def):
+  """Get the Const nodes of a GraphDef in the order they are first used.
+
+  The nodes are sorted topologically, keeping the order of the GraphDef for
+  nodes that do not depend on each other, and each constant is placed at its
+  first consumer. Unused constants come last.
+
+  Args:
+    graph_def: tf.GraphDef TensorFlow GraphDef proto object.
+
+  Returns:
+    A list of the Const nodes of `graph_def`.
+  """
+  nodes = graph_def.node
+  indices = {node.name: i for i, node in enumerate(nodes)}
+  consumers = [[] for _ in nodes]
+  num_inputs = [0] * len(nodes)
+  for i, node in enumerate(nodes):
+    for input_index in set(
+        indices.get(_get_node_input_name(name)) for name in node.input):
+      if input_index is not None:
+        consumers[input_index].append(i)
+        num_inputs[i] += 1
+
+  ready = [i for i, count in enumerate(num_inputs) if not count]
+  heapq.heapify(ready)
+  constants = []
+  seen = set()
+  while ready:
+    i = heapq.heappop(ready)
+    for name in nodes[i].input:
+      input_index = indices.get(_get_node_input_name(name))
+      if (input_index is not None and input_index not in seen and
+          nodes[input_index].op == 'Const'):
+        seen.add(input_index)
+        constants.append(nodes[input_index])
+    for consumer in consumers[i]:
+      num_inputs[consumer] -= 1
+      if not num_inputs[consumer]:
+        heapq.heappush(ready, consumer)
+  constants += [
+      node for i, node in enumerate(nodes)
+      if node.op == 'Const' and i not in seen]
+  return constants
+
+
 def extract_weights(graph_def,
                     output_graph,
                     tf_version,
-                    quantization_dtype=None):
+                    quantization_dtype=None,
+                    topological_order=False,
+                    profiler=None):
   """Takes a Python GraphDef object and extract the weights.
 
   Args:
@@ -159,45 +413,51 @@ def extract_weights(graph_def,
       the model topology.
     tf_version: Tensorflow version of the input graph.
     quantization_dtype: An optional numpy dtype to quantize weights to for
-        compression. Only np.uint8 and np.uint16 are supported.
+        compression. Only np.uint8, np.uint16 and np.float16 are supported.
+    topological_order: Bool whether to order the weights by the execution
+      order of the nodes that use them, instead of the order of the GraphDef.
+      Shards then hold the weights of the first layers first, so runtimes can
+      start on them while later shards are still being fetched.
+    profiler: An optional `conversion_profiler.ConversionProfiler` to record
+      the cost of the weight extraction and writing stages in.
   """
-  constants = [node for node in graph_def.node if node.op == 'Const']
-  const_inputs = {}
-  # removed the conditional inputs for constants
-  for const in constants:
-    const_inputs[const.name] = const.input[:]
-    del const.input[:]
+  with conversion_profiler.stage(profiler, 'extract_weights') as counts:
+    if topological_order:
+      constants = get_constants_in_execution_order(graph_def)
+    else:
+      constants = [node for node in graph_def.node if node.op == 'Const']
 
-  print('Writing weight file ' + output_graph + '...')
-  const_manifest = []
+    print('Writing weight file ' + output_graph + '...')
+    const_manifest = []
 
-  graph = tf.Graph()
-  with tf.compat.v1.Session(graph=graph) as sess:
-    tf.import_graph_def(graph_def, name='')
     for const in constants:
-      tensor = graph.get_tensor_by_name(const.name + ':0')
-      value = tensor.eval(session=sess)
+      # Decode the value straight from the TensorProto, which avoids importing
+      # the graph and evaluating every constant in a session.
+      value = tf.make_ndarray(const.attr['value'].tensor)
       if not isinstance(value, np.ndarray):
         value = np.array(value)
 
       const_manifest.append({'name': const.name, 'data': value})
 
-      # Restore the conditional inputs
-      const.input[:] = const_inputs[const.name]
-
       # Remove the binary array from tensor and save it to the external file.
       for field_name in CLEARED_TENSOR_FIELDS:
         const.attr["value"].tensor.ClearField(field_name)
 
-  write_artifacts(MessageToDict(graph_def), [const_manifest], output_graph,
-                  tf_version, quantization_dtype=quantization_dtype)
+    topology = MessageToDict(graph_def)
+    counts['numWeights'] = len(const_manifest)
+    counts['numBytes'] = sum(entry['data'].nbytes for entry in const_manifest)
+
+  write_artifacts(topology, [const_manifest], output_graph,
+                  tf_version, quantization_dtype=quantization_dtype,
+                  profiler=profiler)
 
 
 def write_artifacts(topology,
                     weights,
                     output_graph,
                     tf_version,
-                    quantization_dtype=None):
+                    quantization_dtype=None,
+                    profiler=None):
   """Writes weights and topology to the output_dir.
 
   If `topology` is Falsy (e.g., `None`), only emit weights to output_dir.
@@ -209,24 +469,31 @@ def write_artifacts(topology,
     output_graph: the output file name to hold all the contents.
     tf_version: Tensorflow version of the input graph.
     quantization_dtype: An optional numpy dtype to quantize weights to for
-      compression. Only np.uint8 and np.uint16 are supported.
+      compression. Only np.uint8, np.uint16 and np.float16 are supported.
+    profiler: An optional `conversion_profiler.ConversionProfiler` to record
+      the cost of writing the artifacts in.
   """
-  model_json = {
-      common.FORMAT_KEY: common.TFJS_GRAPH_MODEL_FORMAT,
-      # TODO(piyu): Add tensorflow version below by using `meta_info_def`.
-      common.GENERATED_BY_KEY: tf_version,
-      common.CONVERTED_BY_KEY: common.get_converted_by(),
-  }
-
-  model_json[common.ARTIFACT_MODEL_TOPOLOGY_KEY] = topology or None
-  weights_manifest = write_weights.write_weights(
-      weights, os.path.dirname(output_graph), write_manifest=False,
-      quantization_dtype=quantization_dtype)
-  assert isinstance(weights_manifest, list)
-  model_json[common.ARTIFACT_WEIGHTS_MANIFEST_KEY] = weights_manifest
-
-  with open(output_graph, 'wt') as f:
-    json.dump(model_json, f)
+  with conversion_profiler.stage(profiler, 'write_artifacts') as counts:
+    model_json = {
+        common.FORMAT_KEY: common.TFJS_GRAPH_MODEL_FORMAT,
+        # TODO(piyu): Add tensorflow version below by using `meta_info_def`.
+        common.GENERATED_BY_KEY: tf_version,
+        common.CONVERTED_BY_KEY: common.get_converted_by(),
+    }
+
+    model_json[common.ARTIFACT_MODEL_TOPOLOGY_KEY] = topology or None
+    output_dir = os.path.dirname(output_graph)
+    weights_manifest = write_weights.write_weights(
+        weights, output_dir, write_manifest=False,
+        quantization_dtype=quantization_dtype)
+    assert isinstance(weights_manifest, list)
+    model_json[common.ARTIFACT_WEIGHTS_MANIFEST_KEY] = weights_manifest
+
+    with open(output_graph, 'wt') as f:
+      json.dump(model_json, f)
+    counts['numBytes'] = os.path.getsize(output_graph) + sum(
+        os.path.getsize(os.path.join(output_dir, path))
+        for group in weights_manifest for path in group['paths'])
 
 
 def _check_signature_in_model(saved_model, signature_name):
@@ -255,7 +522,13 @@ def convert_tf_saved_model(saved_model_dir,
                            saved_model_tags='serve',
                            quantization_dtype=None,
                            skip_op_check=False,
-                           strip_debug_ops=False):
+                           strip_debug_ops=False,
+                           topological_order=False,
+                           profiler=None,
+                           grappler_optimizers=None,
+                           target_device='webgl',
+                           optimizer_report_path=None,
+                           fold_batch_norms=True):
   """Freeze the SavedModel and check the model compatibility with Tensorflow.js.
 
   Optimize and convert the model to Tensorflow.js format, when the model passes
@@ -272,9 +545,23 @@ def convert_tf_saved_model(saved_model_dir,
       'serving_default'.
     saved_model_tags: tags of the GraphDef to load. Defaults to 'serve'.
     quantization_dtype: An optional numpy dtype to quantize weights to for
-      compression. Only np.uint8 and np.uint16 are supported.
+      compression. Only np.uint8, np.uint16 and np.float16 are supported.
     skip_op_check: Bool whether to skip the op check.
     strip_debug_ops: Bool whether to strip debug ops.
+    topological_order: Bool whether to order the weights by the execution
+      order of the nodes that use them.
+    profiler: An optional `conversion_profiler.ConversionProfiler` to record
+      the wall time, CPU time, peak memory use, node counts and sizes of the
+      stages of the conversion in.
+    grappler_optimizers: An optional list of the Grappler passes to run, in
+      order. Defaults to `DEFAULT_GRAPPLER_OPTIMIZERS`.
+    target_device: The device profile Grappler optimizes for, one of
+      `TARGET_DEVICES`: 'webgl' (default) or 'cpu' (also for WASM).
+    optimizer_report_path: An optional path of a JSON file to write the node
+      count and estimated cost of the graph before and after each Grappler
+      pass to.
+    fold_batch_norms: Bool whether to fold the batch normalizations that
+      Grappler leaves into the weights.
   """
   if signature_def is None:
     signature_def = 'serving_default'
@@ -285,11 +572,13 @@ def convert_tf_saved_model(saved_model_dir,
       output_dir, common.ARTIFACT_MODEL_JSON_FILE_NAME)
 
   saved_model_tags = saved_model_tags.split(', ')
-  model = load(saved_model_dir, saved_model_tags)
+  with conversion_profiler.stage(profiler, 'load') as counts:
+    model = load(saved_model_dir, saved_model_tags)
 
-  _check_signature_in_model(model, signature_def)
+    _check_signature_in_model(model, signature_def)
 
-  concrete_func = model.signatures[signature_def]
+    concrete_func = model.signatures[signature_def]
+    counts['numNodes'] = len(concrete_func.graph.get_operations())
   output_node_names = []
   for output_tensor in concrete_func.outputs:
     output_node_names.append(output_tensor.name.split(':')[0])
@@ -297,17 +586,25 @@ def convert_tf_saved_model(saved_model_dir,
   # TensorFlow doesn't encode the saved model version in the graph in a reliable
   # way. Try to freeze the graph using V2 utils. If that fails, freeze the
   # graph using V1 utils.
-  try:
-    frozen_graph = _freeze_saved_model_v2(concrete_func)
-  except BaseException:
-    frozen_graph = _freeze_saved_model_v1(
-        concrete_func.graph, output_node_names)
+  with conversion_profiler.stage(profiler, 'freeze') as counts:
+    try:
+      frozen_graph = _freeze_saved_model_v2(concrete_func)
+    except BaseException:
+      frozen_graph = _freeze_saved_model_v1(
+          concrete_func.graph, output_node_names)
+    counts['numNodes'] = len(frozen_graph.get_operations())
 
   optimize_graph(frozen_graph, output_node_names, output_graph,
                  model.tensorflow_version,
                  quantization_dtype=quantization_dtype,
                  skip_op_check=skip_op_check,
-                 strip_debug_ops=strip_debug_ops)
+                 strip_debug_ops=strip_debug_ops,
+                 topological_order=topological_order,
+                 profiler=profiler,
+                 grappler_optimizers=grappler_optimizers,
+                 target_device=target_device,
+                 optimizer_report_path=optimizer_report_path,
+                 fold_batch_norms=fold_batch_norms)
 
 def load_and_initialize_hub_module(module_path, signature='default'):
   """Loads graph of a TF-Hub module and initializes it into a session.
@@ -325,6 +622,8 @@ def load_and_initialize_hub_module(module_path, signature='default'):
   Raises:
     ValueError: If signature contains a SparseTensor on input or output.
   """
+  import tensorflow_hub as hub
+
   graph = tf.Graph()
   with graph.as_default():
     tf.compat.v1.logging.info('Importing %s', module_path)
@@ -432,6 +731,8 @@ def convert_tf_hub_module(module_handle, output_dir,
     skip_op_check: Bool whether to skip the op check.
     strip_debug_ops: Bool whether to strip debug ops.
   """
+  import tensorflow_hub as hub
+
   module_path = hub.resolve(module_handle)
   # TODO(vbardiovskyg): We can remove this v1 code path once loading of all v1
   # modules is fixed on the TF side, or once the modules we cannot load become
@@ -22,6 +22,7 @@ import sys
 import tempfile
 import unittest
 
+import numpy as np
 import tensorflow as tf
 from tensorflow.python.eager import def_function
 from tensorflow.python.framework import constant_op
@@ -32,7 +33,9 @@ from tensorflow.python.training.tracking import tracking
 from tensorflow.python.saved_model.save import save
 import tensorflow_hub as hub
 
+from tensorflowjs import read_weights
 from tensorflowjs import version
+from tensorflowjs.converters import conversion_profiler
 from tensorflowjs.converters import tf_saved_model_conversion_v2
 
 SAVED_MODEL_DIR = 'saved_model'
@@ -289,6 +292,157 @@ class ConvertTest(unittest.TestCase):
         glob.glob(
             os.path.join(self._tmp_dir, SAVED_MODEL_DIR, 'group*-*')))
 
+  def test_extract_weights(self):
+    graph = tf.Graph()
+    with graph.as_default():
+      tf.compat.v1.constant(
+          np.arange(6, dtype=np.float32).reshape([2, 3]), name='content')
+      tf.compat.v1.constant(1.5, shape=[2, 2], name='splat')
+      tf.compat.v1.constant([3, 4], dtype=tf.int32, name='int_val')
+      tf.compat.v1.constant(['a', 'bc'], name='string_val')
+    graph_def = graph.as_graph_def()
+
+    output_graph = os.path.join(self._tmp_dir, 'model.json')
+    tf_saved_model_conversion_v2.extract_weights(
+        graph_def, output_graph, tf.__version__)
+
+    with open(output_graph, 'rt') as f:
+      model_json = json.load(f)
+    weights = read_weights.read_weights(
+        model_json['weightsManifest'], self._tmp_dir, flatten=True)
+    self.assertEqual(
+        ['content', 'splat', 'int_val', 'string_val'],
+        [weight['name'] for weight in weights])
+    np.testing.assert_array_equal(
+        weights[0]['data'], np.arange(6, dtype=np.float32).reshape([2, 3]))
+    np.testing.assert_array_equal(
+        weights[1]['data'], np.full([2, 2], 1.5, dtype=np.float32))
+    np.testing.assert_array_equal(
+        weights[2]['data'], np.array([3, 4], dtype=np.int32))
+    np.testing.assert_array_equal(
+        weights[3]['data'], np.array([b'a', b'bc'], 'object'))
+    # The values are moved out of the topology.
+    for node in model_json['modelTopology']['node']:
+      self.assertNotIn('tensorContent', node['attr']['value']['tensor'])
+
+  def test_extract_weights_in_topological_order(self):
+    graph = tf.Graph()
+    with graph.as_default():
+      w2 = tf.compat.v1.constant(np.ones([2, 2], np.float32), name='w2')
+      tf.compat.v1.constant(np.ones([3], np.float32), name='unused')
+      w1 = tf.compat.v1.constant(np.ones([2, 2], np.float32), name='w1')
+      x = tf.compat.v1.placeholder(tf.float32, shape=[1, 2], name='x')
+      y = tf.matmul(x, w1, name='y')
+      tf.matmul(y, w2, name='z')
+    graph_def = graph.as_graph_def()
+
+    self.assertEqual(
+        ['w1', 'w2', 'unused'],
+        [node.name for node in
+         tf_saved_model_conversion_v2.get_constants_in_execution_order(
+             graph_def)])
+
+    output_graph = os.path.join(self._tmp_dir, 'model.json')
+    tf_saved_model_conversion_v2.extract_weights(
+        graph_def, output_graph, tf.__version__, topological_order=True)
+
+    with open(output_graph, 'rt') as f:
+      model_json = json.load(f)
+    self.assertEqual(
+        ['w1', 'w2', 'unused'],
+        [weight['name']
+         for weight in model_json['weightsManifest'][0]['weights']])
+
+  def test_convert_saved_model_with_profiler(self):
+    self._create_saved_model()
+    profiler = conversion_profiler.ConversionProfiler()
+
+    tf_saved_model_conversion_v2.convert_tf_saved_model(
+        os.path.join(self._tmp_dir, SAVED_MODEL_DIR),
+        os.path.join(self._tmp_dir, SAVED_MODEL_DIR),
+        profiler=profiler)
+
+    stages = profiler.stages
+    self.assertEqual(
+        ['load', 'freeze', 'validate', 'optimize', 'fold_batch_norms',
+         'validate_optimized', 'extract_weights', 'write_artifacts'],
+        [stage['name'] for stage in stages])
+    for stage in stages:
+      self.assertGreaterEqual(stage['wallTimeSeconds'], 0)
+      self.assertGreaterEqual(stage['cpuTimeSeconds'], 0)
+    self.assertGreater(stages[3]['numNodes'], 0)
+    self.assertEqual(0, stages[4]['numNodesRemoved'])
+    self.assertEqual(1, stages[6]['numWeights'])
+    self.assertEqual(4, stages[6]['numBytes'])
+    tfjs_path = os.path.join(self._tmp_dir, SAVED_MODEL_DIR)
+    self.assertEqual(
+        os.path.getsize(os.path.join(tfjs_path, 'model.json')) +
+        os.path.getsize(os.path.join(tfjs_path, 'group1-shard1of1.bin')),
+        stages[7]['numBytes'])
+
+  def test_convert_saved_model_without_batch_norm_folding(self):
+    self._create_saved_model()
+    profiler = conversion_profiler.ConversionProfiler()
+
+    tf_saved_model_conversion_v2.convert_tf_saved_model(
+        os.path.join(self._tmp_dir, SAVED_MODEL_DIR),
+        os.path.join(self._tmp_dir, SAVED_MODEL_DIR),
+        profiler=profiler, fold_batch_norms=False)
+
+    self.assertNotIn('fold_batch_norms',
+                     [stage['name'] for stage in profiler.stages])
+
+  def test_convert_saved_model_with_grappler_optimizers(self):
+    self._create_saved_model()
+    tfjs_path = os.path.join(self._tmp_dir, 'tfjs')
+    report_path = os.path.join(self._tmp_dir, 'optimizer_report.json')
+
+    tf_saved_model_conversion_v2.convert_tf_saved_model(
+        os.path.join(self._tmp_dir, SAVED_MODEL_DIR), tfjs_path,
+        grappler_optimizers=['pruning', 'constfold'], target_device='cpu',
+        optimizer_report_path=report_path)
+
+    with open(report_path, 'rt') as f:
+      report = json.load(f)
+    self.assertEqual([None, 'pruning', 'constfold'],
+                     [entry['pass'] for entry in report])
+    for entry in report:
+      self.assertGreater(entry['numNodes'], 0)
+      self.assertGreaterEqual(entry['estimatedCostSeconds'], 0)
+    # Constant folding merges the variables into a single weight.
+    self.assertLess(report[2]['numNodes'], report[1]['numNodes'])
+    with open(os.path.join(tfjs_path, 'model.json'), 'rt') as f:
+      model_json = json.load(f)
+    self.assertEqual(1, len(model_json['weightsManifest'][0]['weights']))
+
+  def test_get_grappler_optimizers(self):
+    self.assertEqual(
+        list(tf_saved_model_conversion_v2.DEFAULT_GRAPPLER_OPTIMIZERS),
+        tf_saved_model_conversion_v2.get_grappler_optimizers())
+    self.assertEqual(
+        ['debug_stripper', 'constfold'],
+        tf_saved_model_conversion_v2.get_grappler_optimizers(
+            ['constfold'], strip_debug_ops=True))
+    with self.assertRaisesRegexp(  # pylint: disable=deprecated-method
+        ValueError, r'Unknown Grappler optimizers: constfolding'):
+      tf_saved_model_conversion_v2.get_grappler_optimizers(['constfolding'])
+
+  def test_get_cluster_with_unsupported_target_device(self):
+    with self.assertRaisesRegexp(  # pylint: disable=deprecated-method
+        ValueError, r'Unsupported target device "tpu"'):
+      tf_saved_model_conversion_v2.get_cluster('tpu')
+
+  def test_supported_ops_are_cached(self):
+    tf_saved_model_conversion_v2.clear_supported_ops_cache()
+    ops = tf_saved_model_conversion_v2.get_supported_ops()
+    self.assertIsInstance(ops, frozenset)
+    self.assertIn('MatMul', ops)
+    self.assertIs(ops, tf_saved_model_conversion_v2.get_supported_ops())
+
+    tf_saved_model_conversion_v2.clear_supported_ops_cache()
+    self.assertIsNot(ops, tf_saved_model_conversion_v2.get_supported_ops())
+    self.assertEqual(ops, tf_saved_model_conversion_v2.get_supported_ops())
+
   def test_optimizer_add_unsupported_op(self):
     self._create_unsupported_saved_model()
     with self.assertRaisesRegexp(  # pylint: disable=deprecated-method
@@ -20,8 +20,11 @@ import numpy as np
 
 QUANTIZATION_BYTES_TO_DTYPES = {1: np.uint8, 2: np.uint16}
 
+# Number of elements de-quantized at a time by `dequantize_weights`.
+_DEQUANTIZATION_CHUNK_SIZE = 64 * 1024
 
-def quantize_weights(data, quantization_dtype):
+
+def quantize_weights(data, quantization_dtype, axis=None):
   """Quantizes the weights by linearly re-scaling across available bits.
 
   The weights are quantized by linearly re-scaling the values between the
@@ -34,10 +37,18 @@ def quantize_weights(data, quantization_dtype):
   Weights can be de-quantized by multiplying by the returned `scale` and adding
   `min`.
 
+  If `axis` is given, a separate range is computed for every slice of `data`
+  along that axis (e.g., for every output channel of a convolution kernel),
+  and `scale` and `min_val` are returned as 1-D arrays with one value per
+  slice. This keeps channels with a small range from losing their precision
+  to an outlier channel.
+
   Args:
     data: A numpy array of dtype 'float32' or 'int32'.
     quantization_dtype: A numpy dtype to quantize weights to. Only np.uint8 and
       np.uint16 are supported.
+    axis: An optional axis of `data` to quantize along (Default: `None`, i.e.,
+      a single range for the whole array).
 
   Returns:
     quantized_data: The quantized weights as a numpy array with dtype
@@ -45,10 +56,13 @@ def quantize_weights(data, quantization_dtype):
     scale: The linearly scaling constant used for quantization.
     min_val: The minimum value of the linear range.
   Raises:
-    ValueError: if `quantization_dtype` is not a valid type.
+    ValueError: if `quantization_dtype` is not a valid type, or if `axis` is
+      out of range for `data`.
   """
   if quantization_dtype not in QUANTIZATION_BYTES_TO_DTYPES.values():
     raise ValueError('Invalid `quantization_dtype`: %r' % quantization_dtype)
+  if axis is not None:
+    return _quantize_weights_per_axis(data, quantization_dtype, axis)
 
   # Compute the min and max for the group.
   min_val = data.min().astype(np.float64)
@@ -68,9 +82,125 @@ def quantize_weights(data, quantization_dtype):
   return quantized_data, scale, min_val
 
 
-def dequantize_weights(
-    quantized_data, scale, min_val, original_dtype=np.float32):
-  return np.round(quantized_data * scale + min_val).astype(original_dtype)
+def _quantize_weights_per_axis(data, quantization_dtype, axis):
+  """Quantizes every slice of `data` along `axis` with its own range."""
+  axis = _normalize_axis(axis, data.ndim)
+  reduction_axes = tuple(i for i in range(data.ndim) if i != axis)
+  min_val = data.min(axis=reduction_axes).astype(np.float64)
+  max_val = data.max(axis=reduction_axes).astype(np.float64)
+
+  # Slices holding a single value are represented as zeros, as above. They get
+  # a dummy range here to avoid dividing by a zero scale.
+  is_constant = min_val == max_val
+  scale, nudged_min, nudged_max = _get_quantization_range(
+      min_val, np.where(is_constant, min_val + 1, max_val),
+      quantization_dtype)
+  scale = np.where(is_constant, 1.0, scale)
+  nudged_min = np.where(is_constant, min_val, nudged_min)
+  nudged_max = np.where(is_constant, min_val, nudged_max)
+
+  broadcast_shape = _get_broadcast_shape(axis, data.ndim)
+  nudged_min_b = nudged_min.reshape(broadcast_shape)
+  quantized_data = np.round(
+      (np.clip(data, nudged_min_b, nudged_max.reshape(broadcast_shape)) -
+       nudged_min_b) / scale.reshape(broadcast_shape)).astype(
+           quantization_dtype)
+  return quantized_data, scale, nudged_min
+
+
+def dequantize_weights(quantized_data, scale, min_val,
+                       original_dtype=np.float32, axis=None, out=None):
+  """De-quantizes weights produced by `quantize_weights`.
+
+  The values are computed the same way as by the TensorFlow.js runtime, i.e.,
+  `quantized_data * scale + min_val` in double precision, stored once into
+  `original_dtype` and rounded (half up) only if that is an integer type.
+
+  The computation is done in chunks of `_DEQUANTIZATION_CHUNK_SIZE` elements
+  with a reused scratch buffer, so apart from the result, memory use does not
+  grow with the size of the weights.
+
+  Args:
+    quantized_data: The quantized weights as a numpy array.
+    scale: The linear scaling constant used for quantization, or a sequence
+      of them (one per slice along `axis`).
+    min_val: The minimum value of the linear range, or a sequence of them
+      (one per slice along `axis`).
+    original_dtype: The numpy dtype of the de-quantized weights.
+    axis: The axis the weights were quantized along, if they were quantized
+      per axis (Default: `None`).
+    out: An optional C-contiguous numpy array with the shape of
+      `quantized_data` and dtype `original_dtype` to write the result to,
+      e.g., to reuse one buffer for several weights.
+
+  Returns:
+    The de-quantized weights as a numpy array with dtype `original_dtype`
+    (`out`, if given).
+
+  Raises:
+    ValueError: if `out` does not match `quantized_data` and
+      `original_dtype`.
+  """
+  original_dtype = np.dtype(original_dtype)
+  if out is None:
+    out = np.empty(quantized_data.shape, dtype=original_dtype)
+  elif (out.shape != quantized_data.shape or out.dtype != original_dtype or
+        not out.flags.c_contiguous):
+    raise ValueError(
+        'Expected `out` to be a C-contiguous array of shape %s and dtype %s, '
+        'but got shape %s and dtype %s.' %
+        (quantized_data.shape, original_dtype.name, out.shape, out.dtype.name))
+
+  scale = np.asarray(scale, dtype=np.float64)
+  min_val = np.asarray(min_val, dtype=np.float64)
+  if axis is None:
+    # Rows of a single element, all with the same range.
+    row_size = 1
+    num_ranges = 1
+  else:
+    axis = _normalize_axis(axis, quantized_data.ndim)
+    # Rows of contiguous elements that lie in the same slice along `axis`.
+    row_size = int(np.prod(quantized_data.shape[axis + 1:]))
+    num_ranges = quantized_data.shape[axis]
+  rows = np.ascontiguousarray(quantized_data).reshape(-1, row_size)
+  out_rows = out.reshape(-1, row_size)
+
+  rows_per_chunk = max(1, _DEQUANTIZATION_CHUNK_SIZE // max(1, row_size))
+  scratch = np.empty([min(rows_per_chunk, len(rows)), row_size], np.float64)
+  round_to_int = original_dtype.kind in 'iub'
+  for start in range(0, len(rows), rows_per_chunk):
+    stop = min(start + rows_per_chunk, len(rows))
+    chunk = scratch[:stop - start]
+    if axis is None:
+      chunk_scale, chunk_min = scale, min_val
+    else:
+      range_indices = np.arange(start, stop) % num_ranges
+      chunk_scale = scale[range_indices, np.newaxis]
+      chunk_min = min_val[range_indices, np.newaxis]
+    np.multiply(rows[start:stop], chunk_scale, out=chunk)
+    np.add(chunk, chunk_min, out=chunk)
+    if round_to_int:
+      # Math.round() in JavaScript rounds halves up, unlike np.round().
+      np.add(chunk, 0.5, out=chunk)
+      np.floor(chunk, out=chunk)
+    out_rows[start:stop] = chunk
+  return out
+
+
+def _normalize_axis(axis, ndim):
+  if not -ndim <= axis < ndim:
+    raise ValueError(
+        'Quantization axis %d is out of range for an array of rank %d' %
+        (axis, ndim))
+  return axis % ndim
+
+
+def _get_broadcast_shape(axis, ndim):
+  """Gets the shape that broadcasts a per-axis vector against an array."""
+  shape = [1] * ndim
+  shape[axis] = -1
+  return shape
+
 
 def _get_quantization_range(min_val, max_val, quantization_dtype):
   """Computes quantization range to ensure that zero is represented if covered.
@@ -83,8 +213,8 @@ def _get_quantization_range(min_val, max_val, quantization_dtype):
   nudge if 0 is not in the range.
 
   Args:
-    min_val: The actual minimum value of the data.
-    max_val: The actual maximum value of the data.
+    min_val: The actual minimum value of the data, or a 1-D array of them.
+    max_val: The actual maximum value of the data, or a 1-D array of them.
     quantization_dtype: A numpy dtype to quantize weights to. Only np.uint8 and
       np.uint16 are supported.
 
@@ -103,7 +233,14 @@ def _get_quantization_range(min_val, max_val, quantization_dtype):
   quant_max = np.iinfo(quantization_dtype).max
   scale = (max_val - min_val) / quant_max
 
-  if min_val <= 0 <= max_val:
+  if np.ndim(min_val):
+    # Per-axis ranges: nudge the ranges that cover zero, element-wise.
+    covers_zero = (min_val <= 0) & (0 <= max_val)
+    nudged_min = np.where(covers_zero, -np.round(-min_val / scale) * scale,
+                          min_val)
+    nudged_max = np.where(covers_zero, quant_max * scale + nudged_min,
+                          max_val)
+  elif min_val <= 0 <= max_val:
     quantized_zero_point = (0 - min_val) / scale
     nudged_zero_point = np.round(quantized_zero_point)
 
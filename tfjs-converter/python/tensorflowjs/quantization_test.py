@@ -33,7 +33,8 @@ class TestQuantizationUtil(unittest.TestCase):
     self.assertEqual(q.dtype, quantization_dtype)
 
     de_q = quantization.dequantize_weights(q, s, m, data_dtype)
-    np.testing.assert_allclose(de_q, d)
+    self.assertEqual(de_q.dtype, data_dtype)
+    np.testing.assert_allclose(de_q, d, atol=s / 2 + 1e-6)
 
     if range_min <= 0 <= range_max:
       d_0 = np.zeros(1, data_dtype)
@@ -90,6 +91,78 @@ class TestQuantizationUtil(unittest.TestCase):
     self._runQuantizeTest(1, 3, np.int32, np.uint8, expected_scale=2/255)
     self._runQuantizeTest(1, 3, np.int32, np.uint16, expected_scale=2/65536)
 
+  def testDequantizeFloatsIsNotRounded(self):
+    q = np.array([0, 1, 2, 255], dtype=np.uint8)
+    de_q = quantization.dequantize_weights(q, 0.1, -0.5, np.float32)
+    self.assertEqual(de_q.dtype, np.float32)
+    np.testing.assert_array_equal(
+        de_q, np.array([-0.5, -0.4, -0.3, 25.0], dtype=np.float32))
+
+  def testDequantizeIntsRoundsHalfUp(self):
+    q = np.array([0, 1, 2, 3], dtype=np.uint8)
+    de_q = quantization.dequantize_weights(q, 0.5, -1, np.int32)
+    self.assertEqual(de_q.dtype, np.int32)
+    # Matches Math.round() in JavaScript: -1, -0.5, 0, 0.5 -> -1, 0, 0, 1.
+    np.testing.assert_array_equal(de_q, [-1, 0, 0, 1])
+
+  def testDequantizeIntoOutputBuffer(self):
+    q = np.arange(12, dtype=np.uint16).reshape([3, 4])
+    out = np.empty([3, 4], dtype=np.float32)
+    de_q = quantization.dequantize_weights(q, 2.0, 1.0, np.float32, out=out)
+    self.assertIs(de_q, out)
+    np.testing.assert_array_equal(out, q * 2.0 + 1.0)
+
+    with self.assertRaises(ValueError):
+      quantization.dequantize_weights(
+          q, 2.0, 1.0, np.float32, out=np.empty([4, 3], dtype=np.float32))
+    with self.assertRaises(ValueError):
+      quantization.dequantize_weights(
+          q, 2.0, 1.0, np.float32, out=np.empty([3, 4], dtype=np.float64))
+
+  def testDequantizeInChunksMatchesUnchunked(self):
+    num_elements = quantization._DEQUANTIZATION_CHUNK_SIZE * 2 + 7
+    q = (np.arange(num_elements * 3) % 256).astype(np.uint8).reshape(
+        [num_elements, 3])
+    scale = np.array([0.01, 0.02, 0.03])
+    min_val = np.array([-1.0, 0.0, 1.0])
+    de_q = quantization.dequantize_weights(q, scale, min_val, axis=1)
+    np.testing.assert_array_equal(
+        de_q, (q * scale + min_val).astype(np.float32))
+    de_q = quantization.dequantize_weights(q.T, scale, min_val, axis=0)
+    np.testing.assert_array_equal(
+        de_q, (q.T * scale[:, np.newaxis] +
+               min_val[:, np.newaxis]).astype(np.float32))
+
+  def testQuantizePerAxis(self):
+    d = np.array([[0, -300], [1, 0], [2, 100], [3, 300]], dtype=np.float32)
+    q, s, m = quantization.quantize_weights(d, np.uint8, axis=1)
+    self.assertEqual(q.dtype, np.uint8)
+    self.assertEqual(q.shape, d.shape)
+    np.testing.assert_allclose(s, [3 / 255, 600 / 255])
+    np.testing.assert_array_equal(q[:, 0], [0, 85, 170, 255])
+
+    de_q = quantization.dequantize_weights(q, s, m, np.float32, axis=1)
+    self.assertEqual(de_q.dtype, np.float32)
+    np.testing.assert_allclose(de_q, d, atol=600 / 255)
+    np.testing.assert_array_equal(
+        de_q, quantization.dequantize_weights(q, s, m, np.float32, axis=-1))
+
+  def testQuantizePerAxisWithConstantSlice(self):
+    d = np.array([[5, 0], [5, 1], [5, 2]], dtype=np.float32)
+    q, s, m = quantization.quantize_weights(d, np.uint16, axis=-1)
+    np.testing.assert_array_equal(q[:, 0], [0, 0, 0])
+    self.assertEqual(s[0], 1.0)
+    self.assertEqual(m[0], 5.0)
+
+    de_q = quantization.dequantize_weights(q, s, m, np.float32, axis=-1)
+    np.testing.assert_array_equal(de_q[:, 0], d[:, 0])
+    np.testing.assert_allclose(de_q, d, atol=s[1] / 2)
+
+  def testQuantizePerAxisWithInvalidAxisRaisesError(self):
+    d = np.ones([2, 3], dtype=np.float32)
+    with self.assertRaises(ValueError):
+      quantization.quantize_weights(d, np.uint8, axis=2)
+
 
 if __name__ == '__main__':
   unittest.main()
@@ -18,20 +18,32 @@ from __future__ import absolute_import
 from __future__ import division
 from __future__ import print_function
 
-import io
+import bisect
+import collections
+import mmap
+from multiprocessing.pool import ThreadPool
 import os
+import struct
 
 import numpy as np
 from tensorflowjs import quantization
 
-_INPUT_DTYPES = [np.float32, np.int32, np.uint8, np.uint16, np.object]
+try:
+  from collections import abc as collections_abc
+except ImportError:  # Python 2.
+  collections_abc = collections
+
+_INPUT_DTYPES = [np.float32, np.int32, np.uint8, np.uint16, np.float16,
+                 np.object]
 
 # Number of bytes used to encode the length of a string in a string tensor.
 STRING_LENGTH_NUM_BYTES = 4
 # The data type used to encode the length of a string in a string tensor.
 STRING_LENGTH_DTYPE = np.dtype('uint32').newbyteorder('<')
+_STRING_LENGTH_STRUCT = struct.Struct('<I')
 
-def read_weights(weights_manifest, base_path, flatten=False):
+def read_weights(weights_manifest, base_path, flatten=False, use_mmap=False,
+                 max_workers=1):
   """Load weight values according to a TensorFlow.js weights manifest.
 
   Args:
@@ -39,6 +51,14 @@ def read_weights(weights_manifest, base_path, flatten=False):
     base_path: Base path prefix for the weights files.
     flatten: Whether all the weight groups in the return value are to be
       flattened as a single weights group. Default: `False`.
+    use_mmap: Whether to memory-map the weight files instead of reading them
+      into memory. If `True`, unquantized numeric weights are returned as
+      read-only numpy arrays backed by the mapped pages, except for weights
+      that span more than one file, which are copied once. Default: `False`.
+    max_workers: The number of threads used to read weight files
+      concurrently. This mostly helps on file systems with a high per-file
+      latency, such as NFS. Ignored if `use_mmap` is `True`. Default: 1, i.e.,
+      files are read one at a time.
 
   Returns:
     If `flatten` is `False`, a `list` of weight groups. Each group is an array
@@ -62,18 +82,99 @@ def read_weights(weights_manifest, base_path, flatten=False):
         type(weights_manifest))
 
   data_buffers = []
+  read_tasks = []
   for group in weights_manifest:
-    buff = io.BytesIO()
-    buff_writer = io.BufferedWriter(buff)
-    for path in group['paths']:
-      with open(os.path.join(base_path, path), 'rb') as f:
-        buff_writer.write(f.read())
-    buff_writer.flush()
-    buff_writer.seek(0)
-    data_buffers.append(buff.read())
+    paths = [os.path.join(base_path, path) for path in group['paths']]
+    if use_mmap:
+      data_buffers.append(_ShardedBuffer([_mmap_file(p) for p in paths]))
+      continue
+    # Each file is read straight into its slice of the group's buffer.
+    sizes = [os.path.getsize(path) for path in paths]
+    buff = bytearray(sum(sizes))
+    view = memoryview(buff)
+    offset = 0
+    for path, size in zip(paths, sizes):
+      read_tasks.append((path, view[offset:offset + size]))
+      offset += size
+    data_buffers.append(buff)
+
+  if max_workers > 1 and len(read_tasks) > 1:
+    pool = ThreadPool(min(max_workers, len(read_tasks)))
+    try:
+      pool.map(_read_file_into, read_tasks)
+    finally:
+      pool.close()
+      pool.join()
+  else:
+    for task in read_tasks:
+      _read_file_into(task)
   return decode_weights(weights_manifest, data_buffers, flatten=flatten)
 
 
+def _read_file_into(task):
+  """Reads a file into a writable buffer of the file's size.
+
+  Args:
+    task: A tuple of (path, buffer).
+  """
+  path, buff = task
+  offset = 0
+  with open(path, 'rb') as f:
+    while offset < len(buff):
+      num_bytes = f.readinto(buff[offset:])
+      if not num_bytes:
+        raise IOError('Unexpected end of weight file %s.' % path)
+      offset += num_bytes
+
+
+def _mmap_file(path):
+  """Memory-maps a file read-only, returning an empty buffer for empty files."""
+  with open(path, 'rb') as f:
+    if not os.fstat(f.fileno()).st_size:
+      return b''
+    return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+class _ShardedBuffer(object):
+  """A read-only buffer over the concatenation of several shard buffers.
+
+  Slicing returns a zero-copy memoryview when the slice lies within a single
+  shard, and falls back to a copy when it spans a shard boundary.
+  """
+
+  def __init__(self, buffers):
+    self._buffers = [memoryview(b) for b in buffers]
+    self._offsets = []
+    self._size = 0
+    for buff in self._buffers:
+      self._offsets.append(self._size)
+      self._size += len(buff)
+
+  def __len__(self):
+    return self._size
+
+  def __getitem__(self, key):
+    if not isinstance(key, slice):
+      raise TypeError('_ShardedBuffer supports slicing only.')
+    start, stop, _ = key.indices(self._size)
+    if stop <= start:
+      return b''
+    index = bisect.bisect_right(self._offsets, start) - 1
+    while not self._buffers[index]:
+      index += 1
+    begin = start - self._offsets[index]
+    end = stop - self._offsets[index]
+    if end <= len(self._buffers[index]):
+      return self._buffers[index][begin:end]
+    chunks = []
+    while end > 0:
+      chunks.append(self._buffers[index][begin:end].tobytes())
+      end -= len(self._buffers[index])
+      begin = 0
+      index += 1
+    return b''.join(chunks)
+
+
 def _deserialize_string_array(data_buffer, offset, shape):
   """Deserializes bytes into np.array of dtype `object` which holds strings.
 
@@ -98,29 +199,100 @@ def _deserialize_string_array(data_buffer, offset, shape):
     strings, and the offset contains the new offset (the byte position in the
     buffer at the end of the string data).
   """
-  size = np.prod(shape)
-  if size == 0:
-    return (np.array([], 'object').reshape(shape),
-            offset + STRING_LENGTH_NUM_BYTES)
-  vals = []
-  for _ in range(size):
-    byte_length = np.frombuffer(
-        data_buffer[offset:offset + STRING_LENGTH_NUM_BYTES],
-        STRING_LENGTH_DTYPE)[0]
-    offset += STRING_LENGTH_NUM_BYTES
-    string = data_buffer[offset:offset + byte_length]
-    vals.append(string)
-    offset += byte_length
-  return np.array(vals, 'object').reshape(shape), offset
+  lengths = _read_string_lengths(data_buffer, offset, shape)
+  num_bytes = int(lengths.sum()) + lengths.size * STRING_LENGTH_NUM_BYTES
+  # Copy the whole tensor out of the buffer once, then slice the strings from
+  # it, instead of going through the (possibly sharded) buffer per string.
+  string_bytes = bytes(data_buffer[offset:offset + num_bytes])
+  ends = np.cumsum(lengths + STRING_LENGTH_NUM_BYTES).tolist()
+  vals = np.empty(lengths.size, dtype=object)
+  vals[:] = [string_bytes[end - length:end]
+             for end, length in zip(ends, lengths.tolist())]
+  return vals.reshape(shape), offset + num_bytes
+
+
+def _read_string_lengths(data_buffer, offset, shape):
+  """Reads the length prefixes of a serialized string array.
+
+  The prefixes have to be walked one by one, since the position of each
+  depends on the lengths before it, but only their 4 bytes are read.
+
+  Returns:
+    A numpy array of dtype int64 with the byte length of every string.
+  """
+  lengths = []
+  unpack = _STRING_LENGTH_STRUCT.unpack
+  for _ in range(int(np.prod(shape))):
+    byte_length, = unpack(
+        data_buffer[offset:offset + STRING_LENGTH_NUM_BYTES])
+    lengths.append(byte_length)
+    offset += STRING_LENGTH_NUM_BYTES + byte_length
+  return np.array(lengths, dtype=np.int64)
 
 
 def _deserialize_numeric_array(data_buffer, offset, dtype, shape):
   weight_numel = 1
   for dim in shape:
     weight_numel *= dim
+  num_bytes = weight_numel * dtype.itemsize
   return np.frombuffer(
-      data_buffer, dtype=dtype, count=weight_numel,
-      offset=offset).reshape(shape)
+      data_buffer[offset:offset + num_bytes], dtype=dtype).reshape(shape)
+
+def _get_weight_dtype(weight):
+  """Gets the numpy dtype of the serialized bytes of a manifest entry."""
+  quant_info = weight.get('quantization', None)
+  if weight['dtype'] == 'string':
+    # String array.
+    dtype = np.object
+  elif quant_info:
+    # Quantized array.
+    dtype = np.dtype(quant_info['dtype'])
+  else:
+    # Regular numeric array.
+    dtype = np.dtype(weight['dtype'])
+  if dtype not in _INPUT_DTYPES:
+    raise NotImplementedError('Unsupported data type: %s' % dtype)
+  return dtype
+
+
+def _decode_weight(weight, data_buffer, offset):
+  """Decodes the value of a single weight.
+
+  Args:
+    weight: The manifest entry of the weight.
+    data_buffer: A buffer of bytes containing the serialized data.
+    offset: The byte offset in that buffer that denotes the start of the
+      weight.
+
+  Returns:
+    A tuple of (np.array, offset) where offset is the byte position in the
+    buffer at the end of the weight data.
+  """
+  quant_info = weight.get('quantization', None)
+  dtype = _get_weight_dtype(weight)
+  shape = weight['shape']
+  if weight['dtype'] == 'string':
+    value, offset = _deserialize_string_array(data_buffer, offset, shape)
+  else:
+    value = _deserialize_numeric_array(data_buffer, offset, dtype, shape)
+    offset += dtype.itemsize * value.size
+  if quant_info and quant_info['dtype'] == 'float16':
+    value = value.astype(np.dtype(weight['dtype']))
+  elif quant_info:
+    value = quantization.dequantize_weights(
+        value, quant_info['scale'], quant_info['min'],
+        np.dtype(weight['dtype']), axis=quant_info.get('axis', None))
+  return value, offset
+
+
+def _get_string_array_num_bytes(data_buffer, offset, shape):
+  """Gets the byte length of a serialized string array by walking its lengths.
+
+  Only the 4-byte length prefixes are read, not the string bytes themselves.
+  """
+  lengths = _read_string_lengths(data_buffer, offset, shape)
+  return int(lengths.sum()) + lengths.size * STRING_LENGTH_NUM_BYTES
+
 
 def decode_weights(weights_manifest, data_buffers, flatten=False):
   """Load weight values from buffer(s) according to a weights manifest.
@@ -152,9 +324,12 @@ def decode_weights(weights_manifest, data_buffers, flatten=False):
         ]
     If `flatten` is `True`, returns a single weight group.
 
+    Weights that are stored as an alias of another weight (see the
+    `deduplicate` argument of `write_weights`) share the array of that weight.
+
   Raises:
     ValueError: if the lengths of `weights_manifest` and `data_buffers` do not
-      match.
+      match, or if an alias refers to a weight that is not in the manifest.
   """
   if not isinstance(data_buffers, list):
     data_buffers = [data_buffers]
@@ -164,39 +339,187 @@ def decode_weights(weights_manifest, data_buffers, flatten=False):
         'data buffers (%d)' % (len(weights_manifest), len(data_buffers)))
 
   out = []
+  values = dict()
+  alias_entries = []
   for group, data_buffer in zip(weights_manifest, data_buffers):
+    if not isinstance(data_buffer, _ShardedBuffer):
+      # Slicing a memoryview does not copy the underlying bytes.
+      data_buffer = memoryview(data_buffer)
     offset = 0
     out_group = []
 
     for weight in group['weights']:
-      quant_info = weight.get('quantization', None)
       name = weight['name']
-      if weight['dtype'] == 'string':
-        # String array.
-        dtype = np.object
-      elif quant_info:
-        # Quantized array.
-        dtype = np.dtype(quant_info['dtype'])
+      if 'alias' in weight:
+        # Aliases take no bytes; they are filled in once all weights are read.
+        out_entry = {'name': name, 'data': None}
+        alias_entries.append((out_entry, weight))
       else:
-        # Regular numeric array.
-        dtype = np.dtype(weight['dtype'])
-      shape = weight['shape']
-      if dtype not in _INPUT_DTYPES:
-        raise NotImplementedError('Unsupported data type: %s' % dtype)
-      if weight['dtype'] == 'string':
-        value, offset = _deserialize_string_array(data_buffer, offset, shape)
-      else:
-        value = _deserialize_numeric_array(data_buffer, offset, dtype, shape)
-        offset += dtype.itemsize * value.size
-      if quant_info:
-        value = quantization.dequantize_weights(
-            value, quant_info['scale'], quant_info['min'],
-            np.dtype(weight['dtype']))
-      out_group.append({'name': name, 'data': value})
+        value, offset = _decode_weight(weight, data_buffer, offset)
+        values[name] = value
+        out_entry = {'name': name, 'data': value}
+      out_group.append(out_entry)
 
     if flatten:
       out += out_group
     else:
       out.append(out_group)
 
+  for out_entry, weight in alias_entries:
+    if weight['alias'] not in values:
+      raise ValueError(
+          'Weight %s is an alias of %s, which is not in the manifest.' %
+          (weight['name'], weight['alias']))
+    out_entry['data'] = values[weight['alias']].reshape(weight['shape'])
+
   return out
+
+
+# The location of the serialized bytes of a weight in the weight files.
+#   group: The index of the weight group in the manifest.
+#   shard: The index of the file in the group's `paths` that holds the first
+#     byte of the weight.
+#   offset: The byte offset of the weight within that file.
+#   length: The byte length of the weight, which may extend into the
+#     following files of the group.
+WeightLocation = collections.namedtuple(
+    'WeightLocation', ['group', 'shard', 'offset', 'length'])
+
+
+def build_weights_index(weights_manifest, base_path):
+  """Builds an index of where each weight is stored in the weight files.
+
+  Offsets are derived from the manifest and the sizes of the weight files.
+  String weights have no fixed size, so their length prefixes are read from
+  memory-mapped files; no other weight bytes are read.
+
+  Args:
+    weights_manifest: A TensorFlow.js-format weights manifest (a JSON array).
+    base_path: Base path prefix for the weights files.
+
+  Returns:
+    A `dict` mapping each weight name to its `WeightLocation`. Aliases map to
+    the location of the weight they refer to.
+  """
+  if not isinstance(weights_manifest, list):
+    raise ValueError(
+        'weights_manifest should be a `list`, but received %s' %
+        type(weights_manifest))
+
+  index = dict()
+  aliases = dict()
+  for group_index, group in enumerate(weights_manifest):
+    paths = [os.path.join(base_path, path) for path in group['paths']]
+    shard_offsets = []
+    group_num_bytes = 0
+    for path in paths:
+      shard_offsets.append(group_num_bytes)
+      group_num_bytes += os.path.getsize(path)
+
+    data_buffer = None
+    offset = 0
+    for weight in group['weights']:
+      if 'alias' in weight:
+        aliases[weight['name']] = weight['alias']
+        continue
+      dtype = _get_weight_dtype(weight)
+      if weight['dtype'] == 'string':
+        if data_buffer is None:
+          data_buffer = _ShardedBuffer([_mmap_file(p) for p in paths])
+        length = _get_string_array_num_bytes(
+            data_buffer, offset, weight['shape'])
+      else:
+        length = int(np.prod(weight['shape'])) * dtype.itemsize
+      shard = max(bisect.bisect_right(shard_offsets, offset) - 1, 0)
+      shard_offset = shard_offsets[shard] if shard_offsets else 0
+      index[weight['name']] = WeightLocation(
+          group_index, shard, offset - shard_offset, length)
+      offset += length
+    if offset > group_num_bytes:
+      raise ValueError(
+          'Weight files of group %d hold %d bytes, but the manifest expects '
+          '%d bytes.' % (group_index, group_num_bytes, offset))
+  for name, alias in aliases.items():
+    if alias not in index:
+      raise ValueError(
+          'Weight %s is an alias of %s, which is not in the manifest.' %
+          (name, alias))
+    index[name] = index[alias]
+  return index
+
+
+class LazyWeights(collections_abc.Mapping):
+  """A read-only mapping from weight names to values, read on access.
+
+  Only the bytes of the requested weight are read from the weight files (or
+  memory-mapped, if `use_mmap` is `True`), which allows inspecting a few
+  weights of a large model without reading all of its shards.
+
+  Example:
+    weights = LazyWeights(weights_manifest, '/path/to/model')
+    kernel = weights['dense/kernel']
+  """
+
+  def __init__(self, weights_manifest, base_path, use_mmap=False):
+    """Constructor of LazyWeights.
+
+    Args:
+      weights_manifest: A TensorFlow.js-format weights manifest (a JSON array).
+      base_path: Base path prefix for the weights files.
+      use_mmap: Whether to memory-map the weight files instead of reading the
+        bytes of each weight. Default: `False`.
+    """
+    self._index = build_weights_index(weights_manifest, base_path)
+    self._weights = collections.OrderedDict(
+        (weight['name'], weight)
+        for group in weights_manifest for weight in group['weights'])
+    self._paths = [[os.path.join(base_path, path) for path in group['paths']]
+                   for group in weights_manifest]
+    self._use_mmap = use_mmap
+    self._mmaps = dict()
+
+  def location(self, name):
+    """Gets the `WeightLocation` of a weight."""
+    return self._index[name]
+
+  def __getitem__(self, name):
+    location = self._index[name]
+    weight = self._weights[name]
+    if 'alias' in weight:
+      value, _ = _decode_weight(
+          self._weights[weight['alias']], self._read_weight_bytes(location), 0)
+      return value.reshape(weight['shape'])
+    value, _ = _decode_weight(weight, self._read_weight_bytes(location), 0)
+    return value
+
+  def __iter__(self):
+    return iter(self._weights)
+
+  def __len__(self):
+    return len(self._weights)
+
+  def _read_weight_bytes(self, location):
+    """Reads the bytes of a weight, possibly spanning several files."""
+    paths = self._paths[location.group][location.shard:]
+    if self._use_mmap:
+      buffers = []
+      for path in paths:
+        if path not in self._mmaps:
+          self._mmaps[path] = _mmap_file(path)
+        buffers.append(self._mmaps[path])
+      data_buffer = _ShardedBuffer(buffers)
+      return data_buffer[location.offset:location.offset + location.length]
+
+    chunks = []
+    offset = location.offset
+    remaining = location.length
+    for path in paths:
+      if remaining <= 0:
+        break
+      with open(path, 'rb') as f:
+        f.seek(offset)
+        chunk = f.read(remaining)
+      chunks.append(chunk)
+      remaining -= len(chunk)
+      offset = 0
+    return memoryview(b''.join(chunks))
@@ -187,6 +187,30 @@ class ReadWeightsTest(unittest.TestCase):
                                             u'a'.encode('utf-8'),
                                             u'c'.encode('utf-8')], 'object'))
 
+  def testReadManyStringsWithShards(self):
+    strings = [(u'%d' % i) * (i % 7) for i in range(1000)]
+    groups = [
+        [{
+            'name': 'weight1',
+            'data': np.array(strings, 'object').reshape([10, 100])
+        }, {
+            'name': 'weight2',
+            'data': np.array([1, 2], 'int32')
+        }]
+    ]
+
+    manifest = write_weights.write_weights(groups, self._tmp_dir,
+                                           shard_size_bytes=100)
+
+    for use_mmap in (False, True):
+      read_output = read_weights.read_weights(
+          manifest, self._tmp_dir, use_mmap=use_mmap)
+      np.testing.assert_array_equal(
+          read_output[0][0]['data'],
+          np.array([x.encode('utf-8') for x in strings],
+                   'object').reshape([10, 100]))
+      np.testing.assert_array_equal(read_output[0][1]['data'], [1, 2])
+
   def testReadOneGroupEmptyStrings(self):
     groups = [
         [{
@@ -307,6 +331,149 @@ class ReadWeightsTest(unittest.TestCase):
     self.assertTrue(
         np.allclose(groups[0][0]['data'], read_output[0][0]['data']))
 
+  def testReadWeightsWithMmap(self):
+    groups = [
+        [{
+            'name': 'weight1',
+            'data': np.arange(6, dtype='float32').reshape([2, 3])
+        }, {
+            'name': 'weight2',
+            'data': np.array([u'hello', u'world'], 'object')
+        }, {
+            'name': 'weight3',
+            'data': np.array([7, 8, 9, 10], 'int32')
+        }],
+        [{
+            'name': 'weight4',
+            'data': np.array([11, 12], 'float32')
+        }]
+    ]
+
+    # With 8-byte shards, weight1 spans shards and weight3 does not.
+    manifest = write_weights.write_weights(
+        groups, self._tmp_dir, shard_size_bytes=8)
+
+    read_output = read_weights.read_weights(
+        manifest, self._tmp_dir, flatten=True, use_mmap=True)
+    self.assertEqual(4, len(read_output))
+    self.assertEqual(
+        ['weight1', 'weight2', 'weight3', 'weight4'],
+        [entry['name'] for entry in read_output])
+    np.testing.assert_array_equal(
+        read_output[0]['data'], groups[0][0]['data'])
+    np.testing.assert_array_equal(
+        read_output[1]['data'], np.array([b'hello', b'world'], 'object'))
+    np.testing.assert_array_equal(
+        read_output[2]['data'], groups[0][2]['data'])
+    np.testing.assert_array_equal(
+        read_output[3]['data'], groups[1][0]['data'])
+    for i in (0, 2, 3):
+      self.assertFalse(read_output[i]['data'].flags.writeable)
+
+  def testReadWeightsWithMultipleWorkers(self):
+    groups = [
+        [{
+            'name': 'weight1',
+            'data': np.random.rand(4, 25).astype(np.float32)
+        }, {
+            'name': 'weight2',
+            'data': np.array([u'hello', u'world'], 'object')
+        }],
+        [{
+            'name': 'weight3',
+            'data': np.arange(30, dtype='int32')
+        }]
+    ]
+
+    manifest = write_weights.write_weights(
+        groups, self._tmp_dir, shard_size_bytes=16)
+
+    read_output = read_weights.read_weights(
+        manifest, self._tmp_dir, flatten=True, max_workers=4)
+    self.assertEqual(
+        ['weight1', 'weight2', 'weight3'],
+        [entry['name'] for entry in read_output])
+    np.testing.assert_array_equal(
+        read_output[0]['data'], groups[0][0]['data'])
+    np.testing.assert_array_equal(
+        read_output[1]['data'], np.array([b'hello', b'world'], 'object'))
+    np.testing.assert_array_equal(
+        read_output[2]['data'], groups[1][0]['data'])
+
+  def testBuildWeightsIndex(self):
+    groups = [
+        [{
+            'name': 'weight1',
+            'data': np.array([1, 2, 3], 'float32')
+        }, {
+            'name': 'weight2',
+            'data': np.array([u'ab', u'cde'], 'object')
+        }, {
+            'name': 'weight3',
+            'data': np.array([4, 5], 'int32')
+        }],
+        [{
+            'name': 'weight4',
+            'data': np.array([6, 7, 8, 9, 10], 'float32')
+        }]
+    ]
+
+    manifest = write_weights.write_weights(
+        groups, self._tmp_dir, shard_size_bytes=8)
+
+    index = read_weights.build_weights_index(manifest, self._tmp_dir)
+    self.assertEqual(
+        read_weights.WeightLocation(group=0, shard=0, offset=0, length=12),
+        index['weight1'])
+    self.assertEqual(
+        read_weights.WeightLocation(group=0, shard=1, offset=4, length=13),
+        index['weight2'])
+    self.assertEqual(
+        read_weights.WeightLocation(group=0, shard=3, offset=1, length=8),
+        index['weight3'])
+    self.assertEqual(
+        read_weights.WeightLocation(group=1, shard=0, offset=0, length=20),
+        index['weight4'])
+
+  def testLazyWeights(self):
+    groups = [
+        [{
+            'name': 'weight1',
+            'data': np.array([1, 2, 3], 'float32')
+        }, {
+            'name': 'weight2',
+            'data': np.array([u'ab', u'cde'], 'object')
+        }, {
+            'name': 'weight3',
+            'data': np.array([4, 5], 'float32')
+        }],
+        [{
+            'name': 'weight4',
+            'data': np.array([0, 1, 2], 'float32')
+        }]
+    ]
+
+    manifest = write_weights.write_weights(
+        groups, self._tmp_dir, shard_size_bytes=2,
+        quantization_dtype=np.uint8)
+
+    for use_mmap in (False, True):
+      weights = read_weights.LazyWeights(
+          manifest, self._tmp_dir, use_mmap=use_mmap)
+      self.assertEqual(4, len(weights))
+      self.assertEqual(
+          ['weight1', 'weight2', 'weight3', 'weight4'], list(weights))
+      np.testing.assert_allclose(
+          weights['weight3'], groups[0][2]['data'], atol=1 / 255.0)
+      np.testing.assert_array_equal(
+          weights['weight2'], np.array([b'ab', b'cde'], 'object'))
+      np.testing.assert_allclose(
+          weights['weight1'], groups[0][0]['data'], atol=2 / 255.0)
+      np.testing.assert_allclose(
+          weights['weight4'], groups[1][0]['data'], atol=2 / 255.0)
+      with self.assertRaises(KeyError):
+        weights['weight5']  # pylint: disable=pointless-statement
+
   def testReadWeightsWithIncorrectTypeInWeightsManifestRaisesError(self):
     groups = [
         [{
@@ -340,6 +507,158 @@ class ReadWeightsTest(unittest.TestCase):
     self.assertTrue(
         np.allclose(groups[0][0]['data'], read_output[0][0]['data']))
 
+  def testReadPerAxisQuantizedWeights(self):
+    groups = [
+        [{
+            'name': 'weight1',
+            'data': np.array([[0, -300], [1, 0], [2, 100], [3, 300]],
+                             'float32')
+        }, {
+            'name': 'weight2',
+            'data': np.array([0, 1, 2, 3], 'float32')
+        }]
+    ]
+
+    manifest = write_weights.write_weights(
+        groups, self._tmp_dir, quantization_dtype=np.uint8,
+        quantization_axis=-1)
+
+    read_output = read_weights.read_weights(manifest, self._tmp_dir)
+    self.assertEqual(2, len(read_output[0]))
+    self.assertEqual([4, 2], list(read_output[0][0]['data'].shape))
+    np.testing.assert_allclose(
+        read_output[0][0]['data'][:, 0], groups[0][0]['data'][:, 0])
+    np.testing.assert_allclose(
+        read_output[0][0]['data'], groups[0][0]['data'], atol=600 / 255.0)
+    np.testing.assert_allclose(
+        read_output[0][1]['data'], groups[0][1]['data'])
+
+  def testReadFloat16QuantizedWeights(self):
+    groups = [
+        [{
+            'name': 'weight1',
+            'data': np.array([-1e4, -0.5, 0, 1e-3, 3.14159], 'float32')
+        }, {
+            'name': 'weight2',
+            'data': np.array([1, 2, 3], 'int32')
+        }]
+    ]
+
+    manifest = write_weights.write_weights(
+        groups, self._tmp_dir, quantization_dtype=np.float16)
+
+    read_output = read_weights.read_weights(manifest, self._tmp_dir)
+    self.assertEqual(np.float32, read_output[0][0]['data'].dtype)
+    np.testing.assert_allclose(
+        read_output[0][0]['data'], groups[0][0]['data'], rtol=1e-3)
+    self.assertEqual(np.int32, read_output[0][1]['data'].dtype)
+    np.testing.assert_array_equal(
+        read_output[0][1]['data'], groups[0][1]['data'])
+
+  def testReadDeduplicatedWeights(self):
+    groups = [
+        [{
+            'name': 'weight1',
+            'data': np.array([[1, 2], [3, 4]], 'float32')
+        }, {
+            'name': 'weight2',
+            'data': np.array([u'ab', u'cde'], 'object')
+        }],
+        [{
+            'name': 'weight3',
+            'data': np.array([[1, 2], [3, 4]], 'float32')
+        }, {
+            'name': 'weight4',
+            'data': np.array([u'ab', u'cde'], 'object')
+        }, {
+            'name': 'weight5',
+            'data': np.array([5, 6], 'int32')
+        }]
+    ]
+
+    manifest = write_weights.write_weights(
+        groups, self._tmp_dir, deduplicate=True)
+    self.assertEqual('weight1', manifest[1]['weights'][0]['alias'])
+    self.assertEqual('weight2', manifest[1]['weights'][1]['alias'])
+
+    read_output = read_weights.read_weights(manifest, self._tmp_dir)
+    for group, read_group in zip(groups, read_output):
+      self.assertEqual([e['name'] for e in group],
+                       [e['name'] for e in read_group])
+    self.assertEqual((2, 2), read_output[1][0]['data'].shape)
+    np.testing.assert_array_equal(read_output[1][0]['data'],
+                                  groups[0][0]['data'])
+    np.testing.assert_array_equal(read_output[1][1]['data'],
+                                  np.array([b'ab', b'cde'], 'object'))
+    np.testing.assert_array_equal(read_output[1][2]['data'], [5, 6])
+
+    index = read_weights.build_weights_index(manifest, self._tmp_dir)
+    self.assertEqual(index['weight1'], index['weight3'])
+    self.assertEqual(read_weights.WeightLocation(1, 0, 0, 8),
+                     index['weight5'])
+
+    weights = read_weights.LazyWeights(manifest, self._tmp_dir)
+    np.testing.assert_array_equal(weights['weight3'], groups[0][0]['data'])
+    np.testing.assert_array_equal(weights['weight4'],
+                                  np.array([b'ab', b'cde'], 'object'))
+
+  def testReadWeightsWithHashedShardNames(self):
+    groups = [
+        [{
+            'name': 'weight1',
+            'data': np.arange(100, dtype='float32')
+        }, {
+            'name': 'weight2',
+            'data': np.array([u'ab', u'cde'], 'object')
+        }]
+    ]
+
+    manifest = write_weights.write_weights(
+        groups, self._tmp_dir, shard_size_bytes=64, hash_shard_names=True)
+
+    read_output = read_weights.read_weights(manifest, self._tmp_dir)
+    np.testing.assert_array_equal(read_output[0][0]['data'],
+                                  groups[0][0]['data'])
+    np.testing.assert_array_equal(read_output[0][1]['data'],
+                                  np.array([b'ab', b'cde'], 'object'))
+
+  def testReadWeightsPackedAsWholeTensors(self):
+    groups = [
+        [{
+            'name': 'weight1',
+            'data': np.arange(3, dtype='float32')
+        }, {
+            'name': 'weight2',
+            'data': np.arange(20, dtype='int32')
+        }, {
+            'name': 'weight3',
+            'data': np.array([u'ab', u'cde'], 'object')
+        }]
+    ]
+
+    manifest = write_weights.write_weights(
+        groups, self._tmp_dir, shard_size_bytes=16, packing='whole_tensors')
+
+    read_output = read_weights.read_weights(manifest, self._tmp_dir)
+    read_data = {e['name']: e['data'] for e in read_output[0]}
+    np.testing.assert_array_equal(read_data['weight1'], groups[0][0]['data'])
+    np.testing.assert_array_equal(read_data['weight2'], groups[0][1]['data'])
+    np.testing.assert_array_equal(read_data['weight3'],
+                                  np.array([b'ab', b'cde'], 'object'))
+
+  def testReadAliasOfMissingWeightRaisesError(self):
+    manifest = [{
+        'paths': [],
+        'weights': [{
+            'name': 'weight1',
+            'shape': [2],
+            'dtype': 'float32',
+            'alias': 'weight0'
+        }]
+    }]
+    with self.assertRaises(ValueError):
+      read_weights.decode_weights(manifest, [b''])
+
 
 if __name__ == '__main__':
   unittest.main()
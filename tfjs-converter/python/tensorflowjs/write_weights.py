@@ -13,10 +13,16 @@
 # limitations under the License.
 # ==============================================================================
 
+import gzip
+import hashlib
+import importlib
 import io
+import itertools
 import json
 import math
+from multiprocessing.pool import ThreadPool
 import os
+import threading
 
 import numpy as np
 
@@ -28,9 +34,29 @@ _AUTO_DTYPE_CONVERSION = {
     np.dtype(np.float64): np.float32,
     np.dtype(np.int64): np.int32}
 
+# Strategies for splitting the bytes of a weight group into shards.
+#   stream: The concatenated bytes of the group are cut every
+#     `shard_size_bytes` bytes, so weights may straddle two shards.
+#   whole_tensors: Weights are bin-packed into shards, and only weights larger
+#     than `shard_size_bytes` are split.
+_PACKING_STRATEGIES = ('stream', 'whole_tensors')
+
+# Number of hex digits of the SHA-256 hash used in hashed shard names.
+_HASHED_SHARD_NAME_LENGTH = 32
+
+# Maps each supported shard compression to the file extension of its sidecar
+# files and the (optional) package it requires.
+_COMPRESSIONS = {
+    'gzip': ('.gz', None),
+    'brotli': ('.br', 'brotli'),
+    'zstd': ('.zst', 'zstandard'),
+}
+
 def write_weights(
     weight_groups, write_dir, shard_size_bytes=1024 * 1024 * 4,
-    write_manifest=True, quantization_dtype=None):
+    write_manifest=True, quantization_dtype=None, max_workers=1,
+    quantization_axis=None, deduplicate=False, compression=None,
+    hash_shard_names=False, incremental=False, packing='stream'):
   """Writes weights to a binary format on disk for ingestion by JavaScript.
 
     Weights are organized into groups. When writing to disk, the bytes from all
@@ -38,10 +64,13 @@ def write_weights(
     (default is 4MB). This means that large weights (> shard_size) get sharded
     and small weights (< shard_size) will be packed. If the bytes can't be split
     evenly into shards, there will be a leftover shard that is smaller than the
-    shard size.
+    shard size. The bytes are streamed to the shard files one weight at a time,
+    so a group is never materialized as a whole in memory.
 
     Weights are optionally quantized to either 8 or 16 bits for compression,
-    which is enabled via the `quantization_dtype` argument.
+    which is enabled via the `quantization_dtype` argument. Float weights can
+    alternatively be stored as IEEE half-precision floats (np.float16), which
+    keeps their dynamic range at the same size as 16-bit quantization.
 
     Args:
       weight_groups: An list of groups. Each group is an array of weight
@@ -66,7 +95,51 @@ def write_weights(
       write_manifest: Whether to write the manifest JSON to disk. Defaults to
         True.
       quantization_dtype: An optional numpy dtype to quantize weights to for
-        compression. Only np.uint8 and np.uint16 are supported.
+        compression. Only np.uint8, np.uint16 and np.float16 are supported.
+      max_workers: The number of threads used to write shard files
+        concurrently. This mostly helps on file systems with a high per-file
+        latency, such as NFS. The manifest is the same for any value.
+        Defaults to 1, i.e., shards are written one at a time.
+      quantization_axis: An optional axis along which weights of rank >= 2
+        are quantized per slice (e.g., -1 for the output channels of a
+        convolution kernel), instead of with a single range per weight. Only
+        used if `quantization_dtype` is set. The manifest then holds one 'min'
+        and 'scale' per slice, along with the 'axis'.
+      deduplicate: Whether to store the bytes of identical weights only once.
+        A weight whose dtype, shape, quantization and bytes all match those of
+        an earlier weight (in any group) is written as an alias of it: it
+        takes no bytes in the weight files and its manifest entry names the
+        earlier weight under 'alias'. Defaults to False.
+      compression: An optional list of compressions ('gzip', 'brotli' or
+        'zstd') to pre-compress every shard with. Each is written to a sidecar
+        file next to the shard (e.g., 'group1-shard1of1.bin.gz'), so static
+        file servers can serve it without compressing on the fly. The sizes of
+        the sidecar files are recorded per group in the manifest, under
+        'compressedSizes'. 'brotli' and 'zstd' require the `brotli` and
+        `zstandard` packages, respectively. Sidecars are compressed on the
+        same threads that write the shards (see `max_workers`).
+      hash_shard_names: Whether to name each shard by the SHA-256 hash of its
+        bytes (e.g., '3f0a9c...e1.bin') instead of 'group1-shard1of2.bin'.
+        Shards whose bytes do not change between two versions of a model then
+        keep their URL, so they can be cached as immutable. The full hex
+        digests are recorded per group in the manifest, under 'sha256'.
+        Defaults to False.
+      incremental: Whether to leave shard files in `write_dir` alone if they
+        already hold the bytes that would be written to them, e.g., when
+        re-converting a fine-tuned model into the directory of its previous
+        version. Existing files are compared to the new shards byte by byte.
+        Their modification times are preserved, so only changed files need
+        to be uploaded again. The files that were (re)written are printed.
+        Defaults to False.
+      packing: How the bytes of a group are split into shards. With 'stream'
+        (the default), the concatenated bytes are cut every `shard_size_bytes`
+        bytes, so a weight may straddle two shards. With 'whole_tensors',
+        weights are placed first-fit, in order, into the first shard with room
+        for them, so only weights larger than `shard_size_bytes` are split
+        (over shards of their own, except for their tail). The weights of a
+        group may then be listed in a different order in the manifest, which
+        also records the names of the weights in each shard under
+        'shardWeights', for loaders that fetch shards lazily.
     Returns:
       The weights manifest JSON dict.
 
@@ -107,29 +180,136 @@ def write_weights(
           'quantization': {'min': -2.4, 'scale': 0.08, 'dtype': 'uint8'}
         }]
       }]
+      or, if quantization is used with `quantization_axis=-1`:
+      [{
+        'paths': ['group1-shard1of1'],
+        'weights': [{
+          'name': 'weight1',
+          'shape': [1000, 2],
+          'dtype': 'float32'
+          'quantization': {'min': [-0.1, -2.4], 'scale': [0.01, 0.08],
+                           'dtype': 'uint8', 'axis': 1}
+        }]
+      }]
+      or, if `quantization_dtype` is np.float16:
+      [{
+        'paths': ['group1-shard1of1'],
+        'weights': [{
+          'name': 'weight1',
+          'shape': [1000, 1000],
+          'dtype': 'float32'
+          'quantization': {'dtype': 'float16'}
+        }]
+      }]
+      or, if `compression` is ['gzip']:
+      [{
+        'paths': ['group1-shard1of2', 'group1-shard2of2'],
+        'weights': [{
+          'name': 'weight1',
+          'shape': [1000, 1000],
+          'dtype': 'float32'
+        }],
+        'compressedSizes': {'gzip': [3721422, 3720985]}
+      }]
+      or, if `hash_shard_names` is True:
+      [{
+        'paths': ['5bd2b1f4bc9d09b4c9a7e4e8a3e7ab52.bin'],
+        'weights': [{
+          'name': 'weight1',
+          'shape': [1000, 1000],
+          'dtype': 'float32'
+        }],
+        'sha256': ['5bd2b1f4bc9d09b4c9a7e4e8a3e7ab52...']
+      }]
+      or, if `packing` is 'whole_tensors':
+      [{
+        'paths': ['group1-shard1of2', 'group1-shard2of2'],
+        'weights': [{
+          'name': 'weight1',
+          'shape': [3, 1000, 1000],
+          'dtype': 'float32'
+        }, {
+          'name': 'weight2',
+          'shape': [100],
+          'dtype': 'float32'
+        }],
+        'shardWeights': [['weight1'], ['weight1', 'weight2']]
+      }]
+      or, if `deduplicate` is True and weight2 equals weight1:
+      [{
+        'paths': ['group1-shard1of1'],
+        'weights': [{
+          'name': 'weight1',
+          'shape': [1000, 1000],
+          'dtype': 'float32'
+        }, {
+          'name': 'weight2',
+          'shape': [1000, 1000],
+          'dtype': 'float32',
+          'alias': 'weight1'
+        }]
+      }]
   """
   _assert_weight_groups_valid(weight_groups)
   _assert_shard_size_bytes_valid(shard_size_bytes)
   _assert_no_duplicate_weight_names(weight_groups)
+  _assert_max_workers_valid(max_workers)
+  compression = list(compression or [])
+  _assert_compression_valid(compression)
+  if packing not in _PACKING_STRATEGIES:
+    raise ValueError(
+        'Unsupported packing %r. Supported packings are: %s' %
+        (packing, ', '.join(_PACKING_STRATEGIES)))
 
   manifest = []
-
-  for group_index, group in enumerate(weight_groups):
-    for e in group:
-      _auto_convert_weight_entry(e)
-    if quantization_dtype:
-      group = [_quantize_entry(e, quantization_dtype) for e in group]
-    group_bytes, total_bytes, _ = _stack_group_bytes(group)
-
-    shard_filenames = _shard_group_bytes_to_disk(
-        write_dir, group_index, group_bytes, total_bytes, shard_size_bytes)
-
-    weights_entries = _get_weights_manifest_for_group(group)
-    manifest_entry = {
-        'paths': shard_filenames,
-        'weights': weights_entries
-    }
-    manifest.append(manifest_entry)
+  # Maps the key of every distinct weight written so far to its name.
+  canonical_names = dict()
+  written_shards = dict()
+  written_filenames = []
+  all_shard_filenames = set()
+
+  pool = ThreadPool(max_workers) if max_workers > 1 else None
+  try:
+    for group_index, group in enumerate(weight_groups):
+      for e in group:
+        _auto_convert_weight_entry(e)
+      if quantization_dtype:
+        group = [_quantize_entry(e, quantization_dtype, quantization_axis)
+                 for e in group]
+      if deduplicate:
+        group = [_deduplicate_entry(e, canonical_names) for e in group]
+      shard_sizes = None
+      if packing == 'whole_tensors':
+        group, shard_sizes, shard_weights = _pack_whole_tensors(
+            group, shard_size_bytes)
+      shard_filenames, manifest_fields, written = _shard_group_to_disk(
+          write_dir, group_index, group, shard_size_bytes, pool=pool,
+          max_pending_shards=2 * max_workers, compression=compression,
+          hash_shard_names=hash_shard_names, written_shards=written_shards,
+          incremental=incremental, shard_sizes=shard_sizes)
+      if packing == 'whole_tensors':
+        manifest_fields['shardWeights'] = shard_weights
+      all_shard_filenames.update(shard_filenames)
+      written_filenames += written
+
+      weights_entries = _get_weights_manifest_for_group(group)
+      manifest_entry = {
+          'paths': shard_filenames,
+          'weights': weights_entries
+      }
+      manifest_entry.update(manifest_fields)
+      manifest.append(manifest_entry)
+  finally:
+    if pool:
+      pool.close()
+      pool.join()
+
+  if incremental:
+    print('Wrote %d of %d weight file(s) to %s; the others were unchanged.' %
+          (len(written_filenames),
+           len(all_shard_filenames) * (1 + len(compression)), write_dir))
+    for filename in written_filenames:
+      print('  ' + filename)
 
   if write_manifest:
     manifest_path = os.path.join(write_dir, 'weights_manifest.json')
@@ -139,7 +319,7 @@ def write_weights(
   return manifest
 
 
-def _quantize_entry(entry, quantization_dtype):
+def _quantize_entry(entry, quantization_dtype, quantization_axis=None):
   """Quantizes the weights in the entry, returning a new entry.
 
   The weights are quantized by linearly re-scaling the values between the
@@ -149,10 +329,18 @@ def _quantize_entry(entry, quantization_dtype):
   In order to guarantee that 0 is perfectly represented by one of the quanzitzed
   values, the range is "nudged" in the same manner as in TF-Lite.
 
+  If `quantization_dtype` is np.float16, float weights are cast to half
+  precision instead. Integer weights are left as they are in that case, since
+  float16 cannot represent integers above 2048 exactly, and so are weights
+  with values beyond the float16 range.
+
   Args:
     entry: A weight entries to quantize.
-    quantization_dtype: An numpy dtype to quantize weights to. Only np.uint8 and
-      np.uint16 are supported.
+    quantization_dtype: An numpy dtype to quantize weights to. Only np.uint8,
+      np.uint16 and np.float16 are supported.
+    quantization_axis: An optional axis to quantize along, if the weights have
+      a rank of at least 2. Scalars and vectors (e.g., biases) are always
+      quantized with a single range.
 
   Returns:
     A new entry containing the quantized data and additional quantization info,
@@ -172,15 +360,62 @@ def _quantize_entry(entry, quantization_dtype):
   # Strings tensors are not quantized.
   if data.dtype == 'object':
     return entry
+  if quantization_dtype == np.float16:
+    if data.dtype.kind != 'f':
+      return entry
+    if data.size and np.abs(data).max() > np.finfo(np.float16).max:
+      print('weight ' + entry['name'] + ' has values outside of the float16 '
+            'range and was not quantized')
+      return entry
+    quantized_entry = entry.copy()
+    quantized_entry['data'] = data.astype(np.float16)
+    quantized_entry['quantization'] = {'original_dtype': data.dtype.name}
+    return quantized_entry
+  axis = quantization_axis if data.ndim >= 2 else None
   quantized_data, scale, min_val = quantization.quantize_weights(
-      data, quantization_dtype)
+      data, quantization_dtype, axis=axis)
   quantized_entry = entry.copy()
   quantized_entry['data'] = quantized_data
   quantized_entry['quantization'] = {
       'min': min_val, 'scale': scale, 'original_dtype': data.dtype.name}
+  if axis is not None:
+    quantized_entry['quantization'].update({
+        'min': min_val.tolist(), 'scale': scale.tolist(),
+        'axis': axis % data.ndim})
   return quantized_entry
 
 
+def _deduplicate_entry(entry, canonical_names):
+  """Turns an entry into an alias if an identical weight was written before.
+
+  Args:
+    entry: A (possibly quantized) weight entry.
+    canonical_names: A dict mapping the key of each distinct weight seen so
+      far to its name. It is updated in place.
+
+  Returns:
+    The entry itself, or a copy of it with an 'alias' field holding the name
+    of the first weight with the same dtype, shape, quantization and bytes.
+  """
+  data_bytes = _get_entry_bytes(entry)
+  if not data_bytes:
+    return entry
+  var_manifest = _get_weights_manifest_for_group([entry])[0]
+  del var_manifest['name']
+  key = (json.dumps(var_manifest, sort_keys=True),
+         hashlib.sha256(data_bytes).hexdigest())
+  if key not in canonical_names:
+    canonical_names[key] = entry['name']
+    return entry
+  alias_entry = entry.copy()
+  alias_entry['alias'] = canonical_names[key]
+  return alias_entry
+
+
+def _encode_string(x):
+  return x if isinstance(x, bytes) else x.encode('utf-8')
+
+
 def _serialize_string_array(data):
   """Serializes a numpy array of dtype `string` into bytes.
 
@@ -195,106 +430,336 @@ def _serialize_string_array(data):
 
   where byte length always takes 4 bytes.
 
+  The length prefixes of all strings are scattered into the output in one
+  vectorized pass, and the string bytes are joined and copied in another.
+
   Args:
     data: A numpy array of dtype `string`.
 
   Returns:
     bytes of the entire string tensor to be serialized on disk.
   """
-  strings = data.flatten().tolist()
-
-  string_bytes = io.BytesIO()
-  bytes_writer = io.BufferedWriter(string_bytes)
-
-  for x in strings:
-    encoded = x if isinstance(x, bytes) else x.encode('utf-8')
-    length_as_bytes = np.array(len(encoded),
-                               read_weights.STRING_LENGTH_DTYPE).tobytes()
-    bytes_writer.write(length_as_bytes)
-    bytes_writer.write(encoded)
-  bytes_writer.flush()
-  string_bytes.seek(0)
-  return string_bytes.read()
+  encoded = [_encode_string(x) for x in data.reshape(-1).tolist()]
+  if not encoded:
+    return b''
+  lengths = np.array([len(x) for x in encoded],
+                     dtype=read_weights.STRING_LENGTH_DTYPE)
+  num_prefix_bytes = read_weights.STRING_LENGTH_NUM_BYTES
+
+  # The i-th length prefix starts after i prefixes and i strings.
+  prefix_starts = np.zeros(len(encoded), dtype=np.int64)
+  np.cumsum(lengths[:-1] + num_prefix_bytes, out=prefix_starts[1:])
+  prefix_indices = (prefix_starts[:, np.newaxis] +
+                    np.arange(num_prefix_bytes)).reshape(-1)
+
+  out = np.empty(
+      len(encoded) * num_prefix_bytes + int(lengths.sum()), dtype=np.uint8)
+  is_string_byte = np.ones(out.size, dtype=np.bool_)
+  is_string_byte[prefix_indices] = False
+  out[prefix_indices] = lengths.view(np.uint8)
+  out[is_string_byte] = np.frombuffer(b''.join(encoded), dtype=np.uint8)
+  return out.tobytes()
 
 def _serialize_numeric_array(data):
   """Serializes a numeric numpy array into bytes.
 
+  The bytes are exposed through a flat memoryview over the array's buffer, so
+  no copy is made unless the array is not C-contiguous.
+
   Args:
     data: A numeric numpy array.
 
   Returns:
-    bytes of the array to be serialized on disk.
+    A memoryview of the bytes of the array to be serialized on disk.
   """
-  return data.tobytes()
+  return memoryview(np.ascontiguousarray(data).reshape(-1).view(np.uint8))
 
-def _stack_group_bytes(group):
-  """Stacks the bytes for a weight group into a flat byte array.
+def _get_entry_bytes(entry):
+  """Gets the serialized bytes of a weight entry as a memoryview."""
+  if 'alias' in entry:
+    return memoryview(b'')
+  data = entry['data']
+  if data.dtype == np.object:
+    return memoryview(_serialize_string_array(data))
+  return _serialize_numeric_array(data)
+
+def _get_entry_num_bytes(entry):
+  """Gets the size of the serialized bytes of a weight entry."""
+  if 'alias' in entry:
+    return 0
+  data = entry['data']
+  if data.dtype == np.object:
+    return sum(read_weights.STRING_LENGTH_NUM_BYTES + len(_encode_string(x))
+               for x in data.flatten().tolist())
+  return data.nbytes
+
+def _pack_whole_tensors(group, shard_size_bytes):
+  """Bin-packs the entries of a group into shards without splitting them.
+
+  Entries are placed first-fit, in order, into the first shard with enough
+  room left. An entry larger than `shard_size_bytes` starts a new shard and
+  fills as many full shards as needed; the shard holding its tail stays open
+  for further entries. Entries without bytes go to the last shard.
 
   Args:
     group: A list of weight entries.
-  Returns:
-    A type: (group_bytes, total_bytes, weights_entries, group_bytes_writer)
-    group_bytes: The stacked bytes for the group, as a BytesIO() stream.
-    total_bytes: A number representing the total size of the byte buffer.
-    groups_bytes_writer: The io.BufferedWriter object. Returned so that
-      group_bytes does not get garbage collected and closed.
+    shard_size_bytes: The maximum size of shards in bytes.
 
+  Returns:
+    A tuple of (entries, shard_sizes, shard_weights): the entries reordered
+    so that their concatenated bytes are those of the shards in order, the
+    size of each shard in bytes, and the names of the weights (partly) held by
+    each shard.
   """
-  group_bytes = io.BytesIO()
-  group_bytes_writer = io.BufferedWriter(group_bytes)
-  total_bytes = 0
-
+  # Each shard is a [entries, num_bytes, names] list.
+  shards = []
+  leading_entries = []
   for entry in group:
-    _assert_valid_weight_entry(entry)
-    data = entry['data']
-
-    if data.dtype == np.object:
-      data_bytes = _serialize_string_array(data)
+    num_bytes = _get_entry_num_bytes(entry)
+    if not num_bytes:
+      if shards:
+        shards[-1][0].append(entry)
+        shards[-1][2].append(entry['name'])
+      else:
+        leading_entries.append(entry)
+    elif num_bytes > shard_size_bytes:
+      num_full_shards, tail_num_bytes = divmod(num_bytes, shard_size_bytes)
+      shards.append([[entry], shard_size_bytes, [entry['name']]])
+      shards += [[[], shard_size_bytes, [entry['name']]]
+                 for _ in range(num_full_shards - 1)]
+      if tail_num_bytes:
+        shards.append([[], tail_num_bytes, [entry['name']]])
     else:
-      data_bytes = _serialize_numeric_array(data)
-    group_bytes_writer.write(data_bytes)
-    total_bytes += len(data_bytes)
-
-  group_bytes_writer.flush()
-  group_bytes.seek(0)
+      for shard in shards:
+        if shard[1] + num_bytes <= shard_size_bytes:
+          break
+      else:
+        shard = [[], 0, []]
+        shards.append(shard)
+      shard[0].append(entry)
+      shard[1] += num_bytes
+      shard[2].append(entry['name'])
+
+  entries = leading_entries + [
+      entry for shard_entries, _, _ in shards for entry in shard_entries]
+  shard_sizes = [num_bytes for _, num_bytes, _ in shards]
+  shard_weights = [names for _, _, names in shards]
+  if leading_entries and shard_weights:
+    shard_weights[0] = [e['name'] for e in leading_entries] + shard_weights[0]
+  return entries, shard_sizes, shard_weights
+
+
+def _iter_group_shards(group, shard_sizes):
+  """Splits the concatenated bytes of a weight group into shards.
+
+  Weights are serialized lazily, one at a time, and split across shard
+  boundaries by slicing memoryviews, so the bytes of the group are never
+  copied into a single buffer.
 
-  # NOTE: We must return the bytes writer here, otherwise it goes out of scope
-  # and python closes the IO operation.
-  return (group_bytes, total_bytes, group_bytes_writer)
-
-
-def _shard_group_bytes_to_disk(
-    write_dir, group_index, group_bytes, total_bytes, shard_size_bytes):
-  """Shards the concatenated bytes for a group to disk.
+  Args:
+    group: A list of weight entries.
+    shard_sizes: An iterable of the sizes of the shards in bytes.
+  Yields:
+    The shards in order, each as a list of memoryviews whose concatenation is
+    the bytes of the shard.
+  """
+  shard_sizes = iter(shard_sizes)
+  shard_size_bytes = next(shard_sizes)
+  shard = []
+  shard_num_bytes = 0
+  for entry in group:
+    data_bytes = _get_entry_bytes(entry)
+    while data_bytes:
+      chunk = data_bytes[:shard_size_bytes - shard_num_bytes]
+      shard.append(chunk)
+      shard_num_bytes += len(chunk)
+      data_bytes = data_bytes[len(chunk):]
+      if shard_num_bytes == shard_size_bytes:
+        yield shard
+        shard = []
+        shard_num_bytes = 0
+        shard_size_bytes = next(shard_sizes, None)
+  if shard:
+    yield shard
+
+
+def _shard_group_to_disk(
+    write_dir, group_index, group, shard_size_bytes, pool=None,
+    max_pending_shards=None, compression=(), hash_shard_names=False,
+    written_shards=None, incremental=False, shard_sizes=None):
+  """Streams the concatenated bytes for a group to disk as shards.
 
   Args:
     write_dir: The directory to write the files to.
     group_index: The index for the group.
-    group_bytes: An io.BytesIO() object representing the byte array.
-    total_bytes: The total number of bytes of the stream.
+    group: A list of weight entries.
     shard_size_bytes: The size of shards in bytes. If None, the whole byte
         array will be written as one shard.
+    pool: An optional thread pool used to write the shards concurrently.
+    max_pending_shards: The maximum number of shards queued on `pool` and
+        held in memory at a time.
+    compression: The compressions to write sidecar files of the shards with.
+    hash_shard_names: Whether to name the shards by the SHA-256 hash of their
+        bytes instead of by their group and index.
+    written_shards: An optional dict mapping the path of every shard written
+        so far (by previous calls) to the result of writing it. Shards with
+        the same hashed name as one in it are not written again. It is updated
+        in place.
+    incremental: Whether to skip writing shards whose file already holds the
+        same bytes.
+    shard_sizes: An optional list of the sizes of the shards in bytes, which
+        overrides `shard_size_bytes`. It must add up to the size of the group.
   Returns:
-    A list of filenames that were written to disk.
+    A tuple of (filenames, manifest_fields, written_filenames): the list of
+    filenames of the shards, a dict of the additional fields of the group's
+    manifest entry (i.e., 'compressedSizes' if `compression` is set and
+    'sha256' if `hash_shard_names` is set), and the list of the names of the
+    shard and sidecar files that were actually written by this call (all of
+    them, unless `incremental` is set or shards are reused from
+    `written_shards`).
   """
-  if shard_size_bytes is None:
-    shard_size_bytes = total_bytes
-
-  num_shards = int(math.ceil(float(total_bytes) / shard_size_bytes))
+  for entry in group:
+    _assert_valid_weight_entry(entry)
+  if written_shards is None:
+    written_shards = dict()
+  total_bytes = sum(_get_entry_num_bytes(entry) for entry in group)
+  num_shards = 0
+  if shard_sizes is not None:
+    num_shards = len(shard_sizes)
+  elif total_bytes:
+    if shard_size_bytes is None:
+      shard_size_bytes = total_bytes
+    num_shards = int(math.ceil(float(total_bytes) / shard_size_bytes))
+    shard_sizes = itertools.repeat(shard_size_bytes)
 
   filenames = []
-  for i in range(num_shards):
-    shard = group_bytes.read(shard_size_bytes)
-
-    filename = 'group%d-shard%dof%d.bin' % (group_index + 1, i + 1, num_shards)
+  digests = []
+  results = []
+  # Whether each shard reuses the result of a shard written before.
+  reused = []
+  if pool:
+    pending_shards = threading.BoundedSemaphore(max_pending_shards)
+  shards = _iter_group_shards(group, shard_sizes) if total_bytes else []
+  for i, shard in enumerate(shards):
+    if hash_shard_names:
+      digest = _get_shard_digest(shard)
+      digests.append(digest)
+      filename = '%s.bin' % digest[:_HASHED_SHARD_NAME_LENGTH]
+    else:
+      filename = 'group%d-shard%dof%d.bin' % (
+          group_index + 1, i + 1, num_shards)
     filenames.append(filename)
     filepath = os.path.join(write_dir, filename)
 
-    # Write the shard to disk.
-    with open(filepath, 'wb') as f:
-      f.write(shard)
+    reused.append(hash_shard_names and filepath in written_shards)
+    if reused[-1]:
+      # The same bytes were already written to this file.
+      results.append(written_shards[filepath])
+    elif pool:
+      pending_shards.acquire()
+      results.append(pool.apply_async(
+          _write_shard,
+          (filepath, shard, pending_shards, compression, incremental)))
+    else:
+      results.append(_write_shard(
+          filepath, shard, compression=compression, incremental=incremental))
+    written_shards[filepath] = results[-1]
+
+  # Wait for the pending writes, raising the first error if any.
+  if pool:
+    results = [result.get() for result in results]
+  manifest_fields = dict()
+  if compression:
+    manifest_fields['compressedSizes'] = dict(
+        (name, [sizes[name] for _, sizes in results]) for name in compression)
+  if hash_shard_names:
+    manifest_fields['sha256'] = digests
+  # Files of reused shards were reported by the call that wrote them.
+  written_filenames = []
+  for (result_filenames, _), is_reused in zip(results, reused):
+    if not is_reused:
+      written_filenames += result_filenames
+  return filenames, manifest_fields, written_filenames
+
+
+def _get_shard_digest(shard):
+  """Gets the hex SHA-256 digest of a shard, given as a list of memoryviews."""
+  sha256 = hashlib.sha256()
+  for chunk in shard:
+    sha256.update(chunk)
+  return sha256.hexdigest()
+
+
+def _write_shard(filepath, shard, pending_shards=None, compression=(),
+                 incremental=False):
+  """Writes a shard, given as a list of memoryviews, to disk.
 
-  return filenames
+  Returns:
+    A tuple of (written_filenames, compressed_sizes): the names of the files
+    that were written, i.e., the shard and its sidecar files, except for those
+    left alone because `incremental` is set and the shard file already holds
+    the bytes of the shard; and a dict mapping each of `compression` to the
+    size of the sidecar file for it.
+  """
+  try:
+    written_filenames = []
+    unchanged = incremental and _file_equals_shard(filepath, shard)
+    if not unchanged:
+      with open(filepath, 'wb') as f:
+        for chunk in shard:
+          f.write(chunk)
+      written_filenames.append(os.path.basename(filepath))
+    compressed_sizes = dict()
+    for name in compression:
+      sidecar_path = filepath + _COMPRESSIONS[name][0]
+      if unchanged and os.path.isfile(sidecar_path):
+        compressed_sizes[name] = os.path.getsize(sidecar_path)
+        continue
+      compressed = _compress_shard(shard, name)
+      with open(sidecar_path, 'wb') as f:
+        f.write(compressed)
+      compressed_sizes[name] = len(compressed)
+      written_filenames.append(os.path.basename(sidecar_path))
+    return written_filenames, compressed_sizes
+  finally:
+    if pending_shards:
+      pending_shards.release()
+
+
+def _file_equals_shard(filepath, shard):
+  """Checks whether a file holds exactly the bytes of a shard."""
+  if (not os.path.isfile(filepath) or
+      os.path.getsize(filepath) != sum(len(chunk) for chunk in shard)):
+    return False
+  with open(filepath, 'rb') as f:
+    for chunk in shard:
+      if chunk.tobytes() != f.read(len(chunk)):
+        return False
+  return True
+
+
+def _compress_shard(shard, compression):
+  """Compresses a shard, given as a list of memoryviews, at the highest level.
+
+  The output depends only on the bytes of the shard (e.g., gzip headers carry
+  no timestamp), so unchanged shards produce unchanged sidecar files.
+  """
+  if compression == 'gzip':
+    out = io.BytesIO()
+    with gzip.GzipFile(fileobj=out, mode='wb', compresslevel=9, mtime=0) as f:
+      for chunk in shard:
+        f.write(chunk)
+    return out.getvalue()
+  elif compression == 'brotli':
+    import brotli  # pylint: disable=import-error
+    compressor = brotli.Compressor(quality=11)
+    chunks = [compressor.process(bytes(chunk)) for chunk in shard]
+    return b''.join(chunks + [compressor.finish()])
+  else:
+    import zstandard  # pylint: disable=import-error
+    compressor = zstandard.ZstdCompressor(level=19).compressobj()
+    chunks = [compressor.compress(chunk) for chunk in shard]
+    return b''.join(chunks + [compressor.flush()])
 
 
 def _get_weights_manifest_for_group(group):
@@ -318,12 +783,15 @@ def _get_weights_manifest_for_group(group):
     # String arrays have dtype 'object' and need extra metadata to parse.
     if dtype == 'object':
       var_manifest['dtype'] = 'string'
-    if is_quantized:
-      var_manifest['quantization'] = {
-          'min': entry['quantization']['min'],
-          'scale': entry['quantization']['scale'],
-          'dtype': entry['data'].dtype.name
-      }
+    if 'alias' in entry:
+      # Aliases are decoded from the bytes of the weight they refer to.
+      var_manifest['alias'] = entry['alias']
+    elif is_quantized:
+      var_manifest['quantization'] = {'dtype': entry['data'].dtype.name}
+      # float16 weights are stored without an affine range.
+      for key in ('min', 'scale', 'axis'):
+        if key in entry['quantization']:
+          var_manifest['quantization'][key] = entry['quantization'][key]
     weights_entries.append(var_manifest)
   return weights_entries
 
@@ -364,7 +832,10 @@ def _assert_valid_weight_entry(entry):
     entry['data'] = data
 
 
-  if not (data.dtype in _OUTPUT_DTYPES or data.dtype in _AUTO_DTYPE_CONVERSION):
+  # float16 is only written as the quantized form of a float weight.
+  is_float16_quantized = data.dtype == np.float16 and 'quantization' in entry
+  if not (data.dtype in _OUTPUT_DTYPES or data.dtype in _AUTO_DTYPE_CONVERSION
+          or is_float16_quantized):
     raise ValueError('Error dumping weight ' + name + ', dtype ' +
                      data.dtype.name + ' not supported.')
 
@@ -396,6 +867,28 @@ def _assert_weight_groups_valid(weight_groups):
             'array')
 
 
+def _assert_compression_valid(compression):
+  for name in compression:
+    if name not in _COMPRESSIONS:
+      raise ValueError(
+          'Unsupported compression %r. Supported compressions are: %s' %
+          (name, ', '.join(sorted(_COMPRESSIONS))))
+    package = _COMPRESSIONS[name][1]
+    if package:
+      try:
+        importlib.import_module(package)
+      except ImportError:
+        raise ImportError(
+            'The %s package is required for %s compression. Install it with '
+            '`pip install %s`.' % (package, name, package))
+
+
+def _assert_max_workers_valid(max_workers):
+  if not isinstance(max_workers, int) or max_workers < 1:
+    raise ValueError(
+        'max_workers must be a positive integer, but got %s' % max_workers)
+
+
 def _assert_shard_size_bytes_valid(shard_size_bytes):
   if shard_size_bytes < 0:
     raise ValueError(
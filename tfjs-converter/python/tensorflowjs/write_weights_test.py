@@ -14,11 +14,15 @@
 # limitations under the License.
 # ==============================================================================
 
+import gzip
+import hashlib
 import os
 import shutil
+import sys
 import unittest
 
 import numpy as np
+import six
 
 from tensorflowjs import write_weights
 
@@ -181,6 +185,25 @@ class TestWriteWeights(unittest.TestCase):
       size = np.frombuffer(weight_bytes[:4], 'uint32')[0]
       self.assertEqual(size, 0)  # Empty string.
 
+  def test_1_group_1_weight_string_mixed_lengths(self):
+    strings = [u'', u'a', u'здраво', u'', u'x' * 300, u'end']
+    groups = [
+        [{
+            'name': 'weight1',
+            'data': np.array(strings, 'object').reshape([2, 3])
+        }]
+    ]
+
+    write_weights.write_weights(groups, TMP_DIR)
+
+    expected_bytes = b''
+    for string in strings:
+      encoded = string.encode('utf-8')
+      expected_bytes += np.array(len(encoded), '<u4').tobytes() + encoded
+    weights_path = os.path.join(TMP_DIR, 'group1-shard1of1.bin')
+    with open(weights_path, 'rb') as f:
+      self.assertEqual(f.read(), expected_bytes)
+
   def test_1_group_1_weight_string_unicode(self):
     groups = [
         [{
@@ -504,6 +527,40 @@ class TestWriteWeights(unittest.TestCase):
     shard_3 = np.fromfile(shard_3_path, 'float32')
     np.testing.assert_array_equal(shard_3, np.array([4.1, 5.1], 'float32'))
 
+  def test_1_group_2_weights_non_contiguous_sharded(self):
+    weight1 = np.arange(12, dtype='float32').reshape([3, 4]).T
+    weight2 = np.asfortranarray(
+        np.arange(12, 18, dtype='int32').reshape([2, 3]))
+    groups = [
+        [{
+            'name': 'weight1',
+            'data': weight1
+        }, {
+            'name': 'weight2',
+            'data': weight2
+        }]
+    ]
+
+    # The bytes of each weight straddle the shard boundaries and must be
+    # written in row-major order regardless of the memory layout.
+    manifest = write_weights.write_weights(
+        groups, TMP_DIR, shard_size_bytes=5 * 4)
+
+    self.assertEqual(
+        manifest[0]['paths'],
+        ['group1-shard1of4.bin', 'group1-shard2of4.bin',
+         'group1-shard3of4.bin', 'group1-shard4of4.bin'])
+
+    weight_bytes = bytes()
+    for path in manifest[0]['paths']:
+      with open(os.path.join(TMP_DIR, path), 'rb') as f:
+        weight_bytes += f.read()
+    self.assertEqual(len(weight_bytes), 18 * 4)
+    np.testing.assert_array_equal(
+        np.frombuffer(weight_bytes[:48], 'float32').reshape([4, 3]), weight1)
+    np.testing.assert_array_equal(
+        np.frombuffer(weight_bytes[48:], 'int32').reshape([2, 3]), weight2)
+
   def test_2_groups_4_weights_sharded_packed(self):
     groups = [
         # Group 1
@@ -583,6 +640,221 @@ class TestWriteWeights(unittest.TestCase):
     np.testing.assert_array_equal(
         group2_shard_3, np.array([1.5, 1.6], 'float32'))
 
+  def test_multiple_workers_same_output(self):
+    groups = [
+        [{
+            'name': 'weight1',
+            'data': np.arange(100, dtype='float32')
+        }, {
+            'name': 'weight2',
+            'data': np.array([u'hello', u'world'], 'object')
+        }],
+        [{
+            'name': 'weight3',
+            'data': np.arange(50, dtype='int32')
+        }]
+    ]
+
+    serial_dir = os.path.join(TMP_DIR, 'serial')
+    parallel_dir = os.path.join(TMP_DIR, 'parallel')
+    os.makedirs(serial_dir)
+    os.makedirs(parallel_dir)
+    serial_manifest = write_weights.write_weights(
+        groups, serial_dir, shard_size_bytes=24)
+    parallel_manifest = write_weights.write_weights(
+        groups, parallel_dir, shard_size_bytes=24, max_workers=4)
+
+    self.assertEqual(serial_manifest, parallel_manifest)
+    for group in parallel_manifest:
+      for path in group['paths']:
+        with open(os.path.join(serial_dir, path), 'rb') as f:
+          serial_bytes = f.read()
+        with open(os.path.join(parallel_dir, path), 'rb') as f:
+          self.assertEqual(serial_bytes, f.read())
+
+  def test_bad_max_workers_throws(self):
+    groups = [
+        [{
+            'name': 'weight1',
+            'data': np.array([1, 2, 3], 'float32')
+        }]
+    ]
+
+    with self.assertRaises(ValueError):
+      write_weights.write_weights(groups, TMP_DIR, max_workers=0)
+
+  def test_gzip_compression_sidecars(self):
+    groups = [
+        [{
+            'name': 'weight1',
+            'data': np.zeros(100, dtype='float32')
+        }],
+        [{
+            'name': 'weight2',
+            'data': np.arange(10, dtype='int32')
+        }]
+    ]
+
+    manifest = write_weights.write_weights(
+        groups, TMP_DIR, shard_size_bytes=256, compression=['gzip'],
+        max_workers=2)
+
+    self.assertEqual(
+        ['group1-shard1of2.bin', 'group1-shard2of2.bin'], manifest[0]['paths'])
+    for group in manifest:
+      self.assertEqual(['gzip'], list(group['compressedSizes']))
+      self.assertEqual(len(group['paths']),
+                       len(group['compressedSizes']['gzip']))
+      for path, size in zip(group['paths'], group['compressedSizes']['gzip']):
+        gzip_path = os.path.join(TMP_DIR, path + '.gz')
+        self.assertEqual(size, os.path.getsize(gzip_path))
+        with open(os.path.join(TMP_DIR, path), 'rb') as f:
+          shard_bytes = f.read()
+        with gzip.open(gzip_path, 'rb') as f:
+          self.assertEqual(shard_bytes, f.read())
+    self.assertLess(manifest[0]['compressedSizes']['gzip'][0], 256)
+
+  def test_compression_output_is_deterministic(self):
+    groups = [
+        [{
+            'name': 'weight1',
+            'data': np.arange(100, dtype='float32')
+        }]
+    ]
+
+    write_weights.write_weights(groups, TMP_DIR, compression=['gzip'])
+    with open(os.path.join(TMP_DIR, 'group1-shard1of1.bin.gz'), 'rb') as f:
+      first_bytes = f.read()
+    write_weights.write_weights(groups, TMP_DIR, compression=['gzip'])
+    with open(os.path.join(TMP_DIR, 'group1-shard1of1.bin.gz'), 'rb') as f:
+      self.assertEqual(first_bytes, f.read())
+
+  def test_no_compression_has_no_compressed_sizes(self):
+    groups = [
+        [{
+            'name': 'weight1',
+            'data': np.array([1, 2, 3], 'float32')
+        }]
+    ]
+
+    manifest = write_weights.write_weights(groups, TMP_DIR)
+    self.assertNotIn('compressedSizes', manifest[0])
+    self.assertFalse(
+        os.path.isfile(os.path.join(TMP_DIR, 'group1-shard1of1.bin.gz')))
+
+  def test_bad_compression_throws(self):
+    groups = [
+        [{
+            'name': 'weight1',
+            'data': np.array([1, 2, 3], 'float32')
+        }]
+    ]
+
+    with self.assertRaises(ValueError):
+      write_weights.write_weights(groups, TMP_DIR, compression=['lzma'])
+
+  def test_hash_shard_names(self):
+    groups = [
+        [{
+            'name': 'weight1',
+            'data': np.arange(20, dtype='float32')
+        }],
+        [{
+            'name': 'weight2',
+            'data': np.arange(10, dtype='float32')
+        }]
+    ]
+
+    manifest = write_weights.write_weights(
+        groups, TMP_DIR, shard_size_bytes=40, hash_shard_names=True,
+        compression=['gzip'])
+
+    # The first shard of group 1 has the same bytes as the shard of group 2.
+    self.assertEqual(2, len(manifest[0]['paths']))
+    self.assertEqual(manifest[0]['paths'][0], manifest[1]['paths'][0])
+    self.assertEqual(manifest[0]['sha256'][0], manifest[1]['sha256'][0])
+    self.assertEqual(manifest[0]['compressedSizes']['gzip'][0],
+                     manifest[1]['compressedSizes']['gzip'][0])
+    for group in manifest:
+      for path, digest in zip(group['paths'], group['sha256']):
+        with open(os.path.join(TMP_DIR, path), 'rb') as f:
+          self.assertEqual(digest, hashlib.sha256(f.read()).hexdigest())
+        self.assertEqual(digest[:32] + '.bin', path)
+        self.assertTrue(os.path.isfile(os.path.join(TMP_DIR, path + '.gz')))
+    self.assertEqual(
+        sorted(['weights_manifest.json'] +
+               [p for p in manifest[0]['paths']] +
+               [p + '.gz' for p in manifest[0]['paths']]),
+        sorted(os.listdir(TMP_DIR)))
+
+  def test_incremental_rewrites_only_changed_shards(self):
+    groups = [
+        [{
+            'name': 'weight1',
+            'data': np.arange(20, dtype='float32')
+        }, {
+            'name': 'weight2',
+            'data': np.arange(20, dtype='float32')
+        }]
+    ]
+    manifest = write_weights.write_weights(
+        groups, TMP_DIR, shard_size_bytes=40, compression=['gzip'])
+    paths = [os.path.join(TMP_DIR, path) for path in manifest[0]['paths']]
+    self.assertEqual(4, len(paths))
+    for path in paths + [p + '.gz' for p in paths]:
+      os.utime(path, (0, 0))
+
+    groups[0][1]['data'] = groups[0][1]['data'].copy()
+    groups[0][1]['data'][-1] = -1
+    stdout = six.StringIO()
+    sys.stdout, original_stdout = stdout, sys.stdout
+    try:
+      new_manifest = write_weights.write_weights(
+          groups, TMP_DIR, shard_size_bytes=40, compression=['gzip'],
+          incremental=True)
+    finally:
+      sys.stdout = original_stdout
+
+    self.assertEqual(manifest[0]['paths'], new_manifest[0]['paths'])
+    self.assertEqual(manifest[0]['compressedSizes']['gzip'][:3],
+                     new_manifest[0]['compressedSizes']['gzip'][:3])
+    self.assertEqual([0, 0, 0],
+                     [os.path.getmtime(path) for path in paths[:3]])
+    self.assertNotEqual(0, os.path.getmtime(paths[3]))
+    self.assertNotEqual(0, os.path.getmtime(paths[3] + '.gz'))
+    with open(paths[3], 'rb') as f:
+      np.testing.assert_array_equal(
+          np.frombuffer(f.read(), 'float32'), list(range(10, 19)) + [-1])
+    self.assertIn('Wrote 2 of 8 weight file(s)', stdout.getvalue())
+    self.assertIn('group1-shard4of4.bin\n', stdout.getvalue())
+    self.assertIn('group1-shard4of4.bin.gz\n', stdout.getvalue())
+
+  def test_incremental_with_hashed_shard_names_reports_shared_shards_once(
+      self):
+    groups = [
+        [{
+            'name': 'weight1',
+            'data': np.arange(10, dtype='float32')
+        }],
+        [{
+            'name': 'weight2',
+            'data': np.arange(10, dtype='float32')
+        }]
+    ]
+    stdout = six.StringIO()
+    sys.stdout, original_stdout = stdout, sys.stdout
+    try:
+      manifest = write_weights.write_weights(
+          groups, TMP_DIR, hash_shard_names=True, incremental=True)
+    finally:
+      sys.stdout = original_stdout
+
+    # Both groups share one shard file, which is written and reported once.
+    self.assertEqual(manifest[0]['paths'], manifest[1]['paths'])
+    self.assertIn('Wrote 1 of 1 weight file(s)', stdout.getvalue())
+    self.assertEqual(
+        1, stdout.getvalue().count(manifest[0]['paths'][0] + '\n'))
+
   def test_no_write_manfest(self):
     groups = [
         [{
@@ -750,6 +1022,279 @@ class TestWriteWeights(unittest.TestCase):
       w4 = weight_bytes[11:].decode('utf-8')
       self.assertEqual(w4, u'hello')
 
+  def test_quantize_group_per_axis(self):
+    groups = [
+        [{
+            'name': 'weight1',
+            'data': np.array([[1, -1], [3, 1]], 'float32')
+        }, {
+            'name': 'weight2',
+            'data': np.array([4, 5], 'float32')
+        }]
+    ]
+
+    manifest = write_weights.write_weights(
+        groups, TMP_DIR, shard_size_bytes=1024, quantization_dtype=np.uint8,
+        quantization_axis=-1)
+
+    self.assertEqual(
+        manifest,
+        [{
+            'paths': ['group1-shard1of1.bin'],
+            'weights': [{
+                'name': 'weight1',
+                'shape': [2, 2],
+                'dtype': 'float32',
+                'quantization': {
+                    'min': [1.0, -1.0 - 1 / 255.0],
+                    'scale': [2 / 255.0, 2 / 255.0],
+                    'dtype': 'uint8',
+                    'axis': 1
+                }
+            }, {
+                'name': 'weight2',
+                'shape': [2],
+                'dtype': 'float32',
+                'quantization': {
+                    'min': 4.0, 'scale': 1/255.0, 'dtype': 'uint8'
+                }
+            }]
+        }])
+
+    weights_path = os.path.join(TMP_DIR, 'group1-shard1of1.bin')
+    with open(weights_path, 'rb') as f:
+      weight_bytes = f.read()
+      w1 = np.frombuffer(weight_bytes[:4], 'uint8')
+      np.testing.assert_array_equal(w1, np.array([0, 0, 255, 255], 'uint8'))
+
+      w2 = np.frombuffer(weight_bytes[4:], 'uint8')
+      np.testing.assert_array_equal(w2, np.array([0, 255], 'uint8'))
+
+  def test_quantize_group_float16(self):
+    groups = [
+        [{
+            'name': 'weight1',
+            'data': np.array([1, 2.5, 65504], 'float32')
+        }, {
+            'name': 'weight2',
+            'data': np.array([4, 5], 'int32')
+        }, {
+            'name': 'weight3',
+            'data': np.array([-1e5], 'float32')
+        }]
+    ]
+
+    manifest = write_weights.write_weights(
+        groups, TMP_DIR, shard_size_bytes=1024, quantization_dtype=np.float16)
+
+    self.assertEqual(
+        manifest,
+        [{
+            'paths': ['group1-shard1of1.bin'],
+            'weights': [{
+                'name': 'weight1',
+                'shape': [3],
+                'dtype': 'float32',
+                'quantization': {'dtype': 'float16'}
+            }, {
+                'name': 'weight2',
+                'shape': [2],
+                'dtype': 'int32'
+            }, {
+                'name': 'weight3',
+                'shape': [1],
+                'dtype': 'float32'
+            }]
+        }])
+
+    weights_path = os.path.join(TMP_DIR, 'group1-shard1of1.bin')
+    with open(weights_path, 'rb') as f:
+      weight_bytes = f.read()
+      w1 = np.frombuffer(weight_bytes[:6], 'float16')
+      np.testing.assert_array_equal(w1, np.array([1, 2.5, 65504], 'float16'))
+
+      w2 = np.frombuffer(weight_bytes[6:14], 'int32')
+      np.testing.assert_array_equal(w2, np.array([4, 5], 'int32'))
+
+      w3 = np.frombuffer(weight_bytes[14:], 'float32')
+      np.testing.assert_array_equal(w3, np.array([-1e5], 'float32'))
+
+  def test_deduplicate_weights(self):
+    groups = [
+        [{
+            'name': 'weight1',
+            'data': np.array([1, 2, 3], 'float32')
+        }, {
+            'name': 'weight2',
+            'data': np.array([1, 2, 3], 'float32')
+        }, {
+            'name': 'weight3',
+            'data': np.array([1, 2, 3], 'float32').view('int32')
+        }],
+        [{
+            'name': 'weight4',
+            'data': np.array([1, 2, 3], 'float32')
+        }, {
+            'name': 'weight5',
+            'data': np.array([3, 2, 1], 'float32')
+        }]
+    ]
+
+    manifest = write_weights.write_weights(
+        groups, TMP_DIR, shard_size_bytes=1024, deduplicate=True)
+
+    self.assertEqual(
+        manifest,
+        [{
+            'paths': ['group1-shard1of1.bin'],
+            'weights': [{
+                'name': 'weight1',
+                'shape': [3],
+                'dtype': 'float32'
+            }, {
+                'name': 'weight2',
+                'shape': [3],
+                'dtype': 'float32',
+                'alias': 'weight1'
+            }, {
+                'name': 'weight3',
+                'shape': [3],
+                'dtype': 'int32'
+            }]
+        }, {
+            'paths': ['group2-shard1of1.bin'],
+            'weights': [{
+                'name': 'weight4',
+                'shape': [3],
+                'dtype': 'float32',
+                'alias': 'weight1'
+            }, {
+                'name': 'weight5',
+                'shape': [3],
+                'dtype': 'float32'
+            }]
+        }])
+
+    weights_path = os.path.join(TMP_DIR, 'group1-shard1of1.bin')
+    with open(weights_path, 'rb') as f:
+      weight_bytes = f.read()
+      self.assertEqual(len(weight_bytes), 24)
+      np.testing.assert_array_equal(
+          np.frombuffer(weight_bytes[:12], 'float32'), [1, 2, 3])
+
+    weights_path = os.path.join(TMP_DIR, 'group2-shard1of1.bin')
+    with open(weights_path, 'rb') as f:
+      np.testing.assert_array_equal(
+          np.frombuffer(f.read(), 'float32'), [3, 2, 1])
+
+  def test_deduplicate_quantized_weights_compares_quantization(self):
+    groups = [
+        [{
+            'name': 'weight1',
+            'data': np.array([0, 1, 2], 'float32')
+        }, {
+            'name': 'weight2',
+            'data': np.array([0, 2, 4], 'float32')
+        }, {
+            'name': 'weight3',
+            'data': np.array([0, 1, 2], 'float32')
+        }]
+    ]
+
+    manifest = write_weights.write_weights(
+        groups, TMP_DIR, quantization_dtype=np.uint8, deduplicate=True)
+
+    weights = manifest[0]['weights']
+    # weight2 quantizes to the same bytes as weight1, but with another scale.
+    self.assertNotIn('alias', weights[1])
+    self.assertEqual(weights[2]['alias'], 'weight1')
+    self.assertNotIn('quantization', weights[2])
+
+
+  def test_pack_whole_tensors_does_not_split_small_weights(self):
+    groups = [
+        [{
+            'name': 'weight1',
+            'data': np.array([1, 2, 3], 'float32')
+        }, {
+            'name': 'weight2',
+            'data': np.array([4, 5, 6], 'float32')
+        }, {
+            'name': 'weight3',
+            'data': np.array([7], 'float32')
+        }]
+    ]
+
+    # Streamed, weight2 would straddle the first two 16 byte shards.
+    manifest = write_weights.write_weights(
+        groups, TMP_DIR, shard_size_bytes=4 * 4, packing='whole_tensors')
+
+    self.assertEqual(
+        manifest[0]['paths'], ['group1-shard1of2.bin', 'group1-shard2of2.bin'])
+    self.assertEqual(
+        [w['name'] for w in manifest[0]['weights']],
+        ['weight1', 'weight3', 'weight2'])
+    self.assertEqual(
+        manifest[0]['shardWeights'], [['weight1', 'weight3'], ['weight2']])
+
+    with open(os.path.join(TMP_DIR, 'group1-shard1of2.bin'), 'rb') as f:
+      np.testing.assert_array_equal(
+          np.frombuffer(f.read(), 'float32'), [1, 2, 3, 7])
+    with open(os.path.join(TMP_DIR, 'group1-shard2of2.bin'), 'rb') as f:
+      np.testing.assert_array_equal(
+          np.frombuffer(f.read(), 'float32'), [4, 5, 6])
+
+  def test_pack_whole_tensors_splits_large_weights(self):
+    groups = [
+        [{
+            'name': 'weight1',
+            'data': np.array([1], 'float32')
+        }, {
+            'name': 'weight2',
+            'data': np.arange(9, dtype='float32')
+        }, {
+            'name': 'weight3',
+            'data': np.array([10], 'float32')
+        }]
+    ]
+
+    manifest = write_weights.write_weights(
+        groups, TMP_DIR, shard_size_bytes=4 * 4, packing='whole_tensors')
+
+    # weight2 fills two shards of its own plus a tail shard, and weight3 goes
+    # to the first shard with room for it.
+    self.assertEqual(
+        manifest[0]['shardWeights'],
+        [['weight1', 'weight3'], ['weight2'], ['weight2'], ['weight2']])
+    sizes = [
+        os.path.getsize(os.path.join(TMP_DIR, path))
+        for path in manifest[0]['paths']]
+    self.assertEqual(sizes, [8, 16, 16, 4])
+
+  def test_pack_whole_tensors_keeps_empty_weights(self):
+    groups = [
+        [{
+            'name': 'empty',
+            'data': np.array([], 'float32')
+        }, {
+            'name': 'weight1',
+            'data': np.array([1, 2], 'float32')
+        }]
+    ]
+
+    manifest = write_weights.write_weights(
+        groups, TMP_DIR, shard_size_bytes=4 * 4, packing='whole_tensors')
+
+    self.assertEqual(
+        [w['name'] for w in manifest[0]['weights']], ['empty', 'weight1'])
+    self.assertEqual(manifest[0]['shardWeights'], [['empty', 'weight1']])
+
+  def test_bad_packing_raises(self):
+    with self.assertRaises(ValueError):
+      write_weights.write_weights(
+          [[{'name': 'weight1', 'data': np.array([1], 'float32')}]], TMP_DIR,
+          packing='best_fit')
+
 
 if __name__ == '__main__':
   unittest.main()